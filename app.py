@@ -19,6 +19,7 @@ from qfluentwidgets.common.config import qconfig
 
 from utils import setup_high_dpi
 from views.markdown_editor import MarkdownWidget
+from views.asset_scheme import register_asset_scheme
 from models.settings import AppSettings
 
 
@@ -171,10 +172,13 @@ class MainWindow(FluentWidget):
         self.markdown_editor.selection_label.setStyleSheet(label_style)
         self.markdown_editor.theme_label.setStyleSheet(label_style)
         self.markdown_editor.encoding_label.setStyleSheet(label_style)
+        self.markdown_editor.asset_label.setStyleSheet(label_style)
 
 
 if __name__ == "__main__":
     setup_high_dpi()
+    # 自定义协议需在 QApplication 创建前注册
+    register_asset_scheme()
     
     app = QApplication(sys.argv)
     configure_application_font(app)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Markdown 渲染微基准：对比每次新建解析器与复用常驻解析器的开销
+
+用法: python bench_render.py [重复次数]
+"""
+import sys
+import time
+
+import markdown
+
+from models.document import MarkdownDocument
+from controllers.editor_controller import EditorController, MARKDOWN_EXTENSIONS
+from models.markdown_blocks import split_blocks
+
+SAMPLE_SECTION = """## 小节 {n}
+
+这是第 {n} 段正文，包含 **粗体**、*斜体*、`行内代码` 和 [链接](https://example.com)。
+
+- 列表项 A
+- 列表项 B
+- [ ] 待办事项
+
+```python
+def section_{n}():
+    return {n}
+```
+
+| 列 1 | 列 2 |
+|------|------|
+| {n}  | 值   |
+
+"""
+
+
+def build_sample(sections=200):
+    return "# 基准文档\n\n" + "".join(SAMPLE_SECTION.format(n=i) for i in range(sections))
+
+
+def timeit(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    text = build_sample()
+    blocks = [block.text for block in split_blocks(text)]
+
+    document = MarkdownDocument()
+    document.content = text
+    controller = EditorController(document)
+
+    print(f"文档: {len(text)} 字符, {len(blocks)} 个顶层块, 重复 {repeat} 次")
+
+    # 单次转换的固定开销：极短文本，几乎全部时间花在构建解析器上
+    setup_new = timeit(lambda: markdown.markdown("x", extensions=MARKDOWN_EXTENSIONS), repeat * 20)
+    setup_reuse = timeit(lambda: controller.convert_markdown("x"), repeat * 20)
+    print(f"单次转换固定开销   新建解析器 {setup_new:8.3f} ms   复用解析器 {setup_reuse:8.3f} ms")
+
+    whole_new = timeit(lambda: markdown.markdown(text, extensions=MARKDOWN_EXTENSIONS), repeat)
+    whole_reuse = timeit(lambda: controller.convert_markdown(text), repeat)
+    print(f"整篇转换           新建解析器 {whole_new:8.3f} ms   复用解析器 {whole_reuse:8.3f} ms")
+
+    def per_block_new():
+        for block in blocks:
+            markdown.markdown(block, extensions=MARKDOWN_EXTENSIONS)
+
+    def per_block_reuse():
+        for block in blocks:
+            controller.convert_markdown(block)
+
+    block_new = timeit(per_block_new, repeat)
+    block_reuse = timeit(per_block_reuse, repeat)
+    print(f"逐块转换（冷缓存） 新建解析器 {block_new:8.3f} ms   复用解析器 {block_reuse:8.3f} ms")
+
+    controller.render_blocks()
+    document.content = text.replace("第 100 段", "第 100 段（已修改）")
+    edit = timeit(lambda: controller.render_blocks(), repeat)
+    print(f"单块修改后的增量渲染 {edit:8.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
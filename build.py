@@ -21,6 +21,27 @@ def clean_build():
         shutil.rmtree(BUILD_DIR)
 
 
+def ensure_assets():
+    """预览依赖的前端资源缺失时运行 fetch_assets.py 下载，仍缺失则中止打包。
+
+    打包产物中没有这些文件时预览会回退到 CDN，离线无法使用，导出的独立页面也会引用 CDN。
+    """
+    from models.html_template import missing_assets
+
+    if not missing_assets():
+        return True
+    print("前端资源缺失，运行 fetch_assets.py 下载...")
+    import sys
+    subprocess.run([sys.executable, os.path.join(PROJECT_ROOT, "fetch_assets.py")], cwd=PROJECT_ROOT)
+    missing = missing_assets()
+    if missing:
+        print("以下前端资源缺失，无法打包：")
+        for rel in missing:
+            print(f"  resources/vendor/{rel}")
+        return False
+    return True
+
+
 def build_exe():
     print("开始编译可执行文件...")
 
@@ -58,6 +79,10 @@ def build_exe():
 def main():
     print("=== Fluent Markdown 编译脚本 ===")
 
+    if not ensure_assets():
+        print("\n编译失败，请检查网络或手动运行 fetch_assets.py。")
+        raise SystemExit(1)
+
     clean_build()
 
     success = build_exe()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+逐块渲染一致性检查：每个用例分别按顶层块逐块渲染和整篇渲染，两者的 HTML 应当相同
+
+用法: python check_blocks.py
+"""
+import re
+import sys
+
+from models.document import MarkdownDocument
+from controllers.editor_controller import EditorController
+from models.markdown_blocks import split_blocks
+
+CASES = {
+    "标题后紧跟列表，空行后继续列表": "## Todo\n- a\n- b\n\n- c\n- d",
+    "标题后紧跟引用，空行后继续引用": "# T\n> q1\n\n> q2",
+    "引用中夹着列表行": "> q\n- x\n\n> q2",
+    "列表项的缩进续行": "- a\n  cont\n\n- c\n\n段落",
+    "跨块的引用式链接": "[x][ref]\n\n段落\n\n[ref]: http://example.com",
+    "带标题行的引用定义": "[x][ref]\n\n[ref]: http://example.com\n    \"标题\"",
+    "缩写定义": "HTML 很常见\n\n*[HTML]: Hyper Text Markup Language",
+    "围栏代码中的定义不生效": "[x][ref]\n\n```\n[ref]: http://example.com\n```",
+    "未闭合的 HTML 块后的定义": "<div>\nraw\n\n[x][ref]\n\n[ref]: http://example.com",
+    "HTML 块与引用式链接": "<div>raw</div>\n\n[x][ref]\n\n[ref]: http://example.com",
+}
+
+
+def normalize(html):
+    return re.sub(r"\s+", " ", html).strip()
+
+
+def main():
+    controller = EditorController(MarkdownDocument())
+    controller.link_local_images = False
+    failed = 0
+    for name, text in CASES.items():
+        blocks = split_blocks(text)
+        per_block = "\n".join(
+            controller._render_block(block.text, "" if block.raw_html else blocks.references)[0]
+            for block in blocks
+        )
+        whole = controller._render_block(text)[0]
+        if normalize(per_block) == normalize(whole):
+            print(f"✓ {name}")
+            continue
+        failed += 1
+        print(f"✗ {name}\n  逐块: {normalize(per_block)}\n  整篇: {normalize(whole)}")
+    print(f"{len(CASES) - failed}/{len(CASES)} 通过")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""执行可取代任务的后台线程"""
+
+import logging
+import threading
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+_log = logging.getLogger(__name__)
+
+
+class BackgroundWorker(QThread):
+    """在独立线程中执行任务（预览渲染、查找扫描、文件哈希等），GUI 线程只负责提交和应用结果。
+
+    队列里最多只保留一个待处理任务：新任务会顶替尚未开始的旧任务，
+    并使正在执行的任务过期（func 可通过 is_cancelled 提前结束），
+    过期任务的结果不会发回 GUI 线程。
+
+    Parameters
+    ----------
+    func : callable
+        func(job, is_cancelled) -> result，在工作线程中调用；
+        返回 None 表示任务被取消。
+    """
+
+    job_finished = pyqtSignal(int, object)
+
+    def __init__(self, func, parent=None):
+        super().__init__(parent)
+        self._func = func
+        self._cond = threading.Condition()
+        self._pending = None
+        self._generation = 0
+        self._stopped = False
+
+    def submit(self, job):
+        """提交任务并返回其代号，旧任务随之作废"""
+        with self._cond:
+            self._generation += 1
+            self._pending = (self._generation, job)
+            self._cond.notify()
+        if not self.isRunning():
+            self.start()
+        return self._generation
+
+    def cancel(self):
+        """作废待处理和正在执行的任务"""
+        with self._cond:
+            self._generation += 1
+            self._pending = None
+
+    def is_current(self, generation):
+        return generation == self._generation
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._pending = None
+            self._cond.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while self._pending is None and not self._stopped:
+                    self._cond.wait()
+                if self._stopped:
+                    return
+                generation, job = self._pending
+                self._pending = None
+
+            try:
+                result = self._func(job, lambda: generation != self._generation)
+            except Exception:
+                _log.exception("后台任务失败")
+                result = None
+
+            if result is not None and generation == self._generation:
+                self.job_finished.emit(generation, result)
@@ -0,0 +1,262 @@
+"""批量导出目录中的 Markdown 文件"""
+
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from PyQt5.QtCore import QObject, QUrl, pyqtSignal
+
+from controllers.editor_controller import EditorController
+from controllers.export_controller import ExportController
+from models.document import MarkdownDocument
+from models.export_manifest import (
+    ExportManifest, decode_source, find_sources, is_unchanged, options_key, output_path
+)
+
+_log = logging.getLogger(__name__)
+
+EXPORT_SUFFIXES = {"pdf": ".pdf", "docx": ".docx", "html": ".html"}
+
+# 正文中需要 KaTeX / Mermaid 在浏览器中渲染的内容
+_NEEDS_BROWSER_RE = re.compile(r'class="(?:math-block|math-inline|language-mermaid)"')
+
+# 每个工作进程一个常驻的 controller，解析器和块缓存在该进程处理的文件间复用
+_controller = None
+
+
+def _init_worker(theme, font_size, local_assets):
+    global _controller
+    controller = EditorController(MarkdownDocument())
+    controller.set_theme(theme)
+    controller.set_font_size(font_size)
+    controller.local_assets = local_assets
+    _controller = controller
+
+
+def _export_job(job):
+    """在工作进程中处理一个导出任务，返回 (输出文件, 源文件哈希, 状态, 附加数据)。
+
+    状态为 "exported" / "skipped" / "failed"（附加数据为错误信息），
+    或 "pdf"：附加数据为 (页面骨架, 完整页面, 正文, 源文件目录)，由 GUI 线程交给 PdfExportService 打印，
+    或 "html"：含公式或 Mermaid 图表、需要浏览器渲染的独立 HTML，附加数据再加上页面构建器，
+    由 PdfExportService 渲染后在 GUI 线程打包。
+    """
+    src, dst, fmt, known_digest = job
+    try:
+        with open(src, "rb") as f:
+            data = f.read()
+        digest, unchanged = is_unchanged(data, dst, known_digest)
+        if unchanged:
+            return dst, digest, "skipped", None
+        text = decode_source(data)
+        document = _controller.document
+        document.file_path = os.path.abspath(src)
+        document.content = text
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+        if fmt == "docx":
+            body_html = _controller.render_body_html(_controller.render_blocks())
+            success, message = ExportController.export_word(dst, text, body_html, os.path.dirname(src))
+        elif fmt == "html":
+            rendered = _controller.render_blocks()
+            body_html = _controller.render_body_html(rendered)
+            builder = _controller.page_builder(is_dark=False)
+            if _NEEDS_BROWSER_RE.search(body_html):
+                parts = (
+                    _controller.render_preview(is_dark=False, rendered=[]),
+                    _controller.render_preview(is_dark=False, rendered=rendered),
+                    body_html,
+                    os.path.dirname(document.file_path),
+                    builder,
+                )
+                return dst, digest, "html", parts
+            # 只有代码块时在工作进程中直接用 Pygments 高亮打包
+            success, message = ExportController.export_static_html(
+                dst, body_html, builder, os.path.dirname(document.file_path)
+            )
+        else:
+            rendered = _controller.render_blocks()
+            parts = (
+                _controller.render_preview(is_dark=False, rendered=[]),
+                _controller.render_preview(is_dark=False, rendered=rendered),
+                _controller.render_body_html(rendered),
+                os.path.dirname(document.file_path),
+            )
+            return dst, digest, "pdf", parts
+        if not success:
+            return dst, digest, "failed", message
+        return dst, digest, "exported", None
+    except Exception as e:
+        _log.exception("导出 %s 失败", src)
+        return dst, None, "failed", str(e) or e.__class__.__name__
+
+
+class BatchExporter(QObject):
+    """把目录中的 Markdown 文件批量导出为 PDF / DOCX / HTML，输出保持目录结构。
+
+    DOCX 和 HTML 在进程池中并行调用 ExportController；PDF 的 HTML 也在进程池中渲染，
+    每渲染完一个就交给 PdfExportService 排队打印，渲染和打印流水线进行。
+    含公式或图表的独立 HTML 同样交给 PdfExportService 渲染，取回正文后再打包。
+    源文件哈希和主题、字号都与上次导出一致且输出文件仍在时跳过（见 ExportManifest）。
+
+    progress(已完成数, 总数) 报告进度，file_failed(输出文件, 错误信息) 报告单个失败，
+    全部结束或取消后发出 finished({"exported", "skipped", "failed", "cancelled"})。
+
+    Parameters
+    ----------
+    pdf_service : PdfExportService
+        打印 PDF 用的视图池，其 export_finished 中不属于本批次的路径会被忽略。
+    """
+
+    progress = pyqtSignal(int, int)
+    file_failed = pyqtSignal(str, str)
+    finished = pyqtSignal(dict)
+
+    # 进程池的回调在其管理线程中执行，经由此信号排队回到 GUI 线程
+    _job_done = pyqtSignal(object)
+
+    def __init__(self, pdf_service, parent=None):
+        super().__init__(parent)
+        self._pdf_service = pdf_service
+        self._pdf_service.export_finished.connect(self._on_pdf_finished)
+        self._pdf_service.body_captured.connect(self._on_body_captured)
+        self._job_done.connect(self._on_job_done)
+        self._executor = None
+        self._manifest = None
+        self._options = None
+        # 已交给 PdfExportService 的输出文件 -> 源文件哈希
+        self._pdf_jobs = {}
+        # 其中取回正文后打包的 HTML：输出文件 -> (页面构建器, 源文件目录)
+        self._html_jobs = {}
+        self._futures = set()
+        self._cancelled = False
+        self._total = 0
+        self._stats = None
+
+    def is_running(self):
+        return self._stats is not None
+
+    def start(self, source_dir, output_dir, formats, theme, font_size, local_assets=False, jobs=None):
+        """开始导出 source_dir 下的所有 Markdown 文件，formats 为 EXPORT_SUFFIXES 的键"""
+        if self.is_running():
+            return False
+        self._manifest = ExportManifest(output_dir)
+        self._options = options_key(theme, False, font_size)
+        work = []
+        for src, rel_path in find_sources(source_dir):
+            for fmt in formats:
+                dst = output_path(output_dir, rel_path, EXPORT_SUFFIXES[fmt])
+                work.append((src, dst, fmt, self._manifest.known_digest(dst, self._options)))
+
+        self._stats = {"exported": 0, "skipped": 0, "failed": 0, "cancelled": 0}
+        self._total = len(work)
+        self._pdf_jobs = {}
+        self._html_jobs = {}
+        self._cancelled = False
+        self.progress.emit(0, self._total)
+        if not work:
+            self._finish()
+            return True
+        jobs = max(1, min(jobs or os.cpu_count() or 1, len(work)))
+        self._executor = ProcessPoolExecutor(
+            jobs, initializer=_init_worker, initargs=(theme, font_size, local_assets)
+        )
+        self._futures = {self._executor.submit(_export_job, job) for job in work}
+        for future in list(self._futures):
+            future.add_done_callback(self._job_done.emit)
+        return True
+
+    def cancel(self):
+        """取消尚未开始的任务；正在进行的导出完成后结束"""
+        if not self.is_running() or self._cancelled:
+            return
+        self._cancelled = True
+        for future in list(self._futures):
+            if future.cancel():
+                self._futures.discard(future)
+                self._stats["cancelled"] += 1
+        for dst in self._pdf_service.discard(list(self._pdf_jobs)):
+            self._pdf_jobs.pop(dst)
+            self._html_jobs.pop(dst, None)
+            self._stats["cancelled"] += 1
+        self._check_finished()
+
+    def _on_job_done(self, future):
+        if not self.is_running() or future not in self._futures or future.cancelled():
+            return
+        self._futures.discard(future)
+        try:
+            dst, digest, status, payload = future.result()
+        except Exception as e:
+            # 工作进程意外退出（BrokenProcessPool 等）
+            self._stats["failed"] += 1
+            self.file_failed.emit("", str(e) or e.__class__.__name__)
+            self._check_finished()
+            return
+        if status in ("pdf", "html") and self._cancelled:
+            self._stats["cancelled"] += 1
+            self._check_finished()
+            return
+        if status == "pdf":
+            shell_html, page_html, body_html, base_dir = payload
+            self._pdf_jobs[dst] = digest
+            self._pdf_service.export(
+                dst, shell_html, page_html, body_html, QUrl.fromLocalFile(base_dir + "/")
+            )
+            return
+        if status == "html":
+            shell_html, page_html, body_html, base_dir, builder = payload
+            self._pdf_jobs[dst] = digest
+            self._html_jobs[dst] = (builder, base_dir)
+            self._pdf_service.capture(
+                dst, shell_html, page_html, body_html, QUrl.fromLocalFile(base_dir + "/")
+            )
+            return
+        self._complete(dst, digest, status, payload)
+
+    def _on_pdf_finished(self, file_path, error):
+        if not self.is_running() or file_path not in self._pdf_jobs:
+            return
+        digest = self._pdf_jobs.pop(file_path)
+        self._complete(file_path, digest, "failed" if error else "exported", error)
+
+    def _on_body_captured(self, file_path, body_html, error):
+        if not self.is_running() or file_path not in self._html_jobs:
+            return
+        builder, base_dir = self._html_jobs.pop(file_path)
+        digest = self._pdf_jobs.pop(file_path)
+        if not error:
+            success, message = ExportController.export_static_html(file_path, body_html, builder, base_dir)
+            error = "" if success else message
+        self._complete(file_path, digest, "failed" if error else "exported", error)
+
+    def _complete(self, dst, digest, status, error):
+        self._stats[status] += 1
+        if status == "failed":
+            self._manifest.forget(dst)
+            self.file_failed.emit(dst, error or "")
+        else:
+            self._manifest.record(dst, digest, self._options)
+        self._check_finished()
+
+    def _check_finished(self):
+        stats = self._stats
+        done = stats["exported"] + stats["skipped"] + stats["failed"] + stats["cancelled"]
+        self.progress.emit(done, self._total)
+        if done >= self._total:
+            self._finish()
+
+    def _finish(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        try:
+            self._manifest.save()
+        except OSError:
+            pass
+        stats, self._stats = self._stats, None
+        self._futures = set()
+        self._pdf_jobs = {}
+        self._html_jobs = {}
+        self.finished.emit(stats)
@@ -0,0 +1,502 @@
+"""把预览渲染出的 HTML 写成 Word 文档"""
+
+import base64
+import io
+import os
+import re
+from html.parser import HTMLParser
+from urllib.parse import unquote, urlparse
+from urllib.request import url2pathname
+
+from docx.enum.style import WD_STYLE_TYPE
+from docx.opc.constants import RELATIONSHIP_TYPE
+from docx.oxml import OxmlElement
+from docx.oxml.ns import qn
+from docx.oxml.table import CT_Tbl
+from docx.shared import Pt
+from docx.text.paragraph import Paragraph
+from lxml.etree import SubElement
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_ALIGN_RE = re.compile(r"text-align:\s*(left|center|right)")
+# XML 1.0 不允许的控制字符
+_INVALID_XML_RE = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# 行内标签 -> 格式标记
+_INLINE_TAGS = {
+    "strong": "bold", "b": "bold",
+    "em": "italic", "i": "italic",
+    "del": "strike", "s": "strike",
+    "sup": "sup", "sub": "sub",
+    "code": "code",
+}
+
+# w:pPr 中排在 shd 之后的子元素，给样式加底纹时须插在它们前面以符合 schema 顺序
+_PPR_AFTER_SHD = (
+    "w:tabs", "w:suppressAutoHyphens", "w:kinsoku", "w:wordWrap", "w:overflowPunct",
+    "w:topLinePunct", "w:autoSpaceDE", "w:autoSpaceDN", "w:bidi", "w:adjustRightInd",
+    "w:snapToGrid", "w:spacing", "w:ind", "w:contextualSpacing", "w:mirrorIndents",
+    "w:suppressOverlap", "w:jc", "w:textDirection", "w:textAlignment", "w:textboxTightWrap",
+    "w:outlineLvl", "w:divId", "w:cnfStyle", "w:rPr", "w:sectPr", "w:pPrChange",
+)
+
+CODE_FONT = "Consolas"
+LINK_COLOR = "0366D6"
+
+_W_P, _W_PPR, _W_PSTYLE, _W_NUMPR, _W_ILVL, _W_NUMID, _W_JC = (
+    qn("w:p"), qn("w:pPr"), qn("w:pStyle"), qn("w:numPr"), qn("w:ilvl"), qn("w:numId"), qn("w:jc")
+)
+_W_R, _W_RPR, _W_RSTYLE, _W_T, _W_BR, _W_HYPERLINK = (
+    qn("w:r"), qn("w:rPr"), qn("w:rStyle"), qn("w:t"), qn("w:br"), qn("w:hyperlink")
+)
+_W_VAL, _R_ID, _XML_SPACE = qn("w:val"), qn("r:id"), "{http://www.w3.org/XML/1998/namespace}space"
+# rPr 子元素按 schema 顺序排列
+_RPR_ORDER = ("rStyle", "b", "i", "strike", "color", "u", "vertAlign")
+_RPR_ELEMENTS = {
+    "bold": ("b", None), "italic": ("i", None), "strike": ("strike", None),
+    "sup": ("vertAlign", "superscript"), "sub": ("vertAlign", "subscript"),
+}
+
+
+class DocxWriter(HTMLParser):
+    """流式解析预览用的 HTML（EditorController.render_body_html 的输出），一遍写出 Word 文档。
+
+    标题、段落、引用、有序/无序/任务列表、表格、代码块、行内格式、链接、图片和公式源码
+    都映射到对应的 Word 样式。样式只按名称查找一次，之后直接写样式 id；
+    段落和 run 直接用 lxml 追加到正文末尾，不经过 python-docx 逐个子元素按 schema 定位插入，
+    连续的同格式文本合并为一个 run。只有表格需要整体缓存到结束标签再写出。
+
+    Parameters
+    ----------
+    document : docx.Document
+        目标文档。
+    base_dir : str
+        解析图片相对路径的目录。
+    """
+
+    def __init__(self, document, base_dir=None):
+        super().__init__(convert_charrefs=True)
+        self._document = document
+        self._body = document._body
+        body = self._body._element
+        # 新段落插在 sectPr 之前
+        self._sect_pr = body.sectPr
+        self._body_element = body
+        self._base_dir = base_dir or os.getcwd()
+        self._style_ids = {}
+        self._abstract_nums = {}
+        section = document.sections[-1]
+        # 版心宽度：表格宽度和图片的最大宽度
+        self._block_width = section.page_width - section.left_margin - section.right_margin
+
+        # 正在收集的段落：{"style", "align", "num", "runs"}；runs 为 [(类型, 值, 格式)]，
+        # num 对列表项为编号 id（0 表示沿用样式自带的编号），其他段落为 None
+        self._block = None
+        self._inline = []
+        self._skip = 0
+        self._pre = False
+        self._quote = 0
+        # 列表栈：每层 {"ordered", "start", "num_id"}
+        self._lists = []
+        # 表格：{"rows": [[单元格段落列表]]}；_cell 为正在收集的单元格段落
+        self._table = None
+        self._cell = None
+
+    # ------------------------------------------------------------------
+    # 公开 API
+    # ------------------------------------------------------------------
+
+    def write(self, html):
+        self.feed(html)
+        self.close()
+        self._close_block()
+
+    # ------------------------------------------------------------------
+    # HTMLParser 回调
+    # ------------------------------------------------------------------
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip or tag in ("script", "style", "button"):
+            self._skip += 1
+            return
+        attrs = dict(attrs)
+        css_class = attrs.get("class") or ""
+
+        if tag in _INLINE_TAGS:
+            if tag != "code" or not self._pre:
+                self._inline.append((tag, _INLINE_TAGS[tag]))
+        elif tag == "a":
+            href = attrs.get("href") or ""
+            self._inline.append((tag, ("href", href)))
+        elif tag == "span":
+            self._inline.append((tag, "code" if "math-inline" in css_class else None))
+        elif tag == "br":
+            self._append_run("break", None)
+        elif tag == "img":
+            self._append_run("image", (attrs.get("src") or "", attrs.get("alt") or ""))
+        elif tag == "input":
+            if attrs.get("type") == "checkbox":
+                self._append_text("☑ " if "checked" in attrs else "☐ ")
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self._open_block(f"Heading {tag[1]}")
+        elif tag == "p":
+            block = self._block
+            # 松散列表中 <li><p>…：沿用列表项段落
+            if not (block is not None and block["num"] is not None and not block["runs"]):
+                self._open_block(self._flow_style())
+        elif tag == "pre":
+            self._open_block("Code Block")
+            self._pre = True
+        elif tag == "blockquote":
+            self._close_block()
+            self._quote += 1
+        elif tag in ("ul", "ol"):
+            self._close_block()
+            start = attrs.get("start") or "1"
+            self._lists.append({
+                "ordered": tag == "ol",
+                "start": int(start) if start.isdigit() else 1,
+                "num_id": None,
+            })
+        elif tag == "li":
+            self._open_list_item()
+        elif tag == "hr":
+            self._close_block()
+            self._add_rule()
+        elif tag == "table":
+            self._close_block()
+            self._table = {"rows": []}
+        elif tag == "tr" and self._table is not None:
+            self._table["rows"].append([])
+        elif tag in ("th", "td") and self._table is not None:
+            self._close_block()
+            self._cell = []
+            if tag == "th":
+                self._inline.append((tag, "bold"))
+            match = _ALIGN_RE.search(attrs.get("style") or "") or _ALIGN_RE.search(
+                "text-align: " + (attrs.get("align") or "")
+            )
+            self._open_block("Normal", match.group(1) if match else None)
+        elif tag == "div":
+            if "math-block" in css_class:
+                self._open_block("Normal", "center")
+                self._inline.append((tag, "code"))
+            else:
+                self._close_block()
+
+    def handle_endtag(self, tag):
+        if self._skip:
+            self._skip -= 1
+            return
+        if tag in _INLINE_TAGS or tag in ("a", "span"):
+            self._pop_inline(tag)
+        elif tag in ("h1", "h2", "h3", "h4", "h5", "h6", "p", "li"):
+            self._close_block()
+        elif tag == "pre":
+            self._close_block()
+            self._pre = False
+        elif tag == "blockquote":
+            self._close_block()
+            self._quote = max(0, self._quote - 1)
+        elif tag in ("ul", "ol"):
+            self._close_block()
+            if self._lists:
+                self._lists.pop()
+        elif tag in ("th", "td") and self._cell is not None:
+            self._close_block()
+            if tag == "th":
+                self._pop_inline(tag)
+            rows = self._table["rows"]
+            if not rows:
+                rows.append([])
+            rows[-1].append(self._cell)
+            self._cell = None
+        elif tag == "table" and self._table is not None:
+            self._write_table(self._table["rows"])
+            self._table = None
+        elif tag == "div":
+            if self._inline and self._inline[-1][0] == "div":
+                self._inline.pop()
+            self._close_block()
+
+    def handle_data(self, data):
+        if self._skip:
+            return
+        data = _INVALID_XML_RE.sub("", data)
+        if self._pre:
+            lines = data.split("\n")
+            for index, line in enumerate(lines):
+                if index:
+                    self._append_run("break", None)
+                if line:
+                    self._append_text(line)
+            return
+        text = _WHITESPACE_RE.sub(" ", data)
+        if self._block is None or not self._block["runs"] or self._block["runs"][-1][0] == "break":
+            text = text.lstrip()
+        if text:
+            self._append_text(text)
+
+    # ------------------------------------------------------------------
+    # 段落与文本
+    # ------------------------------------------------------------------
+
+    def _flow_style(self):
+        if self._lists:
+            return "List Continue"
+        return "Quote" if self._quote else "Normal"
+
+    def _open_block(self, style, align=None, num=None):
+        self._close_block()
+        self._block = {"style": style, "align": align, "num": num, "runs": []}
+
+    def _open_list_item(self):
+        if not self._lists:
+            self._open_block(self._flow_style())
+            return
+        level = min(len(self._lists), 3)
+        current = self._lists[-1]
+        base = "List Number" if current["ordered"] else "List Bullet"
+        style = base if level == 1 else f"{base} {level}"
+        num_id = None
+        if current["ordered"]:
+            # 每个有序列表单独编号，从 start 开始
+            if current["num_id"] is None:
+                current["num_id"] = self._new_numbering(style, current["start"])
+            num_id = current["num_id"]
+        self._open_block(style, num=num_id or 0)
+
+    def _close_block(self):
+        block = self._block
+        if block is None:
+            return
+        self._block = None
+        runs = block["runs"]
+        while runs and runs[-1][0] == "break":
+            runs.pop()
+        if runs and runs[-1][0] == "text":
+            text = runs[-1][1].rstrip()
+            if text:
+                runs[-1] = ("text", text, runs[-1][2])
+            else:
+                runs.pop()
+        if not runs:
+            return
+        if self._cell is not None:
+            self._cell.append(block)
+        else:
+            self._write_paragraph(self._new_paragraph(), block)
+
+    def _formats(self):
+        formats = []
+        for _, fmt in self._inline:
+            if fmt is not None and fmt not in formats:
+                formats.append(fmt)
+        return tuple(formats)
+
+    def _append_text(self, text):
+        if self._block is None:
+            self._open_block(self._flow_style())
+        runs = self._block["runs"]
+        formats = self._formats()
+        if runs and runs[-1][0] == "text" and runs[-1][2] == formats:
+            runs[-1] = ("text", runs[-1][1] + text, formats)
+        else:
+            runs.append(("text", text, formats))
+
+    def _append_run(self, kind, value):
+        if self._block is None:
+            self._open_block(self._flow_style())
+        self._block["runs"].append((kind, value, self._formats()))
+
+    def _pop_inline(self, tag):
+        for index in range(len(self._inline) - 1, -1, -1):
+            if self._inline[index][0] == tag:
+                del self._inline[index]
+                return
+
+    # ------------------------------------------------------------------
+    # 写入 docx
+    # ------------------------------------------------------------------
+
+    def _new_paragraph(self):
+        return self._append_block(OxmlElement("w:p"))
+
+    def _append_block(self, element):
+        if self._sect_pr is not None:
+            self._sect_pr.addprevious(element)
+        else:
+            self._body_element.append(element)
+        return element
+
+    def _write_paragraph(self, p, block):
+        style_id = self._style_id(block["style"])
+        if style_id is not None or block["num"] or block["align"]:
+            p_pr = SubElement(p, _W_PPR)
+            if style_id is not None:
+                SubElement(p_pr, _W_PSTYLE).set(_W_VAL, style_id)
+            if block["num"]:
+                num_pr = SubElement(p_pr, _W_NUMPR)
+                SubElement(num_pr, _W_ILVL).set(_W_VAL, "0")
+                SubElement(num_pr, _W_NUMID).set(_W_VAL, str(block["num"]))
+            if block["align"]:
+                SubElement(p_pr, _W_JC).set(_W_VAL, block["align"])
+        for kind, value, formats in block["runs"]:
+            if kind == "break":
+                SubElement(SubElement(p, _W_R), _W_BR)
+            elif kind == "image":
+                self._write_image(p, *value)
+            else:
+                self._write_text(p, value, formats)
+
+    def _write_text(self, p, text, formats):
+        props = {}
+        href = None
+        for fmt in formats:
+            if fmt == "code":
+                props["rStyle"] = self._style_id("Inline Code")
+            elif fmt in _RPR_ELEMENTS:
+                name, value = _RPR_ELEMENTS[fmt]
+                props[name] = value
+            else:
+                href = fmt[1]
+        parent = p
+        if href:
+            props["color"] = LINK_COLOR
+            props["u"] = "single"
+            if not href.startswith("#"):
+                rel_id = self._document.part.relate_to(href, RELATIONSHIP_TYPE.HYPERLINK, is_external=True)
+                parent = SubElement(p, _W_HYPERLINK)
+                parent.set(_R_ID, rel_id)
+        r = SubElement(parent, _W_R)
+        if props:
+            r_pr = SubElement(r, _W_RPR)
+            for name in _RPR_ORDER:
+                if name in props:
+                    element = SubElement(r_pr, qn("w:" + name))
+                    if props[name] is not None:
+                        element.set(_W_VAL, props[name])
+        t = SubElement(r, _W_T)
+        t.text = text
+        if text[0].isspace() or text[-1].isspace():
+            t.set(_XML_SPACE, "preserve")
+
+    def _write_image(self, p, src, alt):
+        source = self._image_source(src)
+        if source is not None:
+            try:
+                shape = Paragraph(p, self._body).add_run().add_picture(source)
+                if shape.width > self._block_width:
+                    shape.height = int(shape.height * self._block_width / shape.width)
+                    shape.width = self._block_width
+                return
+            except Exception:
+                # 不支持的格式（如 SVG）等，退回写替代文本
+                pass
+        if alt:
+            self._write_text(p, f"[{alt}]", ("italic",))
+
+    def _image_source(self, src):
+        """图片地址转为本地文件路径或内存数据；远程图片不下载，返回 None"""
+        if src.startswith("data:"):
+            header, _, payload = src.partition(",")
+            if header.endswith(";base64"):
+                try:
+                    return io.BytesIO(base64.b64decode(payload))
+                except ValueError:
+                    return None
+            return None
+        parsed = urlparse(src)
+        if parsed.scheme == "file":
+            path = url2pathname(parsed.path)
+        elif parsed.scheme and len(parsed.scheme) > 1:
+            return None
+        else:
+            path = unquote(src)
+            if not os.path.isabs(path):
+                path = os.path.join(self._base_dir, path)
+        return path if os.path.isfile(path) else None
+
+    def _write_table(self, rows):
+        rows = [row for row in rows if row]
+        if not rows:
+            return
+        columns = max(len(row) for row in rows)
+        tbl = self._append_block(CT_Tbl.new_tbl(len(rows), columns, self._block_width))
+        style_id = self._style_id("Table Grid", None)
+        if style_id is not None:
+            tbl.tblPr.style = style_id
+        # 直接遍历 XML 中的 tr/tc，table.cell() 每次都会重建整个单元格网格
+        for row, tr in zip(rows, tbl.tr_lst):
+            for blocks, tc in zip(row, tr.tc_lst):
+                p = tc.p_lst[0]
+                for index, block in enumerate(blocks):
+                    if index:
+                        p = SubElement(tc, _W_P)
+                    self._write_paragraph(p, block)
+
+    def _add_rule(self):
+        """分隔线：只有下边框的空段落"""
+        p_pr = SubElement(self._new_paragraph(), _W_PPR)
+        bottom = SubElement(SubElement(p_pr, qn("w:pBdr")), qn("w:bottom"))
+        for key, value in (("w:val", "single"), ("w:sz", "6"), ("w:space", "1"), ("w:color", "CCCCCC")):
+            bottom.set(qn(key), value)
+
+    # ------------------------------------------------------------------
+    # 样式与编号
+    # ------------------------------------------------------------------
+
+    def _style_id(self, name, fallback="Normal"):
+        """按名称查找样式 id 并缓存；代码样式不存在时创建，其他样式不存在时用 fallback"""
+        if name in self._style_ids:
+            return self._style_ids[name]
+        styles = self._document.styles
+        try:
+            style_id = styles[name].style_id
+        except KeyError:
+            if name == "Code Block":
+                style_id = self._add_code_block_style().style_id
+            elif name == "Inline Code":
+                style = styles.add_style(name, WD_STYLE_TYPE.CHARACTER)
+                style.font.name = CODE_FONT
+                style_id = style.style_id
+            else:
+                style_id = self._style_id(fallback, None) if fallback and fallback != name else None
+        self._style_ids[name] = style_id
+        return style_id
+
+    def _add_code_block_style(self):
+        styles = self._document.styles
+        style = styles.add_style("Code Block", WD_STYLE_TYPE.PARAGRAPH)
+        style.base_style = styles["Normal"]
+        style.font.name = CODE_FONT
+        style.font.size = Pt(9.5)
+        fmt = style.paragraph_format
+        fmt.space_before = Pt(6)
+        fmt.space_after = Pt(6)
+        fmt.line_spacing = 1.0
+        shading = OxmlElement("w:shd")
+        shading.set(qn("w:val"), "clear")
+        shading.set(qn("w:color"), "auto")
+        shading.set(qn("w:fill"), "F6F8FA")
+        style.element.get_or_add_pPr().insert_element_before(shading, *_PPR_AFTER_SHD)
+        return style
+
+    def _new_numbering(self, style_name, start):
+        """为一个有序列表新建从 start 开始的编号实例，返回 numId；样式没有编号时返回 None"""
+        abstract_id = self._abstract_nums.get(style_name)
+        numbering = self._document.part.numbering_part.element
+        if abstract_id is None:
+            try:
+                p_pr = self._document.styles[style_name].element.pPr
+                num_id = p_pr.numPr.numId.val
+            except (KeyError, AttributeError):
+                return None
+            nums = numbering.xpath(f'./w:num[@w:numId="{num_id}"]')
+            if not nums:
+                return None
+            abstract_id = nums[0].abstractNumId.val
+            self._abstract_nums[style_name] = abstract_id
+        num = numbering.add_num(abstract_id)
+        num.add_lvlOverride(ilvl=0).add_startOverride(start)
+        return num.numId
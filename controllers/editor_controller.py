@@ -1,6 +1,66 @@
+import difflib
+import html as html_lib
+import json
 import markdown
 import os
 import re
+import threading
+from collections import namedtuple
+
+from models.markdown_blocks import block_key, split_blocks
+
+
+_TASK_INDEX_RE = re.compile(r'data-task-index="(\d+)"')
+_TASK_SOURCE_RE = re.compile(r'^(\s*(?:[-*+]|\d+[.)])\s+)\[([ xX])\]')
+_FENCE_RE = re.compile(r'^\s*(`{3,}|~{3,})')
+_HEADING_SOURCE_RE = re.compile(r'^ {0,3}(#{1,4})\s+(.*?)(?:\s+#+)?\s*$')
+_INLINE_MARKUP_RE = re.compile(r'!?\[([^\]]*)\]\([^)]*\)|\*\*|__|`')
+
+# 块 id 中引用定义的后缀："-r" + 16 位哈希
+_REFERENCES_SUFFIX_LEN = 18
+
+
+def _references_suffix(references):
+    return "-r" + block_key(references) if references else ""
+
+
+def _offset_tasks(html, offset):
+    """块内的任务序号加上 offset，成为全文序号"""
+    if not offset:
+        return html
+    return _TASK_INDEX_RE.sub(lambda m: f'data-task-index="{int(m.group(1)) + offset}"', html)
+
+
+# task_offset 为块内第一个任务的全文序号；task_marks 为每个任务的 [ ]/[x] 在块内的 (行, 列)，
+# 源码与渲染结果对不上时对应项为 None。
+# html 为 None 表示块尚未渲染（虚拟化预览按需渲染），此时 task_marks 按源码统计；
+# references 为渲染时附加的引用定义
+RenderedBlock = namedtuple(
+    "RenderedBlock", ["block_id", "block", "html", "task_offset", "task_marks", "references"], defaults=("",)
+)
+
+MARKDOWN_EXTENSIONS = ['fenced_code', 'extra', 'tables']
+
+
+class _DocumentLines:
+    """QTextDocument 的只读行序列：按需取出各行，不生成全文"""
+
+    def __init__(self, text_document):
+        self._text_document = text_document
+
+    def __len__(self):
+        return self._text_document.blockCount()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        block = self._text_document.findBlockByNumber(index)
+        if not block.isValid():
+            raise IndexError(index)
+        # 与 toPlainText() 一致，不换行空格转为普通空格
+        return block.text().replace("\u00a0", " ")
 
 
 class EditorController:
@@ -10,6 +70,22 @@ class EditorController:
         self.font_size = 16
         self._last_md5 = None
         self._cached_html_template = None
+        # 块级渲染缓存：块哈希 -> (html, 任务数)，只保留当前文档用到的块
+        self._block_cache = {}
+        self._block_cache_base = None
+        # 预览页是否从 fmd-asset:// 加载本地前端资源，由界面在安装协议处理器后设置
+        self.local_assets = False
+        # 本地图片改写为 file:// 绝对地址；命令行批量渲染时关闭，保留原相对路径
+        self.link_local_images = True
+        # 每个线程一个常驻的 markdown.Markdown 实例，扩展只加载一次，转换前 reset
+        self._thread_local = threading.local()
+        # 渲染可能同时发生在后台渲染线程和 GUI 线程（导出等），块缓存需互斥
+        self._render_lock = threading.Lock()
+        # bind_editor 绑定的 QTextDocument 及其上次的行数
+        self._text_document = None
+        self._line_count = 0
+        self._line_change_listeners = []
+        self._edit_listeners = []
 
     def set_content(self, content):
         self.document.content = content
@@ -18,6 +94,99 @@ class EditorController:
     def get_content(self):
         return self.document.content
 
+    def bind_editor(self, text_document, to_plain_text):
+        """让文档内容跟随编辑器：编辑时只记录变化的行区间，需要全文时再调用 to_plain_text"""
+        self.document.bind_content_source(to_plain_text, _DocumentLines(text_document))
+        self._text_document = text_document
+        self._line_count = text_document.blockCount()
+        text_document.contentsChange.connect(self._on_contents_change)
+
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        # 字符位置换算为行号；行数变化取 blockCount 之差，不依赖 Qt 报告的字符数
+        text_document = self._text_document
+        count = text_document.blockCount()
+        first_line = max(text_document.findBlock(position).blockNumber(), 0)
+        last_line = text_document.findBlock(position + chars_added).blockNumber()
+        if last_line < first_line:
+            last_line = count - 1
+        line_delta = count - self._line_count
+        self._line_count = count
+        self.document.apply_change(first_line, last_line, line_delta)
+        for listener in self._line_change_listeners:
+            listener(first_line, last_line, line_delta)
+        if self._edit_listeners:
+            from PyQt5.QtGui import QTextCursor
+            cursor = QTextCursor(text_document)
+            cursor.setPosition(position)
+            cursor.setPosition(min(position + chars_added, text_document.characterCount() - 1), QTextCursor.KeepAnchor)
+            inserted = cursor.selectedText().replace("\u2029", "\n")
+            for listener in self._edit_listeners:
+                listener(position, chars_removed, inserted)
+
+    def add_line_change_listener(self, listener):
+        """listener(first_line, last_line, line_delta)，每次编辑后调用，参数含义同 document.apply_change"""
+        self._line_change_listeners.append(listener)
+
+    def add_edit_listener(self, listener):
+        """listener(position, chars_removed, inserted)，位置和字符数以 UTF-16 计，inserted 为插入的文本"""
+        self._edit_listeners.append(listener)
+
+    def apply_text(self, new_text):
+        """把编辑器内容改为 new_text：只替换有差异的行，整体作为一次可撤销的编辑。
+
+        与 setPlainText 不同，未变的行保持原样，撤销历史、高亮缓存和光标都得以保留。
+        返回是否有改动。
+        """
+        from PyQt5.QtGui import QTextCursor
+        old_lines = self.document.content.split("\n")
+        new_lines = new_text.split("\n")
+        # 先去掉首尾相同的行，差异比较只在中间进行
+        head = 0
+        limit = min(len(old_lines), len(new_lines))
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while tail < limit - head and old_lines[-1 - tail] == new_lines[-1 - tail]:
+            tail += 1
+        old_mid = old_lines[head:len(old_lines) - tail]
+        new_mid = new_lines[head:len(new_lines) - tail]
+        if not old_mid and not new_mid:
+            return False
+
+        # 每行连同其后的换行符为一个单位；末行后补一个虚拟换行，替换到末尾时再去掉
+        text_document = self._text_document
+        end_position = text_document.characterCount()
+        edits = []
+        matcher = difflib.SequenceMatcher(None, old_mid, new_mid)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                continue
+            start_line, end_line = head + i1, head + i2
+            start = text_document.findBlockByNumber(start_line).position() \
+                if start_line < len(old_lines) else end_position
+            end = text_document.findBlockByNumber(end_line).position() \
+                if end_line < len(old_lines) else end_position
+            text = "".join(line + "\n" for line in new_mid[j1:j2])
+            if start == end_position:
+                start = end = end_position - 1
+                text = "\n" + text[:-1]
+            elif end == end_position:
+                if text:
+                    end, text = end - 1, text[:-1]
+                else:
+                    # 删到末尾：连同前一行的换行一起删掉
+                    start, end = max(start - 1, 0), end - 1
+            edits.append((start, end, text))
+
+        cursor = QTextCursor(text_document)
+        cursor.beginEditBlock()
+        for start, end, text in reversed(edits):
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        return True
+
     def set_theme(self, theme):
         self.preview_theme = theme
         self._last_md5 = None
@@ -60,20 +229,298 @@ class EditorController:
         html = re.sub(r'<img\s+src="([^"]+)"', replace_path, html)
         return html
 
-    def render_body_html(self):
+    def convert_markdown(self, text):
+        """用当前线程的常驻解析器把 markdown 文本转换为 HTML"""
+        md = getattr(self._thread_local, "markdown", None)
+        if md is None:
+            md = markdown.Markdown(extensions=MARKDOWN_EXTENSIONS)
+            self._thread_local.markdown = md
+        return md.reset().convert(text)
+
+    def render_blocks(self, content=None, is_cancelled=None, blocks=None, eager_height=None):
+        """逐块渲染 markdown 内容，返回 RenderedBlock 列表。
+
+        每块单独做公式保护、任务列表和图片路径转换，内容未变的块直接命中缓存，
+        任务序号在拼接时按块顺序重新编排为全文序号。
+        block_id 由内容哈希（含任务序号偏移）构成，id 相同即 HTML 相同，
+        预览页据此只替换变化的块。
+
+        blocks 为已切分好的块（在 GUI 线程由 document.blocks() 增量维护）；
+        都不传时取当前文档的块。is_cancelled 返回 True 时中止并返回 None，
+        已渲染的块仍会留在缓存中。
+
+        eager_height 不为 None 时只渲染开头约这么高（估算，px）的块，其余未命中缓存的块
+        html 为 None，由虚拟化预览滚动到附近时经 render_block_html 按需渲染。
+        """
+        if blocks is None:
+            blocks = self.document.blocks() if content is None else split_blocks(content)
+        with self._render_lock:
+            return self._render_blocks_locked(blocks, is_cancelled, eager_height)
+
+    def _render_blocks_locked(self, blocks, is_cancelled, eager_height):
+        base_dir = os.path.dirname(self.document.file_path) if self.document.file_path else os.getcwd()
+        if base_dir != self._block_cache_base:
+            # 图片路径依赖文档目录，目录变化时缓存作废
+            self._block_cache = {}
+            self._block_cache_base = base_dir
+
+        cache = self._block_cache
+        used = {}
+        seen_ids = {}
+        rendered = []
+        task_offset = 0
+        used_height = 0
+        # 引用定义附加到每一块渲染，定义变化时所有块的缓存键和 id 随之变化；
+        # 含块级 HTML 的块不附加，否则未闭合的标签会把定义当作正文吞进去
+        all_references = getattr(blocks, "references", "")
+        all_suffix = _references_suffix(all_references)
+        for block in blocks:
+            references, suffix = ("", "") if block.raw_html else (all_references, all_suffix)
+            cache_key = block.key + suffix
+            entry = used.get(cache_key) or cache.get(cache_key)
+            if entry is None and eager_height is not None and used_height >= eager_height:
+                html, task_marks = None, self._task_marks(block.text)
+            else:
+                if entry is None:
+                    if is_cancelled is not None and is_cancelled():
+                        cache.update(used)
+                        return None
+                    entry = self._render_block(block.text, references)
+                used[cache_key] = entry
+                html, task_marks = entry
+                if task_marks:
+                    html = _offset_tasks(html, task_offset)
+            task_count = len(task_marks)
+            block_id = cache_key
+            if task_count:
+                block_id = f"{block_id}-t{task_offset}"
+            # 内容完全相同的块按出现次数区分
+            repeat = seen_ids.get(block_id, 0)
+            seen_ids[block_id] = repeat + 1
+            if repeat:
+                block_id = f"{block_id}-{repeat}"
+            item = RenderedBlock(block_id, block, html, task_offset, task_marks, references)
+            rendered.append(item)
+            task_offset += task_count
+            if eager_height is not None:
+                used_height += self._estimate_block_height(item)
+        self._block_cache = used
+        return rendered
+
+    def render_block_html(self, item):
+        """包装好的块 HTML；render_blocks 中未渲染的块此时渲染并放入缓存"""
+        if item.html is not None:
+            return self._wrap_block(item)
+        cache_key = item.block.key + _references_suffix(item.references)
+        with self._render_lock:
+            entry = self._block_cache.get(cache_key)
+            if entry is None:
+                entry = self._render_block(item.block.text, item.references)
+                self._block_cache[cache_key] = entry
+        html, task_marks = entry
+        if len(task_marks) == len(item.task_marks):
+            html = _offset_tasks(html, item.task_offset)
+        else:
+            # 任务数与按源码统计的不一致，序号无法与全文对齐，复选框只读
+            html = html.replace('class="task-checkbox"', 'class="task-checkbox" disabled')
+        return self._wrap_block(item._replace(html=html))
+
+    def render_body_html(self, rendered=None):
         """将 markdown 内容渲染为 HTML body 片段（含公式保护、任务列表、图片路径转换）"""
-        content = self.document.content
-        content, math_placeholders = self._protect_math(content)
-        html = markdown.markdown(content, extensions=['fenced_code', 'extra', 'tables'])
+        if rendered is None:
+            rendered = self.render_blocks()
+        return "\n".join(self._wrap_block(item) for item in rendered)
+
+    def iter_block_html(self, content=None):
+        """逐块产出渲染好的 HTML，不经过块缓存、不拼接全文，供流式导出使用。
+
+        任务复选框序号按块内计数，不用于回写源码。
+        """
+        if content is None:
+            content = self.document.content
+        blocks = split_blocks(content)
+        for block in blocks:
+            yield self._render_block(block.text, "" if block.raw_html else blocks.references)[0]
+
+    def build_block_patch(self, rendered, known_ids, virtual=False):
+        """对比预览页已有的块，返回 (块 id 顺序, {新块 id: html}, 各块起始源码行)。
+
+        virtual 为 True 时新块只发送占位，由页面滚动到附近时再按 id 取回内容。
+        """
+        order = []
+        blocks = {}
+        lines = []
+        for item in rendered:
+            order.append(item.block_id)
+            lines.append(item.block.start_line)
+            if item.block_id not in known_ids:
+                blocks[item.block_id] = self._placeholder_block(item) if virtual else self._wrap_block(item)
+        return order, blocks, lines
+
+    def _wrap_block(self, item):
+        # data-source-line 供预览按源码行同步滚动；块移动后由增量更新改写
+        return (
+            f'<div class="md-block" data-block="{item.block_id}" '
+            f'data-source-line="{item.block.start_line}" '
+            f'data-estimate="{self._estimate_block_height(item)}">{item.html}</div>'
+        )
+
+    def _placeholder_block(self, item, height=None):
+        """虚拟化预览中按估算高度占位的空块；带上块内的标题，未插入的块也能列入大纲"""
+        if height is None:
+            height = self._estimate_block_height(item)
+        headings = self._source_headings(item.block.text)
+        headings_attr = (
+            f' data-headings="{html_lib.escape(json.dumps(headings, ensure_ascii=False))}"' if headings else ""
+        )
+        return (
+            f'<div class="md-block md-placeholder" data-block="{item.block_id}" '
+            f'data-source-line="{item.block.start_line}"{headings_attr} style="height: {height}px"></div>'
+        )
+
+    @staticmethod
+    def _source_headings(text):
+        """块源码中的 ATX 标题 [[级别, 文本]]，跳过围栏代码；与编辑器大纲跳转的规则一致"""
+        if "#" not in text:
+            return []
+        headings = []
+        fence = None
+        for line in text.split("\n"):
+            match = _FENCE_RE.match(line)
+            if match:
+                marker = match.group(1)
+                if fence is None:
+                    fence = marker
+                elif marker.startswith(fence):
+                    fence = None
+                continue
+            if fence is None:
+                match = _HEADING_SOURCE_RE.match(line)
+                if match:
+                    title = _INLINE_MARKUP_RE.sub(lambda m: m.group(1) or "", match.group(2))
+                    headings.append([len(match.group(1)), title])
+        return headings
+
+    def _estimate_block_height(self, item):
+        """粗略估算块在预览中的高度（px），供虚拟化预览的占位使用；未渲染的块按源码估算"""
+        line_height = self.font_size * 1.6
+        text = item.block.text
+        lines = text.count("\n") + 1 - text.count("\n\n")
+        height = max(1, lines) * line_height + 20
+        if item.html is not None:
+            height += item.html.count("<img") * 240
+            height += item.html.count("language-mermaid") * 320
+        else:
+            height += text.count("![") * 240
+            height += text.count("```mermaid") * 320
+        return int(height)
+
+    def _render_block(self, text, references=""):
+        """渲染单个顶层块，返回 (html, 各任务在块内的源码位置)；references 为附加的引用定义"""
+        content, math_placeholders = self._protect_math(f"{text}\n\n{references}" if references else text)
+        html = self.convert_markdown(content)
         html = self._restore_math(html, math_placeholders)
         html = self._render_task_list(html)
-        html = self._convert_image_paths(html)
-        return html
+        if self.link_local_images:
+            html = self._convert_image_paths(html)
+        return html, self._task_marks(text, html.count('class="task-checkbox"'))
 
-    def render_preview(self, is_dark=False):
+    @staticmethod
+    def _task_marks(text, task_count=None):
+        """找出块内每个任务复选框 [ ]/[x] 中间字符的 (行, 列)，跳过围栏代码。
+
+        task_count 为渲染结果中的复选框数，不传时只按源码统计。
+        """
+        marks = []
+        fence = None
+        for line_no, line in enumerate(text.split("\n")):
+            match = _FENCE_RE.match(line)
+            if match:
+                marker = match.group(1)
+                if fence is None:
+                    fence = marker
+                elif marker.startswith(fence):
+                    fence = None
+                continue
+            if fence is None:
+                match = _TASK_SOURCE_RE.match(line)
+                if match:
+                    marks.append((line_no, match.start(2)))
+        if task_count is not None and len(marks) != task_count:
+            return (None,) * task_count
+        return tuple(marks)
+
+    def locate_task(self, rendered, task_index):
+        """按全文任务序号找到 (RenderedBlock, 文档行号, 列)，无法定位时返回 None"""
+        for item in rendered:
+            local = task_index - item.task_offset
+            if 0 <= local < len(item.task_marks):
+                mark = item.task_marks[local]
+                if mark is None:
+                    return None
+                return item, item.block.start_line + mark[0], mark[1]
+        return None
+
+    def toggle_task_block(self, item, task_index, checked):
+        """源码中切换了一个任务后，直接由旧块推出新块的缓存和 id，免去重新渲染。
+
+        返回新 block_id；旧块已不在缓存中时返回 None。
+        """
+        local = task_index - item.task_offset
+        line_no, col = item.task_marks[local]
+        lines = item.block.text.split("\n")
+        line = lines[line_no]
+        lines[line_no] = line[:col] + ("x" if checked else " ") + line[col + 1:]
+        text = "\n".join(lines)
+        key = block_key(text)
+
+        def flip(index, html):
+            pattern = re.compile(f'(data-task-index="{index}")( checked)?')
+            return pattern.sub(lambda m: m.group(1) + (" checked" if checked else ""), html, count=1)
+
+        # block_id 在块哈希之后依次是引用定义后缀、任务偏移和重复序号
+        tail = item.block_id[len(item.block.key):]
+        suffix = tail[:_REFERENCES_SUFFIX_LEN] if tail.startswith("-r") else ""
+        with self._render_lock:
+            entry = self._block_cache.get(item.block.key + suffix)
+            if entry is None:
+                return None
+            self._block_cache[key + suffix] = (flip(local, entry[0]), entry[1])
+        return key + tail
+
+    def render_preview(self, is_dark=False, rendered=None, virtual=False, local_assets=None, bridge=False,
+                       base_href=None):
+        """渲染完整预览页；virtual 为 True 时只直接输出首屏附近的块，其余输出为占位，按需取回。
+
+        local_assets 默认跟随 self.local_assets；导出到应用外的页面应传 False 使用 CDN。
+        bridge 为 True 时页面连接编辑器的 QWebChannel，只有应用内预览需要。
+        base_href 为页面中相对路径的基准地址，页面不是从文档目录载入时需要。
+        """
         ts = self._get_theme_styles(is_dark)
-        html = self.render_body_html()
-        return self._build_html(html, ts, is_dark)
+        if rendered is None:
+            rendered = self.render_blocks()
+        if local_assets is None:
+            local_assets = self.local_assets
+        from models.html_template import PreviewHtmlBuilder
+        builder = PreviewHtmlBuilder(
+            ts, self.font_size, is_dark, local_assets=local_assets, bridge=bridge, base_href=base_href
+        )
+        if virtual:
+            return builder.build_virtual(self._virtual_body_html(rendered, builder.VIRTUAL_EAGER_HEIGHT))
+        return builder.build(self.render_body_html(rendered))
+
+    def _virtual_body_html(self, rendered, eager_height):
+        """开头约 eager_height 像素（估算）内已渲染的块直接输出，其余块输出为占位"""
+        parts = []
+        used_height = 0
+        for item in rendered:
+            height = self._estimate_block_height(item)
+            if item.html is not None and used_height < eager_height:
+                parts.append(self._wrap_block(item))
+            else:
+                parts.append(self._placeholder_block(item, height))
+            used_height += height
+        return "\n".join(parts)
 
     def _render_task_list(self, html):
         """将 markdown 生成的 [ ] / [x] 列表项转为可交互的 checkbox"""
@@ -148,7 +595,15 @@ class EditorController:
         
         return ts
 
-    def _build_html(self, html, ts, is_dark=False):
+    def page_builder(self, is_dark=False, local_assets=False):
+        """当前主题和字号的页面构建器，供导出独立 HTML 时取样式使用"""
+        from models.html_template import PreviewHtmlBuilder
+        ts = self._get_theme_styles(is_dark)
+        return PreviewHtmlBuilder(ts, self.font_size, is_dark, local_assets=local_assets)
+
+    def _build_html(self, html, ts, is_dark=False, local_assets=None, bridge=False):
         from models.html_template import PreviewHtmlBuilder
-        builder = PreviewHtmlBuilder(ts, self.font_size, is_dark)
+        if local_assets is None:
+            local_assets = self.local_assets
+        builder = PreviewHtmlBuilder(ts, self.font_size, is_dark, local_assets=local_assets, bridge=bridge)
         return builder.build(html)
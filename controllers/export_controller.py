@@ -1,4 +1,3 @@
-import os
 import markdown
 
 
@@ -13,142 +12,99 @@ class ExportController:
         pass
 
     @staticmethod
-    def export_pdf(file_path, markdown_text):
-        try:
-            import re
-            from fpdf import FPDF
-            
-            if not file_path:
-                return False, "文件路径为空"
-            
-            if not markdown_text:
-                return False, "内容为空"
-
-            pdf = FPDF()
-            pdf.add_page()
-
-            font_path = 'C:/Windows/Fonts/simhei.ttf'
-            code_font_path = 'C:/Windows/Fonts/consola.ttf'
-
-            font_regular = 'Arial'
-            font_bold = 'Arial'
-
-            if os.path.exists(font_path):
-                pdf.add_font('SimHei', '', font_path)
-                pdf.add_font('SimHei', 'B', font_path)
-                font_regular = 'SimHei'
-                font_bold = 'SimHei'
+    def export_pdf(file_path, markdown_text, blocks_html=None, base_dir=None, font_size=11):
+        """不经过浏览器直接排版导出 PDF（见 PdfWriter）。
 
-            lines = markdown_text.split('\n')
-            in_code_block = False
-            
-            for line in lines:
-                if line is None:
-                    continue
-                    
-                line = str(line)
-                
-                if line.strip().startswith('```'):
-                    in_code_block = not in_code_block
-                    continue
-                
-                if in_code_block:
-                    pdf.set_font(font_regular, '', 10)
-                    pdf.cell(0, 5, line)
-                    pdf.ln()
-                elif line.startswith('# ') and len(line) > 2:
-                    pdf.set_font(font_bold, 'B', 20)
-                    pdf.cell(0, 12, line[2:])
-                    pdf.ln()
-                elif line.startswith('## ') and len(line) > 3:
-                    pdf.set_font(font_bold, 'B', 16)
-                    pdf.cell(0, 10, line[3:])
-                    pdf.ln()
-                elif line.startswith('### ') and len(line) > 4:
-                    pdf.set_font(font_bold, 'B', 14)
-                    pdf.cell(0, 8, line[4:])
-                    pdf.ln()
-                elif line.startswith('- ') and len(line) > 2:
-                    pdf.set_font(font_regular, '', 12)
-                    pdf.cell(0, 6, f"  - {line[2:]}")
-                    pdf.ln()
-                elif line.startswith('* ') and len(line) > 2:
-                    pdf.set_font(font_regular, '', 12)
-                    pdf.cell(0, 6, f"  - {line[2:]}")
-                    pdf.ln()
-                elif re.match(r'^\d+\.\s', line):
-                    match = re.match(r'^(\d+)\.\s(.*)', line)
-                    if match:
-                        pdf.set_font(font_regular, '', 12)
-                        pdf.cell(0, 6, f"  {match.group(1)}. {match.group(2)}")
-                        pdf.ln()
-                    else:
-                        pdf.set_font(font_regular, '', 12)
-                        pdf.cell(0, 6, line)
-                        pdf.ln()
-                elif line.startswith('>'):
-                    pdf.set_font(font_regular, '', 11)
-                    pdf.cell(0, 5, line[1:])
-                    pdf.ln()
-                elif line.strip() == '':
-                    pdf.ln(3)
-                else:
-                    pdf.set_font(font_regular, '', 12)
-                    pdf.cell(0, 6, line)
-                    pdf.ln()
-
-            pdf.output(file_path)
+        Parameters
+        ----------
+        file_path : str
+            目标文件路径。
+        markdown_text : str
+            Markdown 源码，未提供 blocks_html 时逐块渲染它。
+        blocks_html : iterable of str
+            逐块的 HTML，如 EditorController.iter_block_html()，可以是生成器。
+        base_dir : str
+            解析图片相对路径的目录。
+        font_size : float
+            正文字号（pt）。
+        """
+        if not file_path:
+            return False, "文件路径为空"
+        if not markdown_text:
+            return False, "内容为空"
+        try:
+            from controllers.pdf_writer import PdfWriter
+            if blocks_html is None:
+                from controllers.editor_controller import EditorController
+                from models.document import MarkdownDocument
+                controller = EditorController(MarkdownDocument())
+                controller.link_local_images = False
+                blocks_html = controller.iter_block_html(markdown_text)
+            writer = PdfWriter(base_dir, font_size)
+            writer.write(blocks_html)
+            writer.save(file_path)
             return True, f"PDF 已成功导出到:\n{file_path}"
         except ImportError:
             return False, "fpdf2 库未安装，请运行: pip install fpdf2"
         except Exception as e:
-            import traceback
-            error_details = f"{type(e).__name__}: {str(e)}\n{traceback.format_exc()}"
-            print(f"PDF导出错误详情: {error_details}")
             return False, f"导出 PDF 时出错:\n{type(e).__name__}: {str(e)}"
 
     @staticmethod
-    def export_word(file_path, markdown_text):
+    def export_word(file_path, markdown_text, body_html=None, base_dir=None):
+        """导出 Word 文档。
+
+        Parameters
+        ----------
+        file_path : str
+            目标文件路径。
+        markdown_text : str
+            Markdown 源码，未提供 body_html 时用它转换。
+        body_html : str
+            EditorController.render_body_html 的输出，与预览一致（任务列表、公式、图片路径）。
+        base_dir : str
+            解析图片相对路径的目录。
+        """
         if not ExportController.HAS_EXPORT_LIBS:
             return False, "python-docx 库未安装，请运行: pip install python-docx"
         
         try:
             from docx import Document
+            from controllers.docx_writer import DocxWriter
+            if body_html is None:
+                from controllers.editor_controller import MARKDOWN_EXTENSIONS
+                body_html = markdown.markdown(markdown_text, extensions=MARKDOWN_EXTENSIONS)
             doc = Document()
-            for line in markdown_text.split('\n'):
-                if line.startswith('# '):
-                    doc.add_heading(line[2:], level=1)
-                elif line.startswith('## '):
-                    doc.add_heading(line[3:], level=2)
-                elif line.startswith('### '):
-                    doc.add_heading(line[4:], level=3)
-                else:
-                    if line.strip():
-                        doc.add_paragraph(line)
+            DocxWriter(doc, base_dir).write(body_html)
             doc.save(file_path)
             return True, f"Word 文档已成功导出到:\n{file_path}"
         except Exception as e:
             return False, f"导出 Word 文档时出错:\n{str(e)}"
 
     @staticmethod
-    def export_html(file_path, rendered_html):
-        """导出带主题样式的完整 HTML 文件。
+    def export_static_html(file_path, body_html, builder, base_dir=None, images="auto"):
+        """导出不含脚本的独立 HTML：代码已高亮、只内联用到的样式，本地图片内嵌或复制到资源目录。
 
         Parameters
         ----------
         file_path : str
             目标文件路径。
-        rendered_html : str
-            由 PreviewHtmlBuilder 生成的完整 HTML 字符串。
+        body_html : str
+            正文 HTML，预览页中装饰完成的正文或 EditorController.render_body_html 的输出。
+        builder : PreviewHtmlBuilder
+            决定主题、字号和配色的页面构建器。
+        base_dir : str
+            解析图片相对路径的目录。
+        images : str
+            "embed" / "copy" / "auto"，见 bundle_html。
         """
         try:
-            # 去掉预览容器的高度限制，让内容自然展开
-            html = rendered_html
-            html = html.replace('height: 100%;', 'height: auto;')
-            html = html.replace('overflow: hidden;', 'overflow: visible;')
-            html = html.replace('overflow-y: auto;', 'overflow-y: visible;')
+            from controllers.html_bundler import bundle_html
+            html, warnings = bundle_html(file_path, body_html, builder, base_dir, images)
             with open(file_path, 'w', encoding='utf-8') as f:
                 f.write(html)
-            return True, f"HTML 文件已成功导出到:\n{file_path}"
+            message = f"HTML 文件已成功导出到:\n{file_path}"
+            if warnings:
+                message += "\n\n" + "\n".join(warnings)
+            return True, message
         except Exception as e:
             return False, f"导出 HTML 文件时出错:\n{str(e)}"
@@ -0,0 +1,88 @@
+"""大文件分块载入编辑器"""
+
+import hashlib
+import time
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QTextCursor
+
+from models.document import read_chunks
+
+
+class ChunkedFileLoader(QObject):
+    """从事件循环中把 read_chunks 产出的文本逐块追加到 QTextDocument。
+
+    每一轮最多占用 STEP_BUDGET 毫秒，之后让出事件循环，界面在载入期间保持响应。
+    载入期间关闭撤销记录，避免整篇内容进入撤销栈；同时计算正文哈希（见 text_digest）。
+
+    Parameters
+    ----------
+    text_document : QTextDocument
+        目标文档，调用方应先清空。
+    file_path : str
+        要载入的 UTF-8 文件。
+    """
+
+    STEP_BUDGET = 30
+
+    progress = pyqtSignal(int)
+    finished = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, text_document, file_path, parent=None):
+        super().__init__(parent)
+        self._text_document = text_document
+        self.file_path = file_path
+        self._chunks = None
+        self._cursor = None
+        self._digest = hashlib.blake2b(digest_size=16)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._step)
+
+    def start(self):
+        self._chunks = read_chunks(self.file_path)
+        self._cursor = QTextCursor(self._text_document)
+        self._text_document.setUndoRedoEnabled(False)
+        self._timer.start(0)
+
+    def cancel(self):
+        """中止载入，已追加的内容保留在文档中"""
+        self._timer.stop()
+        self._close()
+
+    def is_running(self):
+        return self._chunks is not None
+
+    def digest(self):
+        return self._digest.hexdigest()
+
+    def _step(self):
+        deadline = time.monotonic() + self.STEP_BUDGET / 1000
+        try:
+            while True:
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    self._close()
+                    self.finished.emit(self.file_path)
+                    return
+                text, fraction = chunk
+                self._digest.update(text.encode("utf-8", "surrogatepass"))
+                self._cursor.movePosition(QTextCursor.End)
+                self._cursor.insertText(text)
+                if time.monotonic() >= deadline:
+                    break
+        except (OSError, ValueError) as e:
+            # UnicodeDecodeError 是 ValueError 的子类
+            self._close()
+            self.failed.emit(self.file_path, str(e))
+            return
+        self.progress.emit(int(fraction * 100))
+        self._timer.start(0)
+
+    def _close(self):
+        if self._chunks is not None:
+            self._chunks.close()
+            self._chunks = None
+        self._cursor = None
+        self._text_document.setUndoRedoEnabled(True)
@@ -0,0 +1,112 @@
+"""监视当前文档在磁盘上的文件"""
+
+from PyQt5.QtCore import QFileSystemWatcher, QObject, QTimer, pyqtSignal
+
+from controllers.background_worker import BackgroundWorker
+from models.document import disk_state, file_text_digest
+
+
+def _digest_job(file_path, is_cancelled):
+    """在后台线程中计算文件当前的 DiskState；无法读取或解码时 digest 为空串"""
+    state = disk_state(file_path)
+    if state is None:
+        return None
+    try:
+        digest = file_text_digest(file_path)
+    except (OSError, ValueError):
+        digest = ""
+    return file_path, state._replace(digest=digest)
+
+
+class FileWatcher(QObject):
+    """基于 QFileSystemWatcher 检测外部修改。
+
+    收到变化通知后稍等片刻再检查（外部程序常分多次写入或先删后建），先比较大小和 mtime，
+    不同时才在后台线程流式计算正文哈希；哈希也不同才发出 file_changed(路径, DiskState)。
+    内容未变（如 touch、切换到内容相同的分支）时只更新文档记录的状态。
+    本程序自己保存期间用 hold()/release() 暂停检查。
+
+    Parameters
+    ----------
+    document : MarkdownDocument
+        读取和更新 disk_state。
+    """
+
+    CHECK_DELAY = 300
+
+    file_changed = pyqtSignal(str, object)
+
+    def __init__(self, document, parent=None):
+        super().__init__(parent)
+        self._document = document
+        self._path = None
+        self._held = False
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.fileChanged.connect(self._schedule_check)
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self._check)
+        self._worker = BackgroundWorker(_digest_job, self)
+        self._worker.job_finished.connect(self._on_digest_finished)
+        self._generation = None
+
+    def stop(self):
+        self._worker.stop()
+
+    def watch(self, file_path):
+        """开始监视 file_path，file_path 为 None 时停止监视"""
+        if self._path == file_path:
+            return
+        if self._watcher.files():
+            self._watcher.removePaths(self._watcher.files())
+        self._cancel()
+        self._path = file_path
+        if file_path:
+            self._watcher.addPath(file_path)
+
+    def hold(self):
+        """本程序即将写入文件，暂停检查"""
+        self._held = True
+        self._cancel()
+
+    def release(self):
+        """写入完成且 disk_state 已更新，恢复检查"""
+        self._held = False
+        self._schedule_check()
+
+    def _schedule_check(self, *args):
+        if self._path:
+            self._timer.start(self.CHECK_DELAY)
+
+    def _cancel(self):
+        self._timer.stop()
+        if self._generation is not None:
+            self._worker.cancel()
+            self._generation = None
+
+    def _check(self):
+        if self._held or not self._path:
+            return
+        # 文件被替换（先删后建、rename）后监视会失效，重新加入
+        if self._path not in self._watcher.files():
+            self._watcher.addPath(self._path)
+        known = self._document.disk_state
+        current = disk_state(self._path)
+        if current is None or known is None:
+            return
+        if (current.size, current.mtime_ns) == (known.size, known.mtime_ns):
+            return
+        self._generation = self._worker.submit(self._path)
+
+    def _on_digest_finished(self, generation, result):
+        if generation != self._generation:
+            return
+        self._generation = None
+        file_path, state = result
+        if self._held or file_path != self._path:
+            return
+        known = self._document.disk_state
+        if known is not None and state.digest and state.digest == known.digest:
+            self._document.disk_state = state
+            return
+        self.file_changed.emit(file_path, state)
@@ -0,0 +1,303 @@
+"""查找引擎：按查询条件缓存匹配位置，随编辑增量更新"""
+
+import bisect
+import re
+
+from PyQt5.QtCore import QObject, QTimer, pyqtSignal
+
+from controllers.background_worker import BackgroundWorker
+from models.document import merge_line_changes
+
+# 正则里出现这些写法时可能跨行匹配，改为整篇匹配
+_MULTILINE_HINT_RE = re.compile(r'\\[nsWDZ]|\[\^|\(\?[a-zA-Z]*s')
+
+REFRESH_DELAY = 200
+_CANCEL_CHECK_LINES = 2000
+
+
+def _utf16_len(text):
+    return len(text) if text.isascii() else len(text.encode("utf-16-le", "surrogatepass")) // 2
+
+
+def _match_line(pattern, line_no, text):
+    return [(line_no, m.start(), m.end()) for m in pattern.finditer(text) if m.end() > m.start()]
+
+
+def _scan_matches(job, is_cancelled):
+    """在后台线程中扫描全文，返回按位置排序的 (行号, 起始列, 结束列) 列表"""
+    text, pattern, multiline = job
+    matches = []
+    if multiline:
+        line_starts = [0]
+        line_starts.extend(m.end() for m in re.finditer("\n", text))
+        for count, m in enumerate(pattern.finditer(text)):
+            if count % _CANCEL_CHECK_LINES == 0 and is_cancelled():
+                return None
+            if m.end() == m.start():
+                continue
+            line_no = bisect.bisect_right(line_starts, m.start()) - 1
+            base = line_starts[line_no]
+            matches.append((line_no, m.start() - base, m.end() - base))
+        return matches
+
+    for line_no, line in enumerate(text.split("\n")):
+        if line_no % _CANCEL_CHECK_LINES == 0 and is_cancelled():
+            return None
+        matches.extend(_match_line(pattern, line_no, line))
+    return matches
+
+
+class FindEngine(QObject):
+    """查找/替换栏背后的匹配索引。
+
+    匹配以 (行号, 起始列, 结束列) 记录，列为 Python 字符下标，整篇模式下结束列可越过行尾。
+    普通查询逐行匹配，编辑后只重扫改动的行；可能跨行的正则按整篇匹配，编辑后整体重扫。
+    首次建立索引在后台线程进行，索引变化（含编辑后的增量更新）时发出 matches_changed。
+
+    Parameters
+    ----------
+    text_document : QTextDocument
+        编辑器文档，用于读取改动行的文本和换算光标位置。
+    text_source : callable
+        返回当前全文，只在需要整篇扫描时调用。
+    """
+
+    matches_changed = pyqtSignal()
+
+    def __init__(self, text_document, text_source, parent=None):
+        super().__init__(parent)
+        self._text_document = text_document
+        self._text_source = text_source
+        self._query = None
+        self._pattern = None
+        self._multiline = False
+        self.error = None
+        # None 表示索引尚未建立（后台扫描中）
+        self._matches = None
+        self._dirty_lines = None
+        self._scan_generation = None
+        self._worker = BackgroundWorker(_scan_matches, self)
+        self._worker.job_finished.connect(self._on_scan_finished)
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setSingleShot(True)
+        self._refresh_timer.timeout.connect(self._refresh)
+
+    def stop(self):
+        self._worker.stop()
+
+    def set_query(self, keyword, case_sensitive=False, whole_word=False, regex=False):
+        """设置查询条件；条件不变时保留现有索引"""
+        query = (keyword, case_sensitive, whole_word, regex)
+        if query == self._query:
+            return
+        self._query = query
+        self._pattern = None
+        self.error = None
+        self._matches = None
+        self._dirty_lines = None
+        self._cancel_scan()
+
+        if keyword:
+            pattern = keyword if regex else re.escape(keyword)
+            if whole_word:
+                pattern = r'\b(?:' + pattern + r')\b'
+            try:
+                self._pattern = re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+            except re.error as e:
+                self.error = str(e)
+            else:
+                self._multiline = regex and bool(_MULTILINE_HINT_RE.search(keyword))
+                self._start_scan()
+        self.matches_changed.emit()
+
+    def on_lines_changed(self, first_line, last_line, line_delta):
+        """编辑回调，参数同 MarkdownDocument.apply_change"""
+        if self._pattern is None:
+            return
+        if self._multiline:
+            self._cancel_scan()
+            self._matches = None
+        else:
+            self._dirty_lines = merge_line_changes(self._dirty_lines, first_line, last_line, line_delta)
+        self._refresh_timer.start(REFRESH_DELAY)
+
+    def count(self):
+        """匹配总数；索引仍在后台建立时返回 None"""
+        if self._pattern is None:
+            return 0
+        if self._matches is None:
+            return None
+        self._apply_dirty_lines()
+        return len(self._matches)
+
+    def matches(self):
+        """完整的匹配列表，索引未就绪时在当前线程同步扫描"""
+        if self._pattern is None:
+            return []
+        if self._matches is None:
+            self._cancel_scan()
+            self._matches = _scan_matches(
+                (self._text_source(), self._pattern, self._multiline), lambda: False
+            )
+            self._dirty_lines = None
+        self._apply_dirty_lines()
+        return self._matches
+
+    def next_match(self, position):
+        """position 处或之后的第一个匹配，到末尾后回到开头"""
+        matches = self.matches()
+        if not matches:
+            return None
+        i = bisect.bisect_left(matches, self.location(position))
+        return matches[i] if i < len(matches) else matches[0]
+
+    def prev_match(self, position):
+        """position 之前的最后一个匹配，到开头后回到末尾"""
+        matches = self.matches()
+        if not matches:
+            return None
+        i = bisect.bisect_left(matches, self.location(position)) - 1
+        return matches[i]
+
+    def replacements(self, replacement):
+        """全部替换的编辑列表 [(start, end, 替换文本), ...]，按文档位置升序。
+
+        正则模式下替换串支持分组引用，由各匹配的 Match.expand 展开。
+        """
+        matches = self.matches()
+        if not matches:
+            return []
+        # 不含反斜杠的替换串没有分组引用，无需逐个展开
+        regex = self._query[3] and "\\" in replacement
+        if regex and self._multiline:
+            text = self._text_source()
+            expanded = [m.expand(replacement) for m in self._pattern.finditer(text) if m.end() > m.start()]
+        else:
+            expanded = None
+
+        # 匹配按行升序，顺序遍历文本块换算位置；逐行匹配时同一行的替换合并为一次编辑
+        edits = []
+        block = self._text_document.findBlockByNumber(matches[0][0])
+        line_no = matches[0][0]
+        text = block.text()
+        pending = None
+        for i, (match_line, start, end) in enumerate(matches):
+            if match_line != line_no:
+                if pending is not None:
+                    edits.append(self._line_edit(block, text, pending))
+                    pending = None
+                while line_no < match_line:
+                    block = block.next()
+                    line_no += 1
+                text = block.text()
+            if expanded is not None:
+                new_text = expanded[i]
+            elif regex:
+                new_text = self._pattern.match(text, start).expand(replacement)
+            else:
+                new_text = replacement
+
+            if self._multiline:
+                edits.append((self._position(block, start), self._position(block, end), new_text))
+            elif pending is None:
+                pending = [start, end, [new_text]]
+            else:
+                pending[2].append(text[pending[1]:start])
+                pending[2].append(new_text)
+                pending[1] = end
+        if pending is not None:
+            edits.append(self._line_edit(block, text, pending))
+        return edits
+
+    def _line_edit(self, block, text, pending):
+        start, end, pieces = pending
+        base = block.position()
+        if text.isascii():
+            return base + start, base + end, "".join(pieces)
+        return base + _utf16_len(text[:start]), base + _utf16_len(text[:end]), "".join(pieces)
+
+    def visible_matches(self, first_line, last_line):
+        """first_line..last_line 行内的匹配；索引未就绪时返回空列表"""
+        if self.count() is None:
+            return []
+        matches = self._matches
+        start = bisect.bisect_left(matches, (first_line,))
+        end = bisect.bisect_left(matches, (last_line + 1,))
+        return matches[start:end]
+
+    def location(self, position):
+        """文档位置（UTF-16）换算为 (行号, 列)"""
+        block = self._text_document.findBlock(position)
+        if not block.isValid():
+            block = self._text_document.lastBlock()
+        text = block.text()
+        offset = min(position - block.position(), _utf16_len(text))
+        if not text.isascii():
+            offset = len(text.encode("utf-16-le")[:offset * 2].decode("utf-16-le", errors="ignore"))
+        return block.blockNumber(), max(offset, 0)
+
+    def match_range(self, match):
+        """匹配对应的文档位置区间 (start, end)"""
+        line_no, start, end = match
+        block = self._text_document.findBlockByNumber(line_no)
+        return self._position(block, start), self._position(block, end)
+
+    def _position(self, block, col):
+        while block.isValid():
+            text = block.text()
+            if col <= len(text) or not block.next().isValid():
+                return block.position() + _utf16_len(text[:col])
+            col -= len(text) + 1
+            block = block.next()
+        return self._text_document.characterCount() - 1
+
+    def _start_scan(self):
+        job = (self._text_source(), self._pattern, self._multiline)
+        self._scan_generation = self._worker.submit(job)
+
+    def _cancel_scan(self):
+        if self._scan_generation is not None:
+            self._worker.cancel()
+            self._scan_generation = None
+
+    def _on_scan_finished(self, generation, matches):
+        if generation != self._scan_generation:
+            return
+        self._scan_generation = None
+        self._matches = matches
+        self.matches_changed.emit()
+
+    def _refresh(self):
+        if self._pattern is None:
+            return
+        if self._matches is None:
+            if self._scan_generation is None:
+                self._start_scan()
+            return
+        self._apply_dirty_lines()
+        self.matches_changed.emit()
+
+    def _apply_dirty_lines(self):
+        """重扫编辑过的行，其后的匹配按行数变化平移"""
+        if self._dirty_lines is None or self._matches is None:
+            return
+        first_line, last_line, line_delta = self._dirty_lines
+        self._dirty_lines = None
+        old_last = max(last_line - line_delta, first_line - 1)
+
+        matches = self._matches
+        start = bisect.bisect_left(matches, (first_line,))
+        end = bisect.bisect_left(matches, (old_last + 1,))
+
+        updated = []
+        block = self._text_document.findBlockByNumber(first_line)
+        line_no = first_line
+        while block.isValid() and line_no <= last_line:
+            updated.extend(_match_line(self._pattern, line_no, block.text()))
+            block = block.next()
+            line_no += 1
+
+        tail = matches[end:]
+        if line_delta:
+            tail = [(line + line_delta, s, e) for line, s, e in tail]
+        self._matches = matches[:start] + updated + tail
@@ -0,0 +1,469 @@
+"""导出不依赖脚本和外部资源的独立 HTML 页面"""
+
+import base64
+import hashlib
+import html
+import io
+import os
+import json
+import logging
+import re
+from urllib.parse import quote, unquote, urlparse
+
+from models.document import write_atomic
+from models.html_template import vendor_dir
+
+_log = logging.getLogger(__name__)
+# 每个进程只记录一次的警告（批量导出时每个文件都会遇到同样的问题）
+_logged_warnings = set()
+
+# 本地图片总大小超过此值时 "auto" 模式改为复制到同名资源目录，避免页面过大
+EMBED_LIMIT = 5 * 1024 * 1024
+
+_MIME_TYPES = {
+    ".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg", ".gif": "image/gif",
+    ".webp": "image/webp", ".svg": "image/svg+xml", ".bmp": "image/bmp", ".ico": "image/x-icon",
+    ".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf",
+}
+
+# 第三方样式表（按 resources/vendor 下的目录区分）只在页面含对应类名时才需要
+_STYLESHEET_MARKERS = {"highlight": "hljs", "katex": "katex"}
+
+_IMG_SRC_RE = re.compile(r'(<img\b[^>]*?\bsrc=")([^"]*)(")')
+_CODE_BLOCK_RE = re.compile(r'<pre><code class="language-([\w+#.-]+)">(.*?)</code></pre>', re.S)
+_COPY_BUTTON_RE = re.compile(r'<button class="copy-button">.*?</button>', re.S)
+_CHECKBOX_RE = re.compile(r'<input type="checkbox" class="task-checkbox"')
+_DATA_ATTR_RE = re.compile(r' data-(?:block|source-line|estimate|task-index)="[^"]*"')
+_CLASS_ATTR_RE = re.compile(r'\bclass="([^"]*)"')
+_TAG_NAME_RE = re.compile(r'<([a-zA-Z][\w-]*)')
+_CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.S)
+_CSS_URL_RE = re.compile(r'url\(\s*["\']?([^"\')]+)["\']?\s*\)')
+_SELECTOR_PSEUDO_RE = re.compile(r'::?[\w-]+(?:\([^)]*\))?|\[[^\]]*\]')
+_SELECTOR_CLASS_RE = re.compile(r'\.([\w-]+)')
+_SELECTOR_TAG_RE = re.compile(r'(?:^|[\s>+~])([a-zA-Z][\w-]*)')
+_FONT_FAMILY_RE = re.compile(r'font-family\s*:\s*([^;}]+)')
+
+
+# ----------------------------------------------------------------------
+# 代码高亮：没有浏览器时用 Pygments 预先着色，输出 highlight.js 的类名以共用其主题样式
+# ----------------------------------------------------------------------
+
+try:
+    from pygments import lex
+    from pygments.lexers import get_lexer_by_name
+    from pygments.token import Token
+    from pygments.util import ClassNotFound
+    HAS_PYGMENTS = True
+
+    _HLJS_CLASSES = {
+        Token.Comment: "hljs-comment",
+        Token.Comment.Preproc: "hljs-meta",
+        Token.Keyword: "hljs-keyword",
+        Token.Keyword.Constant: "hljs-literal",
+        Token.Keyword.Type: "hljs-type",
+        Token.Name.Builtin: "hljs-built_in",
+        Token.Name.Builtin.Pseudo: "hljs-variable language_",
+        Token.Name.Class: "hljs-title class_",
+        Token.Name.Function: "hljs-title function_",
+        Token.Name.Decorator: "hljs-meta",
+        Token.Name.Tag: "hljs-name",
+        Token.Name.Attribute: "hljs-attr",
+        Token.Name.Variable: "hljs-variable",
+        Token.Name.Constant: "hljs-variable constant_",
+        Token.Name.Exception: "hljs-title class_",
+        Token.Literal.String: "hljs-string",
+        Token.Literal.String.Regex: "hljs-regexp",
+        Token.Literal.String.Escape: "hljs-char escape_",
+        Token.Literal.Number: "hljs-number",
+        Token.Operator.Word: "hljs-keyword",
+        Token.Generic.Deleted: "hljs-deletion",
+        Token.Generic.Inserted: "hljs-addition",
+        Token.Generic.Heading: "hljs-section",
+        Token.Generic.Subheading: "hljs-section",
+        Token.Generic.Emph: "hljs-emphasis",
+        Token.Generic.Strong: "hljs-strong",
+    }
+except ImportError:
+    HAS_PYGMENTS = False
+
+
+def _hljs_class(token_type):
+    while token_type is not None:
+        cls = _HLJS_CLASSES.get(token_type)
+        if cls is not None:
+            return cls
+        token_type = token_type.parent
+    return None
+
+
+def _highlight_block(match):
+    language, code = match.group(1), match.group(2)
+    if language == "mermaid":
+        return match.group(0)
+    try:
+        lexer = get_lexer_by_name(language, stripnl=False, ensurenl=False)
+    except ClassNotFound:
+        return match.group(0)
+    parts = []
+    for token_type, value in lex(html.unescape(code), lexer):
+        value = html.escape(value, quote=False)
+        cls = _hljs_class(token_type)
+        parts.append(f'<span class="{cls}">{value}</span>' if cls else value)
+    return f'<pre><code class="hljs language-{language}">{"".join(parts)}</code></pre>'
+
+
+def highlight_code(body_html):
+    """给尚未高亮的围栏代码块着色；已由 highlight.js 处理过的（带 hljs 类）保持不变"""
+    if not HAS_PYGMENTS:
+        return body_html
+    return _CODE_BLOCK_RE.sub(_highlight_block, body_html)
+
+
+# ----------------------------------------------------------------------
+# 图片、字体等资源：按内容哈希去重，内嵌为 data URI 或复制到资源目录
+# ----------------------------------------------------------------------
+
+class AssetStore:
+    """页面引用的本地资源。
+
+    同一内容只读取、优化一次：embed 模式下转为 data URI，copy 模式下以内容哈希命名
+    复制到 HTML 旁的 "<文件名>_assets" 目录，内容相同的图片只存一份。
+
+    资源目录中的 MANIFEST 记录导出写入的文件，清理时只删除其中列出的文件；
+    同名目录已存在但没有 MANIFEST（用户自己的目录）时改用 "<文件名>_assets-2" 等名称。
+    所有写入和清理都推迟到 commit，此前只读取源文件。
+
+    Parameters
+    ----------
+    html_path : str
+        导出的 HTML 文件路径，资源目录与它同级。
+    mode : str
+        "embed" 或 "copy"。
+    """
+
+    MANIFEST = ".fmd-assets.json"
+
+    def __init__(self, html_path, mode="embed"):
+        self.mode = mode
+        stem = os.path.splitext(os.path.basename(html_path))[0]
+        parent = os.path.dirname(html_path)
+        index = 1
+        while True:
+            self.dir_name = stem + ("_assets" if index == 1 else f"_assets-{index}")
+            self.dir_path = os.path.join(parent, self.dir_name)
+            if not os.path.exists(self.dir_path) or self._owned() is not None:
+                break
+            index += 1
+        # 源文件路径 -> 页面中使用的 URL
+        self._urls = {}
+        # 内容哈希 -> URL
+        self._by_digest = {}
+        # copy 模式待写入的 {文件名: 内容}
+        self._pending = {}
+
+    def _owned(self):
+        """MANIFEST 中记录的文件名；不是导出创建的目录返回 None"""
+        try:
+            with open(os.path.join(self.dir_path, self.MANIFEST), "r", encoding="utf-8") as f:
+                names = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(names, list):
+            return None
+        return {name for name in names if isinstance(name, str) and name == os.path.basename(name)}
+
+    def url_for(self, path):
+        """本地文件在页面中的 URL；读取失败时返回 None"""
+        url = self._urls.get(path)
+        if url is None:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+            except OSError:
+                return None
+            url = self._store(data, os.path.splitext(path)[1].lower())
+            self._urls[path] = url
+        return url
+
+    def _store(self, data, ext):
+        digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+        url = self._by_digest.get(digest)
+        if url is not None:
+            return url
+        data = _optimize_image(data, ext)
+        if self.mode == "copy":
+            name = digest + ext
+            self._pending[name] = data
+            url = quote(f"{self.dir_name}/{name}")
+        else:
+            mime = _MIME_TYPES.get(ext, "application/octet-stream")
+            url = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        self._by_digest[digest] = url
+        return url
+
+    def _reads_from_dir(self):
+        root = os.path.normcase(os.path.realpath(self.dir_path))
+        for path in self._urls:
+            path = os.path.normcase(os.path.realpath(path))
+            if os.path.dirname(path) == root or path.startswith(root + os.sep):
+                return True
+        return False
+
+    def commit(self):
+        """写入本次的资源，删除上次导出写入、本次不再使用的文件。
+
+        页面引用了资源目录中的文件时不做清理，只追加新文件。
+        """
+        manifest = self._owned()
+        owned = manifest or set()
+        keep = set(self._pending)
+        if self._reads_from_dir():
+            keep |= owned
+        else:
+            for name in owned - keep:
+                try:
+                    os.remove(os.path.join(self.dir_path, name))
+                except OSError:
+                    pass
+        if keep:
+            os.makedirs(self.dir_path, exist_ok=True)
+            for name, data in self._pending.items():
+                with open(os.path.join(self.dir_path, name), "wb") as f:
+                    f.write(data)
+            write_atomic(os.path.join(self.dir_path, self.MANIFEST), json.dumps(sorted(keep), indent=1))
+        elif manifest is not None:
+            try:
+                os.remove(os.path.join(self.dir_path, self.MANIFEST))
+                os.rmdir(self.dir_path)
+            except OSError:
+                # 目录中还有别的文件，保留
+                pass
+
+
+def _optimize_image(data, ext):
+    """PNG 无损重新压缩，结果更小时采用；其他格式原样保留"""
+    if ext != ".png" or len(data) < 4096:
+        return data
+    try:
+        from PIL import Image
+        with Image.open(io.BytesIO(data)) as image:
+            out = io.BytesIO()
+            image.save(out, format="PNG", optimize=True)
+    except Exception:
+        return data
+    optimized = out.getvalue()
+    return optimized if len(optimized) < len(data) else data
+
+
+def _local_path(src, base_dir):
+    """img src 对应的本地文件；远程地址、data URI 和找不到的文件返回 None"""
+    if src.startswith("file://"):
+        path = unquote(urlparse(src).path)
+        if re.match(r'^/[A-Za-z]:/', path):
+            path = path[1:]
+    elif re.match(r'^[a-zA-Z][\w+.-]+:', src):
+        return None
+    else:
+        path = unquote(src.split("#")[0].split("?")[0])
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir or os.getcwd(), path)
+    return path if os.path.isfile(path) else None
+
+
+def _image_paths(body_html, base_dir):
+    paths = []
+    for match in _IMG_SRC_RE.finditer(body_html):
+        path = _local_path(html.unescape(match.group(2)), base_dir)
+        if path is not None:
+            paths.append(path)
+    return paths
+
+
+# ----------------------------------------------------------------------
+# CSS 裁剪：只保留选择器中的类名和标签都出现在页面中的规则
+# ----------------------------------------------------------------------
+
+def _parse_css(css):
+    """把样式表切分为 [(前导, 块内容或 None)]，块内容不含外层花括号"""
+    rules = []
+    i, n = 0, len(css)
+    while i < n:
+        start = i
+        while i < n and css[i] not in "{;":
+            i += 1
+        prelude = css[start:i].strip()
+        if i >= n:
+            break
+        if css[i] == ";":
+            rules.append((prelude, None))
+            i += 1
+            continue
+        depth, i, body_start = 1, i + 1, i + 1
+        quote_char = None
+        while i < n and depth:
+            ch = css[i]
+            if quote_char:
+                if ch == quote_char and css[i - 1] != "\\":
+                    quote_char = None
+            elif ch in "\"'":
+                quote_char = ch
+            elif ch == "{":
+                depth += 1
+            elif ch == "}":
+                depth -= 1
+            i += 1
+        rules.append((prelude, css[body_start:i - 1]))
+    return rules
+
+
+def _selector_used(selector, classes, tags):
+    bare = _SELECTOR_PSEUDO_RE.sub("", selector)
+    if any(cls not in classes for cls in _SELECTOR_CLASS_RE.findall(bare)):
+        return False
+    return all(tag.lower() in tags for tag in _SELECTOR_TAG_RE.findall(bare))
+
+
+def _prune_rules(rules, classes, tags):
+    kept = []
+    for prelude, body in rules:
+        if body is None:
+            # @charset / @import 等，独立页面不需要
+            continue
+        if prelude.startswith("@media") or prelude.startswith("@supports"):
+            inner = _prune_rules(_parse_css(body), classes, tags)
+            if inner:
+                kept.append((prelude, "".join(f"{p}{{{b}}}" for p, b in inner)))
+        elif prelude.startswith("@"):
+            # @font-face / @keyframes 留待按引用情况筛选
+            kept.append((prelude, body))
+        else:
+            selectors = [sel.strip() for sel in prelude.split(",")]
+            used = [sel for sel in selectors if _selector_used(sel, classes, tags)]
+            if used:
+                kept.append((",".join(used), body.strip()))
+    return kept
+
+
+def _font_family(font_face):
+    match = _FONT_FAMILY_RE.search(font_face)
+    return match.group(1).strip().strip("\"'") if match else ""
+
+
+def _page_classes(page_html):
+    classes = set()
+    for value in _CLASS_ATTR_RE.findall(page_html):
+        classes.update(value.split())
+    return classes
+
+
+def prune_css(css, page_html):
+    """只保留 page_html 中用到的规则，以及被引用的 @font-face / @keyframes"""
+    classes = _page_classes(page_html)
+    tags = {tag.lower() for tag in _TAG_NAME_RE.findall(page_html)} | {"html", "body"}
+
+    rules = _prune_rules(_parse_css(_CSS_COMMENT_RE.sub("", css)), classes, tags)
+    plain = "".join(body for prelude, body in rules if not prelude.startswith("@font-face"))
+    result = []
+    for prelude, body in rules:
+        if prelude.startswith("@font-face"):
+            # 字体名可能出现在 font-family 或 font 简写中
+            family = _font_family(body)
+            if not family or not re.search(rf'(?<![\w-]){re.escape(family)}(?![\w-])', plain):
+                continue
+        elif prelude.startswith(("@keyframes", "@-webkit-keyframes")):
+            if prelude.split()[-1] not in plain:
+                continue
+        result.append(f"{prelude}{{{body}}}")
+    return "\n".join(result)
+
+
+def _inline_css_urls(css, css_dir, assets):
+    """把样式表中的相对 url() 换成资源 URL；找不到的字体格式从 src 列表中去掉"""
+    def replace_src(match):
+        url = match.group(1)
+        if re.match(r'^[a-zA-Z][\w+.-]*:', url):
+            return match.group(0)
+        inlined = assets.url_for(os.path.join(css_dir, unquote(url)))
+        return f'url("{inlined}")' if inlined else "url()"
+
+    css = _CSS_URL_RE.sub(replace_src, css)
+    # fetch_assets 只下载 woff2，其余格式的 url 已置空，连同 format() 一并去掉
+    css = re.sub(r',?\s*url\(\)\s*(?:format\([^)]*\))?', "", css)
+    return re.sub(r'src:\s*,', "src:", css)
+
+
+# ----------------------------------------------------------------------
+
+def _clean_body(body_html):
+    """去掉预览中的交互元素：复制按钮、可点击的复选框和编辑器用的 data 属性"""
+    body_html = _COPY_BUTTON_RE.sub("", body_html)
+    body_html = _CHECKBOX_RE.sub(r'<input type="checkbox" class="task-checkbox" disabled', body_html)
+    return _DATA_ATTR_RE.sub("", body_html)
+
+
+def _warn(warnings, message):
+    warnings.append(message)
+    if message not in _logged_warnings:
+        _logged_warnings.add(message)
+        _log.warning(message)
+
+
+def bundle_html(html_path, body_html, builder, base_dir=None, images="auto"):
+    """生成独立 HTML 页面，返回 (页面字符串, 警告列表)；copy 模式的资源已写入资源目录。
+
+    页面不引用任何外部资源：缺少 Pygments 或本地前端样式时相应的高亮 / 公式样式缺失，
+    以警告说明（同时记入日志），而不是改为引用 CDN。
+
+    Parameters
+    ----------
+    html_path : str
+        导出的 HTML 文件路径，copy 模式的资源目录与它同级。
+    body_html : str
+        正文。来自预览页（getPreviewHtml）时代码高亮、公式和 Mermaid 图表已经渲染好；
+        来自 EditorController.render_body_html 时用 Pygments 高亮代码，公式和图表保留源码。
+    builder : PreviewHtmlBuilder
+        提供主题、字号对应的页面样式。
+    base_dir : str
+        解析图片相对路径的目录。
+    images : str
+        "embed" 内嵌为 data URI，"copy" 复制到资源目录，"auto" 按本地图片总大小（EMBED_LIMIT）选择。
+    """
+    warnings = []
+    body_html = _clean_body(body_html)
+    if not HAS_PYGMENTS and _CODE_BLOCK_RE.search(body_html):
+        _warn(warnings, "未安装 Pygments，代码块没有高亮，请运行: pip install pygments")
+    body_html = highlight_code(body_html)
+    if images == "auto":
+        total = sum(os.path.getsize(path) for path in set(_image_paths(body_html, base_dir)))
+        images = "copy" if total > EMBED_LIMIT else "embed"
+    assets = AssetStore(html_path, images)
+
+    def replace_image(match):
+        path = _local_path(html.unescape(match.group(2)), base_dir)
+        url = assets.url_for(path) if path else None
+        if url is None:
+            return match.group(0)
+        return f"{match.group(1)}{html.escape(url)}{match.group(3)}"
+
+    body_html = _IMG_SRC_RE.sub(replace_image, body_html)
+    page_html = builder.build_static(body_html, "")
+
+    classes = _page_classes(page_html)
+    parts = [prune_css(builder.css(static=True), page_html)]
+    vendor = vendor_dir()
+    for rel_path, _ in builder.stylesheets():
+        if _STYLESHEET_MARKERS[rel_path.split("/")[0]] not in classes:
+            continue
+        path = os.path.join(vendor, rel_path)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                css = f.read()
+        except OSError:
+            _warn(warnings, f"缺少本地样式表 {rel_path}，导出的页面不含该样式，请运行 fetch_assets.py 下载")
+            continue
+        css = prune_css(css, page_html)
+        if css:
+            parts.append(_inline_css_urls(css, os.path.dirname(path), assets))
+    # 源文件都已读入，再写资源目录
+    assets.commit()
+    return builder.build_static(body_html, "\n".join(part for part in parts if part)), warnings
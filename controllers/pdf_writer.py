@@ -0,0 +1,361 @@
+"""不依赖浏览器的 PDF 排版：把渲染好的 HTML 块逐块交给 fpdf2 断行、分页"""
+
+import html
+import json
+import os
+import re
+import sys
+import threading
+from urllib.parse import unquote, urlparse
+
+from models.document import write_atomic
+
+# 候选字体按优先级排列，取第一个找到的；.ttc 取集合中的第一个字体（简体中文）
+# 正文和粗体优先用西文字体，缺字的中日韩字符由 CJK_FONTS 中的字体补齐
+BODY_FONTS = [
+    "DejaVuSans.ttf", "LiberationSans-Regular.ttf", "NotoSans-Regular.ttf",
+    "arial.ttf", "segoeui.ttf", "Arial.ttf", "Helvetica.ttc",
+]
+BOLD_FONTS = [
+    "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf", "NotoSans-Bold.ttf",
+    "arialbd.ttf", "segoeuib.ttf", "Arial Bold.ttf",
+]
+MONO_FONTS = [
+    "DejaVuSansMono.ttf", "NotoSansMono-Regular.ttf", "LiberationMono-Regular.ttf",
+    "consola.ttf", "cour.ttf", "Menlo.ttc", "SFNSMono.ttf", "SourceCodePro-Regular.ttf",
+]
+CJK_FONTS = [
+    "NotoSansCJK-Regular.ttc", "NotoSansCJKsc-Regular.otf", "NotoSansSC-Regular.ttf",
+    "SourceHanSansSC-Regular.otf", "wqy-microhei.ttc", "wqy-zenhei.ttc",
+    "msyh.ttc", "simhei.ttf", "simsun.ttc",
+    "PingFang.ttc", "Hiragino Sans GB.ttc", "STHeiti Light.ttc", "Arial Unicode.ttf",
+    "DroidSansFallbackFull.ttf",
+]
+CJK_BOLD_FONTS = [
+    "NotoSansCJK-Bold.ttc", "NotoSansCJKsc-Bold.otf", "NotoSansSC-Bold.ttf",
+    "SourceHanSansSC-Bold.otf", "msyhbd.ttc", "STHeiti Medium.ttc",
+]
+
+# 环境变量可直接指定字体文件，用于字体不在标准目录的服务器
+FONT_ENV = {
+    "body": "FMD_PDF_FONT", "bold": "FMD_PDF_BOLD_FONT", "mono": "FMD_PDF_MONO_FONT",
+    "cjk": "FMD_PDF_CJK_FONT", "cjk_bold": "FMD_PDF_CJK_BOLD_FONT",
+}
+
+_FONT_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".fluentmarkdown_fonts.json")
+_FONT_CACHE_VERSION = 2
+_font_lock = threading.Lock()
+# {"dirs": {目录: mtime_ns}, "fonts": {...}}
+_fonts = None
+# 字体文件 -> 是否包含常用汉字
+_cjk_coverage = {}
+
+_CJK_TEXT_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+_CHECKBOX_RE = re.compile(r'<input type="checkbox"[^>]*?(\schecked)?>')
+_IMG_RE = re.compile(r'<img\b[^>]*>')
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+_TAG_RE = re.compile(r'<[^>]+>')
+_BLOCK_TAG_RE = re.compile(r'</?div[^>]*>')
+
+
+def _font_dirs():
+    home = os.path.expanduser("~")
+    if sys.platform == "win32":
+        windir = os.environ.get("WINDIR", "C:/Windows")
+        return [
+            os.path.join(windir, "Fonts"),
+            os.path.join(os.environ.get("LOCALAPPDATA", ""), "Microsoft", "Windows", "Fonts"),
+        ]
+    if sys.platform == "darwin":
+        return ["/System/Library/Fonts", "/Library/Fonts", os.path.join(home, "Library/Fonts")]
+    return [
+        "/usr/share/fonts", "/usr/local/share/fonts",
+        os.path.join(home, ".local/share/fonts"), os.path.join(home, ".fonts"),
+    ]
+
+
+def _dir_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _scan_fonts():
+    """遍历字体目录，返回 ({小写文件名: 路径}, {目录: mtime_ns})。
+
+    记录每一级目录的 mtime，增删字体文件或子目录都会改变所在目录的 mtime，
+    以此判断缓存是否过期（与 fontconfig 的做法相同）。
+    """
+    found = {}
+    dirs = {}
+    for font_dir in _font_dirs():
+        dirs[font_dir] = _dir_mtime(font_dir)
+        for root, _, files in os.walk(font_dir):
+            dirs[root] = _dir_mtime(root)
+            for name in files:
+                if name.lower().endswith((".ttf", ".ttc", ".otf")):
+                    found.setdefault(name.lower(), os.path.join(root, name))
+    return found, dirs
+
+
+def covers_cjk(path):
+    """字体是否包含常用汉字（检查 cmap 中的“中”“文”），结果按文件缓存"""
+    covered = _cjk_coverage.get(path)
+    if covered is None:
+        try:
+            from fontTools.ttLib import TTFont
+            with TTFont(path, fontNumber=0, lazy=True) as font:
+                cmap = font.getBestCmap() or {}
+            covered = 0x4E2D in cmap and 0x6587 in cmap
+        except Exception:
+            covered = False
+        _cjk_coverage[path] = covered
+    return covered
+
+
+def _pick(found, candidates, need_cjk=False):
+    for name in candidates:
+        path = found.get(name.lower())
+        if path and (not need_cjk or covers_cjk(path)):
+            return path
+    return None
+
+
+def _cache_valid(cache):
+    """缓存的字体文件都还在，且记录的字体目录都没有变化"""
+    if not isinstance(cache, dict) or cache.get("version") != _FONT_CACHE_VERSION:
+        return False
+    fonts, dirs = cache.get("fonts"), cache.get("dirs")
+    if not isinstance(fonts, dict) or not isinstance(dirs, dict):
+        return False
+    if any(key not in fonts or (fonts[key] and not os.path.isfile(fonts[key])) for key in FONT_ENV):
+        return False
+    if any(font_dir not in dirs for font_dir in _font_dirs()):
+        return False
+    return all(_dir_mtime(path) == mtime for path, mtime in dirs.items())
+
+
+def find_fonts(refresh=False):
+    """返回 {"body", "bold", "mono", "cjk", "cjk_bold"} -> 字体文件路径（找不到为 None）。
+
+    结果在进程内缓存，并写入 ~/.fluentmarkdown_fonts.json；之后只比较字体目录的 mtime，
+    安装或删除字体后自动重新查找，refresh=True 时强制重新查找。
+    "cjk" 只取确实包含汉字的字体。环境变量 FONT_ENV 优先，正文字体本身含汉字时兼作 "cjk"。
+    """
+    global _fonts
+    with _font_lock:
+        cache = _fonts
+        if refresh or cache is None or not _cache_valid(cache):
+            cache = None
+            if not refresh and _fonts is None:
+                try:
+                    with open(_FONT_CACHE_PATH, "r", encoding="utf-8") as f:
+                        cache = json.load(f)
+                except (OSError, ValueError):
+                    cache = None
+                if not _cache_valid(cache):
+                    cache = None
+            if cache is None:
+                found, dirs = _scan_fonts()
+                cache = {
+                    "version": _FONT_CACHE_VERSION,
+                    "dirs": dirs,
+                    "fonts": {
+                        "body": _pick(found, BODY_FONTS),
+                        "bold": _pick(found, BOLD_FONTS),
+                        "mono": _pick(found, MONO_FONTS),
+                        "cjk": _pick(found, CJK_FONTS, need_cjk=True),
+                        "cjk_bold": _pick(found, CJK_BOLD_FONTS, need_cjk=True),
+                    },
+                }
+                try:
+                    write_atomic(_FONT_CACHE_PATH, json.dumps(cache, ensure_ascii=False, indent=1))
+                except OSError:
+                    pass
+            _fonts = cache
+        fonts = dict(cache["fonts"])
+    for key, env in FONT_ENV.items():
+        path = os.environ.get(env)
+        if path and os.path.isfile(path):
+            fonts[key] = path
+    if fonts["cjk"] and not covers_cjk(fonts["cjk"]):
+        fonts["cjk"] = None
+    if not fonts["cjk"] and fonts["body"] and covers_cjk(fonts["body"]):
+        fonts["cjk"] = fonts["body"]
+    return fonts
+
+
+def _image_path(src, base_dir):
+    """img src 对应的本地文件；远程地址和找不到的文件返回 None"""
+    if src.startswith("data:"):
+        return src
+    if src.startswith("file://"):
+        path = unquote(urlparse(src).path)
+        if re.match(r'^/[A-Za-z]:/', path):
+            path = path[1:]
+    elif re.match(r'^[a-zA-Z][\w+.-]*://', src):
+        return None
+    else:
+        path = unquote(src)
+        if not os.path.isabs(path):
+            path = os.path.join(base_dir or os.getcwd(), path)
+    return path if os.path.isfile(path) else None
+
+
+class PdfWriter:
+    """用 fpdf2 排版 PDF：A4，页边距与预览打印一致。
+
+    write_block 每次接收一个渲染好的顶层块（RenderedBlock.html），由 fpdf2 负责断行、
+    分页和字体子集嵌入（只嵌入用到的字形），调用方可以边渲染边写入，不必先拼出整篇 HTML。
+    注意 fpdf2 会把已排好的所有页面保留在内存中，直到 save() 才整体输出，内存占用随页数增长；
+    逐块写入省下的只是整篇 HTML 及其解析结构，并不是固定的内存上限。
+    正文用西文字体，缺字的中日韩字符回退到单独注册的中文字体（find_fonts 的 "cjk"），
+    代码用等宽字体；没有中文字体时遇到中文直接报错。
+    一个字体都没找到时退回内置的 Helvetica，无法编码的字符显示为 "?"。
+
+    Parameters
+    ----------
+    base_dir : str
+        解析图片相对路径的目录。
+    font_size : int
+        正文字号（pt），标题按比例放大。
+    """
+
+    MARGIN = 15
+
+    def __init__(self, base_dir=None, font_size=11):
+        from fpdf import FPDF
+
+        self.base_dir = base_dir
+        self.font_size = font_size
+        pdf = FPDF(format="A4")
+        pdf.set_margins(self.MARGIN, self.MARGIN, self.MARGIN)
+        pdf.set_auto_page_break(True, self.MARGIN)
+        pdf.set_compression(True)
+
+        self.pdf = pdf
+        # 复用同一字体对象的样式键，输出前移除，避免同一字体重复嵌入
+        self._aliases = []
+        self._loaded = {}
+        fonts = find_fonts()
+        body = fonts["body"] or fonts["cjk"]
+        self._unicode = bool(body)
+        self._cjk = bool(fonts["cjk"])
+        if self._unicode:
+            bold = fonts["bold"] or body
+            self._add_family("body", {"": body, "B": bold, "I": body, "BI": bold})
+            mono = fonts["mono"] or body
+            self._add_family("mono", dict.fromkeys(("", "B", "I", "BI"), mono))
+            fallbacks = ["body"]
+            if self._cjk:
+                cjk, cjk_bold = fonts["cjk"], fonts["cjk_bold"] or fonts["cjk"]
+                self._add_family("cjk", {"": cjk, "B": cjk_bold, "I": cjk, "BI": cjk_bold})
+                fallbacks.insert(0, "cjk")
+            pdf.set_fallback_fonts(fallbacks, exact_match=False)
+            self._family, self._mono = "body", "mono"
+        else:
+            self._family, self._mono = "helvetica", "courier"
+        pdf.set_font(self._family, size=font_size)
+        pdf.add_page()
+        self._tag_styles = self._build_tag_styles()
+
+    def _add_family(self, family, paths):
+        """注册 {样式: 字体文件}；中文字体大多没有斜体，同一文件只解析一次，其余样式和字族指向它"""
+        for style, path in paths.items():
+            if path in self._loaded:
+                self.pdf.fonts[family + style] = self._loaded[path]
+                self._aliases.append(family + style)
+            else:
+                self.pdf.add_font(family, style, path)
+                self._loaded[path] = self.pdf.fonts[family + style]
+
+    def _build_tag_styles(self):
+        """与浅色预览相近的样式：深灰标题、灰色引用，代码用等宽字体"""
+        from fpdf.fonts import FontFace, TextStyle
+
+        size = self.font_size
+        styles = {
+            f"h{level}": TextStyle(
+                font_family=self._family, font_style="B", color="#1f2328",
+                font_size_pt=round(size * scale, 1), t_margin=6 - level * 0.5, b_margin=1.5,
+            )
+            for level, scale in ((1, 2.0), (2, 1.5), (3, 1.25), (4, 1.0), (5, 0.875), (6, 0.85))
+        }
+        styles.update({
+            "a": FontFace(color="#0969da", emphasis="UNDERLINE"),
+            "code": FontFace(family=self._mono, color="#cf222e"),
+            "pre": TextStyle(font_family=self._mono, font_size_pt=round(size * 0.85, 1), t_margin=3, b_margin=3),
+            "blockquote": TextStyle(color="#59636e", l_margin=6, t_margin=2, b_margin=2),
+            "p": TextStyle(t_margin=2),
+        })
+        return styles
+
+    def write_block(self, block_html):
+        """排版一个块；fpdf2 无法处理的块退回为纯文本段落。
+
+        没有找到中文字体而块中含中日韩文字时抛出 RuntimeError，不输出缺字的 PDF。
+        """
+        if not self._cjk and _CJK_TEXT_RE.search(block_html):
+            raise RuntimeError(
+                "没有找到包含中文字形的字体，请安装 Noto Sans CJK、文泉驿等中文字体，"
+                "或用环境变量 FMD_PDF_CJK_FONT 指定字体文件"
+            )
+        block_html = self._prepare(block_html)
+        try:
+            self.pdf.write_html(
+                block_html,
+                font_family=self._family,
+                tag_styles=self._tag_styles,
+                warn_on_tags_not_matching=False,
+            )
+        except Exception:
+            text = html.unescape(_TAG_RE.sub("", block_html)).strip()
+            if text:
+                self.pdf.set_font(self._family, "", self.font_size)
+                self.pdf.multi_cell(0, self.font_size * 0.5, text)
+                self.pdf.ln()
+
+    def write(self, blocks_html):
+        for block_html in blocks_html:
+            self.write_block(block_html)
+
+    def save(self, file_path):
+        """输出到 file_path；经临时文件替换写入，失败时不会留下残缺的 PDF"""
+        for key in self._aliases:
+            del self.pdf.fonts[key]
+        self._aliases = []
+        write_atomic(file_path, self.pdf.output())
+
+    def _prepare(self, block_html):
+        # 任务复选框改为文字，图片改为本地路径，远程或缺失的图片显示替代文本
+        block_html = _CHECKBOX_RE.sub(lambda m: "[x] " if m.group(1) else "[ ] ", block_html)
+        block_html = _IMG_RE.sub(self._replace_image, block_html)
+        # 公式容器等 div 只作为普通段落
+        block_html = _BLOCK_TAG_RE.sub(
+            lambda m: "</p>" if m.group(0).startswith("</") else "<p>", block_html
+        )
+        if not self._unicode:
+            block_html = block_html.encode("latin-1", "replace").decode("latin-1")
+        return block_html
+
+    def _replace_image(self, match):
+        attrs = dict(_ATTR_RE.findall(match.group(0)))
+        path = _image_path(html.unescape(attrs.get("src", "")), self.base_dir)
+        if path is None:
+            alt = attrs.get("alt", "")
+            return f"[{alt}]" if alt else ""
+        return f'<img src="{html.escape(path)}"{self._image_width(path)}>'
+
+    def _image_width(self, path):
+        """按 96 dpi 换算的显示宽度（pt），超过版心时缩到版心宽度"""
+        if path.startswith("data:"):
+            return ""
+        try:
+            from PIL import Image
+            with Image.open(path) as image:
+                width = image.width * 0.75
+        except Exception:
+            return ""
+        width = min(width, self.pdf.epw * self.pdf.k)
+        return f' width="{width:.1f}"'
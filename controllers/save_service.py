@@ -0,0 +1,67 @@
+"""后台保存线程"""
+
+import threading
+import traceback
+
+from PyQt5.QtCore import QThread, pyqtSignal
+
+from models.document import disk_state, text_digest, write_atomic
+
+
+class SaveService(QThread):
+    """在独立线程中把内容快照原子地写入文件（临时文件 + fsync + rename）。
+
+    同一路径上尚未开始写入的保存会被新的快照顶替，连续保存只写最后一次；
+    正在写入的保存不受影响，结束后再写新的快照。
+    每次写入结束发出 save_finished(路径, revision, 错误信息, 写入后的 DiskState)，
+    成功时错误信息为空串。
+    """
+
+    save_finished = pyqtSignal(str, int, str, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._cond = threading.Condition()
+        # 路径 -> (内容, revision)，按提交顺序写入
+        self._pending = {}
+        self._stopped = False
+
+    def save(self, file_path, content, revision):
+        with self._cond:
+            self._pending.pop(file_path, None)
+            self._pending[file_path] = (content, revision)
+            self._cond.notify()
+        if not self.isRunning():
+            self.start()
+
+    def is_pending(self, file_path):
+        """file_path 是否还有未开始写入的快照"""
+        with self._cond:
+            return file_path in self._pending
+
+    def stop(self):
+        """写完所有待保存的快照后结束线程"""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self.wait()
+
+    def run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopped:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                file_path = next(iter(self._pending))
+                content, revision = self._pending.pop(file_path)
+
+            error = ""
+            state = None
+            try:
+                write_atomic(file_path, content)
+                state = disk_state(file_path, text_digest(content))
+            except Exception as e:
+                traceback.print_exc()
+                error = str(e) or e.__class__.__name__
+            self.save_finished.emit(file_path, revision, error, state)
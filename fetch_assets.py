@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+下载预览页依赖的前端资源（highlight.js / KaTeX / Mermaid）到 resources/vendor，
+供 fmd-asset:// 协议离线加载。打包前运行一次即可。
+"""
+import io
+import os
+import shutil
+import tarfile
+import urllib.request
+
+PROJECT_ROOT = os.path.dirname(os.path.abspath(__file__))
+VENDOR_DIR = os.path.join(PROJECT_ROOT, "resources", "vendor")
+
+HIGHLIGHT_VERSION = "11.9.0"
+KATEX_VERSION = "0.16.11"
+MERMAID_VERSION = "10.9.1"
+
+HIGHLIGHT_BASE = f"https://cdnjs.cloudflare.com/ajax/libs/highlight.js/{HIGHLIGHT_VERSION}"
+
+FILES = [
+    (f"{HIGHLIGHT_BASE}/highlight.min.js", "highlight/highlight.min.js"),
+    (f"{HIGHLIGHT_BASE}/styles/github.min.css", "highlight/styles/github.min.css"),
+    (f"{HIGHLIGHT_BASE}/styles/github-dark.min.css", "highlight/styles/github-dark.min.css"),
+    (f"https://cdn.jsdelivr.net/npm/mermaid@{MERMAID_VERSION}/dist/mermaid.min.js", "mermaid/mermaid.min.js"),
+]
+
+# KaTeX 的 css 通过相对路径引用 fonts/ 下的字体，直接取 npm 包里的 dist 目录
+KATEX_TARBALL = f"https://registry.npmjs.org/katex/-/katex-{KATEX_VERSION}.tgz"
+
+
+def download(url):
+    print(f"下载 {url}")
+    with urllib.request.urlopen(url, timeout=60) as resp:
+        return resp.read()
+
+
+def write_file(rel_path, data):
+    path = os.path.join(VENDOR_DIR, rel_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def fetch_katex():
+    data = download(KATEX_TARBALL)
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        for member in tar.getmembers():
+            name = member.name
+            if not member.isfile() or not name.startswith("package/dist/"):
+                continue
+            rel = name[len("package/dist/"):]
+            if rel in ("katex.min.js", "katex.min.css") or (rel.startswith("fonts/") and rel.endswith(".woff2")):
+                write_file(os.path.join("katex", rel), tar.extractfile(member).read())
+
+
+def main():
+    print("=== 下载预览前端资源 ===")
+    if os.path.exists(VENDOR_DIR):
+        shutil.rmtree(VENDOR_DIR)
+
+    for url, rel_path in FILES:
+        write_file(rel_path, download(url))
+    fetch_katex()
+
+    print(f"\n完成，资源位于: {VENDOR_DIR}")
+
+
+if __name__ == "__main__":
+    main()
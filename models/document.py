@@ -1,23 +1,214 @@
+import codecs
+import hashlib
+import io
 import json
+import mmap
 import os
+import shutil
+import tempfile
+from collections import namedtuple
+
+from models.markdown_blocks import split_blocks, update_blocks
+
+
+def merge_line_changes(pending, first_line, last_line, line_delta):
+    """把尚未处理的编辑区间 pending=(first, last, delta) 与新一次编辑合并。
+
+    pending 的行号先换算到本次编辑后的坐标，合并结果可能偏大但不会漏掉变化的行。
+    """
+    if pending is None:
+        return first_line, last_line, line_delta
+    old_first, old_last, old_delta = pending
+    if old_last > last_line - line_delta:
+        old_last += line_delta
+    elif old_last >= first_line:
+        old_last = last_line
+    return min(first_line, old_first), max(last_line, old_last), line_delta + old_delta
+
+
+# mkstemp 创建的临时文件权限为 0600，新文件按 umask 还原为普通权限
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def write_atomic(file_path, text):
+    """先写同目录临时文件并 fsync，再替换目标文件；中途崩溃不会留下截断的文件。
+
+    text 为 bytes / bytearray 时按二进制写入，否则按 UTF-8 文本写入。
+    """
+    target = os.path.realpath(file_path)
+    directory = os.path.dirname(target)
+    fd, tmp_path = tempfile.mkstemp(prefix="." + os.path.basename(target) + ".", suffix=".tmp", dir=directory)
+    try:
+        binary = isinstance(text, (bytes, bytearray))
+        with os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        if os.path.exists(target):
+            shutil.copymode(target, tmp_path)
+        else:
+            os.chmod(tmp_path, 0o666 & ~_UMASK)
+        os.replace(tmp_path, target)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    # 目录项也落盘，rename 本身才算持久
+    if hasattr(os, "O_DIRECTORY"):
+        try:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        except OSError:
+            return
+        try:
+            os.fsync(dir_fd)
+        except OSError:
+            pass
+        finally:
+            os.close(dir_fd)
+
+
+# 超过此字节数的文件分块载入编辑器，避免一次性读入并 setPlainText 卡住界面
+LARGE_FILE_SIZE = 8 * 1024 * 1024
+LOAD_CHUNK_SIZE = 256 * 1024
+
+
+def is_large_file(file_path):
+    try:
+        return os.path.getsize(file_path) > LARGE_FILE_SIZE
+    except OSError:
+        return False
+
+
+def read_chunks(file_path, chunk_size=LOAD_CHUNK_SIZE):
+    """以 mmap 映射文件并增量解码，逐块产出 (文本, 已读取比例)。
+
+    换行统一为 \n，与文本模式 open() 一致；跨块的多字节字符和 \r\n 由增量解码器拼接。
+    """
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder("utf-8")(), translate=True)
+    with open(file_path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(0, size, chunk_size):
+                end = min(offset + chunk_size, size)
+                text = decoder.decode(mm[offset:end], final=end == size)
+                if text:
+                    yield text, end / size
+
+
+# 文件在磁盘上的状态：大小和 mtime 用于快速判断，digest 为解码后正文的哈希
+DiskState = namedtuple("DiskState", ["size", "mtime_ns", "digest"])
+
+
+def text_digest(text):
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+
+def file_text_digest(file_path):
+    """按 read_chunks 流式读取文件并计算正文哈希，与 text_digest(文件内容) 一致"""
+    digest = hashlib.blake2b(digest_size=16)
+    for text, _ in read_chunks(file_path):
+        digest.update(text.encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+
+def disk_state(file_path, digest=None):
+    """file_path 当前的 DiskState，文件不存在时返回 None"""
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return DiskState(st.st_size, st.st_mtime_ns, digest)
+
+
+def _fits_disk_text(text, state):
+    """text 是否小到可以保留在内存中；按文件字节数判断，与 LARGE_FILE_SIZE 的单位一致"""
+    if text is None:
+        return False
+    if state is not None:
+        return state.size <= LARGE_FILE_SIZE
+    # UTF-8 每个字符至多 4 字节，短文本不必编码
+    if len(text) * 4 <= LARGE_FILE_SIZE:
+        return True
+    return len(text.encode("utf-8", "surrogatepass")) <= LARGE_FILE_SIZE
 
 
 class MarkdownDocument:
     def __init__(self):
         self.file_path = None
-        self.content = ""
+        self._content = ""
+        # 编辑器绑定后，全文由 _content_source() 按需取出，编辑只作废缓存
+        self._content_source = None
+        # 按需读取各行的序列，增量切分只读编辑涉及的行，不必取全文
+        self._lines = None
+        # 每次编辑递增，用于 O(1) 判断内容是否变化
+        self.revision = 0
+        # 顶层块列表按编辑的行区间增量维护，块哈希同时作为渲染缓存键
+        self._blocks = None
+        self._dirty_lines = None
         self.is_modified = False
         self.has_file = False
+        # 上次载入/保存时文件在磁盘上的状态，以及当时的内容（供外部修改时三方合并，大文件不保留）
+        self.disk_state = None
+        self.disk_text = None
+        # 进行中的异步保存：(路径, revision) -> 内容快照
+        self._saving = {}
         self._history_file_path = os.path.join(os.path.expanduser("~"), ".fluentmarkdown_history.json")
         self._recent_files = self._load_recent_files()
 
+    @property
+    def content(self):
+        if self._content is None:
+            self._content = self._content_source()
+        return self._content
+
+    @content.setter
+    def content(self, value):
+        self._content = value
+        self.revision += 1
+        self._blocks = None
+        self._dirty_lines = None
+
+    def bind_content_source(self, source, lines=None):
+        """绑定全文来源（如 QPlainTextEdit.toPlainText），之后 content 只在读取时生成。
+
+        lines 为同一内容按行读取的序列（支持 len()、下标和切分），供 blocks() 增量切分使用。
+        """
+        self._content_source = source
+        self._lines = lines
+
+    def apply_change(self, first_line, last_line, line_delta):
+        """记录一次编辑：新文本中 first_line..last_line 行有变化，总行数变化 line_delta"""
+        self.revision += 1
+        if self._content_source is not None:
+            self._content = None
+        if self._blocks is None:
+            return
+        self._dirty_lines = merge_line_changes(self._dirty_lines, first_line, last_line, line_delta)
+
+    def blocks(self):
+        """当前内容的顶层块（BlockList），只重新切分编辑过的区域，只读取涉及的行"""
+        if self._blocks is not None and self._dirty_lines is not None:
+            lines = self._lines if self._lines is not None else self.content.split("\n")
+            self._blocks = update_blocks(self._blocks, lines, *self._dirty_lines)
+        if self._blocks is None:
+            self._blocks = split_blocks(self.content)
+        self._dirty_lines = None
+        return self._blocks
+
     def load(self, file_path):
         if not file_path:
             return False
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 self.content = f.read()
+            self.set_disk_content(file_path, self._content)
             self.file_path = file_path
+            self._saving = {}
             self.has_file = True
             self.is_modified = False
             self._add_to_recent_files(file_path)
@@ -25,13 +216,34 @@ class MarkdownDocument:
         except Exception:
             return False
 
+    def set_disk_content(self, file_path, text, digest=None, state=None):
+        """记录 file_path 在磁盘上的内容为 text；text 为 None 时只记录哈希 digest。
+
+        state 为已知的 DiskState 时直接采用，不再重新读取文件状态。
+        """
+        self.disk_state = state or disk_state(file_path, digest or text_digest(text))
+        self.disk_text = text if _fits_disk_text(text, self.disk_state) else None
+
+    def finish_chunked_load(self, file_path, digest):
+        """分块载入（read_chunks）结束：正文已在编辑器中，content 改为按需从编辑器取出"""
+        self.set_disk_content(file_path, None, digest)
+        self._content = None if self._content_source is not None else ""
+        self.revision += 1
+        self._blocks = None
+        self._dirty_lines = None
+        self.file_path = file_path
+        self._saving = {}
+        self.has_file = True
+        self.is_modified = False
+        self._add_to_recent_files(file_path)
+
     def save(self, file_path=None):
         save_path = file_path or self.file_path
         if not save_path:
             return False
         try:
-            with open(save_path, 'w', encoding='utf-8') as f:
-                f.write(self.content)
+            write_atomic(save_path, self.content)
+            self.set_disk_content(save_path, self.content)
             self.file_path = save_path
             self.is_modified = False
             self.has_file = True
@@ -39,8 +251,53 @@ class MarkdownDocument:
         except Exception:
             return False
 
+    def begin_save(self, file_path=None):
+        """为异步保存取快照，返回 (路径, 内容, revision)；没有路径时返回 None。
+
+        另存为时 file_path 在 finish_save 确认写入成功后才切换。
+        """
+        save_path = file_path or self.file_path
+        if not save_path:
+            return None
+        content = self.content
+        self._saving[(save_path, self.revision)] = content
+        return save_path, content, self.revision
+
+    def finish_save(self, file_path, revision, state):
+        """异步保存完成：写入的正是当前内容时清除修改标记；state 为写入后的 DiskState。
+
+        磁盘上的内容就是保存的快照，即使之后又有编辑，也以快照作为 disk_text（三方合并的基准）。
+        """
+        content = self._pop_save_snapshot(file_path, revision)
+        if content is None:
+            # 保存开始后文档已被新建或重新载入
+            return False
+        if file_path != self.file_path:
+            # 另存为写入成功，文档改为关联新路径
+            self.file_path = file_path
+            self.has_file = True
+        self.disk_state = state
+        if revision == self.revision:
+            self.is_modified = False
+        self.disk_text = content if _fits_disk_text(content, state) else None
+        return not self.is_modified
+
+    def abort_save(self, file_path, revision):
+        """异步保存失败：丢弃快照，文档仍关联原来的路径"""
+        self._pop_save_snapshot(file_path, revision)
+
+    def _pop_save_snapshot(self, file_path, revision):
+        """取出 begin_save 记录的快照；同一路径上更早的快照已被顶替或写完，一并丢弃"""
+        content = self._saving.pop((file_path, revision), None)
+        for key in [key for key in self._saving if key[0] == file_path and key[1] < revision]:
+            del self._saving[key]
+        return content
+
     def new(self):
         self.file_path = None
+        self._saving = {}
+        self.disk_state = None
+        self.disk_text = None
         self.content = ""
         self.is_modified = False
         self.has_file = True
@@ -0,0 +1,259 @@
+import glob
+import json
+import os
+import uuid
+
+from models.document import write_atomic
+
+JOURNAL_DIR = os.path.join(os.path.expanduser("~"), ".fluentmarkdown_journals")
+# 旧版本所有实例共用的日志，启动时按无主日志处理
+_LEGACY_JOURNAL = os.path.join(os.path.expanduser("~"), ".fluentmarkdown_journal.jsonl")
+
+
+def _file_signature(file_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _try_lock(f):
+    """对打开的文件加非阻塞的排他锁；锁由其他进程（或本进程的其他句柄）持有时返回 False。
+
+    进程退出（包括崩溃）时系统自动释放锁，能加锁说明持有它的实例已经不在了。
+    """
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def _lock_path(journal_path):
+    return os.path.splitext(journal_path)[0] + ".lock"
+
+
+class EditJournal:
+    """未保存编辑的崩溃恢复日志。
+
+    文件为 JSON Lines：第一行是起点，其后每行一次编辑 [位置, 删除字符数, 插入文本]，
+    位置和字符数以 UTF-16 计（与 QTextDocument 一致）。起点通常只引用磁盘上的文件
+    {"f": 路径, "b": [大小, mtime]}，整理（checkpoint）后才写入全文 {"f": 路径, "c": 全文}。
+    编辑先缓存在内存中，由 flush() 批量追加并 fsync；启动时 recover() 重放恢复内容。
+
+    每个实例在 journal_dir 下有自己的日志 "<pid>-<随机串>.jsonl"，并在运行期间锁住同名的
+    .lock 文件。recover() 只接管锁已释放（所属实例已退出或崩溃）的日志，多开时互不影响。
+
+    Parameters
+    ----------
+    journal_dir : str
+        日志目录，默认 JOURNAL_DIR。
+    """
+
+    # 追加的编辑超过此字节数后，整理时重写为全文起点
+    COMPACT_SIZE = 1024 * 1024
+
+    def __init__(self, journal_dir=None):
+        self.journal_dir = journal_dir or JOURNAL_DIR
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.journal_path = os.path.join(self.journal_dir, name + ".jsonl")
+        self._lock = None
+        try:
+            os.makedirs(self.journal_dir, exist_ok=True)
+            self._lock = open(_lock_path(self.journal_path), "a+")
+            _try_lock(self._lock)
+        except OSError:
+            self._lock = None
+        # recover() 接管的无主日志：(日志路径, 已加锁的 .lock 文件)，处理完后删除
+        self._adopted = None
+        self._file = None
+        self._buffer = []
+        self._delta_size = 0
+        # 没有未保存修改时的内容来源：(文件路径, 文件签名)，路径为 None 表示空文档
+        self._base = (None, None)
+
+    def reset(self, file_path=None):
+        """内容与 file_path 在磁盘上的内容一致（或为空文档）：删除日志并以此为新的起点"""
+        self._close()
+        self._buffer = []
+        self._delta_size = 0
+        self._base = (file_path, _file_signature(file_path) if file_path else None)
+        self._release_adopted()
+        try:
+            os.remove(self.journal_path)
+        except OSError:
+            pass
+
+    def checkpoint(self, text, file_path=None):
+        """以当前全文重写日志"""
+        self._write_head({"f": file_path, "c": text})
+
+    def record(self, position, chars_removed, inserted):
+        if self._file is None:
+            file_path, signature = self._base
+            if file_path is None:
+                self._write_head({"f": None, "c": ""})
+            elif signature is not None:
+                self._write_head({"f": file_path, "b": signature})
+            if self._file is None:
+                return
+        line = json.dumps([position, chars_removed, inserted], ensure_ascii=False) + "\n"
+        self._buffer.append(line)
+        self._delta_size += len(line)
+
+    def flush(self):
+        """把缓存的编辑追加到日志并落盘"""
+        if self._file is None or not self._buffer:
+            return
+        try:
+            self._file.write("".join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except (OSError, ValueError):
+            pass
+        self._buffer = []
+
+    def needs_compaction(self):
+        return self._file is not None and self._delta_size > self.COMPACT_SIZE
+
+    def close(self):
+        """退出时调用：写完缓存的编辑并释放锁；没有未保存的内容时一并删除锁文件。
+
+        接管后尚未处理的无主日志原样保留，下次启动时再恢复。
+        """
+        self._close()
+        if self._adopted is not None:
+            lock = self._adopted[1]
+            self._adopted = None
+            if lock is not None:
+                lock.close()
+        if self._lock is None:
+            return
+        lock_path = self._lock.name
+        try:
+            self._lock.close()
+        except OSError:
+            pass
+        self._lock = None
+        if not os.path.exists(self.journal_path):
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def recover(self):
+        """扫描日志目录中的无主日志，从最新的开始重放，返回 (文件路径, 内容)；没有可恢复的返回 None。
+
+        无法重放（损坏、引用的文件已改变）的日志直接删除；返回的日志由本实例接管，
+        下一次 reset() 或 checkpoint() 后删除，其余无主日志留待以后恢复。
+        """
+        self._release_adopted()
+        for journal_path in self._orphans():
+            lock = None
+            lock_path = _lock_path(journal_path)
+            if journal_path != _LEGACY_JOURNAL:
+                try:
+                    lock = open(lock_path, "a+")
+                except OSError:
+                    continue
+                if not _try_lock(lock):
+                    # 所属实例仍在运行
+                    lock.close()
+                    continue
+            recovered = self._replay(journal_path)
+            self._adopted = (journal_path, lock)
+            if recovered is not None:
+                return recovered
+            self._release_adopted()
+        return None
+
+    def _orphans(self):
+        paths = glob.glob(os.path.join(glob.escape(self.journal_dir), "*.jsonl"))
+        paths = [path for path in paths if path != self.journal_path]
+        if os.path.isfile(_LEGACY_JOURNAL):
+            paths.append(_LEGACY_JOURNAL)
+
+        def mtime(path):
+            try:
+                return os.path.getmtime(path)
+            except OSError:
+                return 0
+        return sorted(paths, key=mtime, reverse=True)
+
+    def _release_adopted(self):
+        """删除已接管的无主日志及其锁文件"""
+        if self._adopted is None:
+            return
+        journal_path, lock = self._adopted
+        self._adopted = None
+        paths = [journal_path]
+        if lock is not None:
+            # Windows 上不能删除打开中的文件，先关闭（释放锁）再删除
+            lock.close()
+            paths.append(lock.name)
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    @staticmethod
+    def _replay(journal_path):
+        """重放一个日志文件，返回 (文件路径, 内容)；日志损坏或引用的文件已改变时返回 None"""
+        try:
+            with open(journal_path, "r", encoding="utf-8", errors="surrogatepass", newline="\n") as f:
+                lines = f.read().split("\n")
+            head = json.loads(lines[0])
+            file_path = head["f"]
+            if "c" in head:
+                text = head["c"]
+            elif _file_signature(file_path) == head["b"]:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    text = f.read()
+            else:
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+        # 在 UTF-16 编码上按位置替换，避免逐次换算码点下标
+        data = bytearray(text.encode("utf-16-le", "surrogatepass"))
+        for line in lines[1:]:
+            try:
+                position, chars_removed, inserted = json.loads(line)
+            except ValueError:
+                # 末尾可能有崩溃时写了一半的行
+                break
+            start = position * 2
+            if start > len(data):
+                break
+            data[start:start + chars_removed * 2] = inserted.encode("utf-16-le", "surrogatepass")
+        return file_path, data.decode("utf-16-le", "surrogatepass")
+
+    def _write_head(self, head):
+        self._close()
+        self._release_adopted()
+        self._buffer = []
+        self._delta_size = 0
+        try:
+            # 全文中可能有落单的代理项，起点按 ASCII 转义写入
+            write_atomic(self.journal_path, json.dumps(head) + "\n")
+            # 编辑可能切开代理对，追加时允许写入落单的代理项
+            self._file = open(self.journal_path, "a", encoding="utf-8", errors="surrogatepass", newline="\n")
+        except (OSError, ValueError):
+            self._file = None
+
+    def _close(self):
+        if self._file is not None:
+            self.flush()
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
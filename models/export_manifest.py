@@ -0,0 +1,91 @@
+"""批量渲染/导出的源文件查找和增量清单"""
+
+import hashlib
+import json
+import os
+
+from models.document import write_atomic
+
+MARKDOWN_SUFFIXES = (".md", ".markdown")
+MANIFEST_NAME = ".fmd_manifest.json"
+# 渲染结果的格式变化时递增，使旧清单整体失效
+MANIFEST_VERSION = 2
+
+
+def find_sources(source):
+    """返回 [(源文件, 相对路径)]，按相对路径排序；跳过隐藏目录"""
+    if os.path.isfile(source):
+        return [(source, os.path.basename(source))]
+    found = []
+    for root, dirs, files in os.walk(source):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for name in files:
+            if name.lower().endswith(MARKDOWN_SUFFIXES):
+                path = os.path.join(root, name)
+                found.append((path, os.path.relpath(path, source)))
+    found.sort(key=lambda item: item[1])
+    return found
+
+
+def output_path(output_dir, rel_path, ext):
+    """源文件相对路径对应的输出文件，保持目录结构"""
+    return os.path.join(output_dir, os.path.splitext(rel_path)[0] + ext)
+
+
+def decode_source(data):
+    """源文件字节转为编辑器中的文本：UTF-8（可带 BOM），换行统一为 \\n"""
+    return data.decode("utf-8-sig").replace("\r\n", "\n").replace("\r", "\n")
+
+
+def source_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def options_key(theme, is_dark, font_size):
+    return f"{MANIFEST_VERSION}:{theme}:{int(is_dark)}:{font_size}"
+
+
+class ExportManifest:
+    """输出目录下的 .fmd_manifest.json：每个输出文件 -> [源文件哈希, 渲染选项]。
+
+    源文件内容和渲染选项（主题、字号等）都与上次一致且输出文件仍在时可以跳过。
+    命令行渲染和界面中的批量导出共用同一份清单。
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self._path = os.path.join(output_dir, MANIFEST_NAME)
+        self._entries = {}
+        try:
+            with open(self._path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self._entries = entries
+        except (OSError, ValueError):
+            pass
+
+    def _key(self, output_file):
+        return os.path.relpath(output_file, self.output_dir).replace(os.sep, "/")
+
+    def known_digest(self, output_file, options):
+        """output_file 上次由哪个源文件哈希生成；渲染选项不同或没有记录时返回 None"""
+        entry = self._entries.get(self._key(output_file))
+        if isinstance(entry, list) and len(entry) == 2 and entry[1] == options:
+            return entry[0]
+        return None
+
+    def record(self, output_file, digest, options):
+        self._entries[self._key(output_file)] = [digest, options]
+
+    def forget(self, output_file):
+        self._entries.pop(self._key(output_file), None)
+
+    def save(self):
+        os.makedirs(self.output_dir, exist_ok=True)
+        write_atomic(self._path, json.dumps(self._entries, ensure_ascii=False, indent=1))
+
+
+def is_unchanged(data, output_file, known_digest):
+    """返回 (源文件哈希, 是否可跳过)"""
+    digest = source_digest(data)
+    return digest, digest == known_digest and os.path.exists(output_file)
@@ -1,5 +1,33 @@
 """预览 HTML 模板构建器"""
 
+import html
+import os
+import sys
+
+
+def vendor_dir():
+    """fetch_assets.py 下载的前端资源目录（打包后位于 _MEIPASS 下）"""
+    if getattr(sys, 'frozen', False):
+        return os.path.join(sys._MEIPASS, "resources", "vendor")
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "vendor")
+
+
+# 预览页从 fmd-asset:// 加载的文件，缺一个就整体回退到 CDN；build.py 打包前也据此检查
+REQUIRED_ASSETS = (
+    "highlight/highlight.min.js",
+    "highlight/styles/github.min.css",
+    "highlight/styles/github-dark.min.css",
+    "katex/katex.min.js",
+    "katex/katex.min.css",
+    "mermaid/mermaid.min.js",
+)
+
+
+def missing_assets():
+    """vendor 目录中缺少的 REQUIRED_ASSETS"""
+    base = vendor_dir()
+    return [rel for rel in REQUIRED_ASSETS if not os.path.isfile(os.path.join(base, rel))]
+
 
 class PreviewHtmlBuilder:
     """将 Markdown 渲染后的 HTML 包装成完整的预览页面。
@@ -14,17 +42,45 @@ class PreviewHtmlBuilder:
         是否暗色模式。
     border_radius : int
         预览容器圆角（px），默认 8。
+    local_assets : bool
+        是否从 fmd-asset:// 加载本地打包的 highlight.js / KaTeX / Mermaid，
+        否则使用 CDN。导出到应用外使用的页面应保持 False。
+    bridge : bool
+        是否加载 qwebchannel.js 并连接编辑器的 previewBridge，只用于应用内预览。
+    base_href : str
+        页面中相对路径（图片、链接）的基准地址，输出为 <base id="previewBase">；
+        页面不是从文档目录载入时需要。
     """
 
     HIGHLIGHT_CDN = "https://cdnjs.cloudflare.com/ajax/libs/highlight.js/11.9.0"
     MERMAID_CDN = "https://cdn.jsdelivr.net/npm/mermaid@10/dist/mermaid.min.js"
     KATEX_CDN = "https://cdn.jsdelivr.net/npm/katex@0.16.11/dist"
 
-    def __init__(self, theme_styles, font_size=16, is_dark=False, border_radius=8):
+    HIGHLIGHT_LOCAL = "fmd-asset://highlight"
+    MERMAID_LOCAL = "fmd-asset://mermaid/mermaid.min.js"
+    KATEX_LOCAL = "fmd-asset://katex"
+
+    # 虚拟化预览：首屏直接输出的估算高度，以及块进入/离开 DOM 的视口外边距
+    VIRTUAL_EAGER_HEIGHT = 3000
+    VIRTUAL_LOAD_MARGIN = 1500
+    VIRTUAL_RELEASE_MARGIN = 6000
+
+    def __init__(self, theme_styles, font_size=16, is_dark=False, border_radius=8, local_assets=False,
+                 bridge=False, base_href=None):
         self.ts = theme_styles
+        self.bridge = bridge
+        self.base_href = base_href
         self.font_size = font_size
         self.is_dark = is_dark
         self.radius = border_radius
+        if local_assets:
+            self.highlight_base, self.mermaid_url, self.katex_base = (
+                self.HIGHLIGHT_LOCAL, self.MERMAID_LOCAL, self.KATEX_LOCAL
+            )
+        else:
+            self.highlight_base, self.mermaid_url, self.katex_base = (
+                self.HIGHLIGHT_CDN, self.MERMAID_CDN, self.KATEX_CDN
+            )
 
     # ------------------------------------------------------------------
     # 公开 API
@@ -39,38 +95,89 @@ class PreviewHtmlBuilder:
             + "\n</html>"
         )
 
+    def build_static(self, body_html, css):
+        """构建不含脚本的静态页面，用于导出独立 HTML；css 由调用方裁剪后传入"""
+        return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1.0">
+<style>
+{css}
+</style>
+</head>
+<body>
+  <div class="content">
+    <div class="scroll">
+      {body_html}
+    </div>
+  </div>
+</body>
+</html>
+"""
+
+    def stylesheets(self):
+        """页面引用的第三方样式表：[(resources/vendor 下的相对路径, 实际 URL)]"""
+        hljs_theme = "github-dark" if self.is_dark else "github"
+        return [
+            (f"highlight/styles/{hljs_theme}.min.css", f"{self.highlight_base}/styles/{hljs_theme}.min.css"),
+            ("katex/katex.min.css", f"{self.katex_base}/katex.min.css"),
+        ]
+
+    def css(self, static=False):
+        """页面自身的样式；static 为 True 时正文随内容展开，不使用预览中的滚动容器"""
+        return "\n".join((
+            self._css_base(static),
+            self._css_typography(),
+            self._css_code(),
+            self._css_misc(),
+            self._css_outline(),
+        ))
+
+    def build_virtual(self, body_html):
+        """构建虚拟化预览页面，用于超大文档。
+
+        body_html 中只有开头的块带内容，其余块是按估算高度占位的空 div
+        （见 EditorController.render_preview）。占位块接近视口时页面经 previewBridge
+        按块 id 取回内容再插入并装饰，远离视口后换回占位，页面本身不含其余块的 HTML。
+        """
+        return (
+            self._head()
+            + self._body(body_html, virtual=True)
+            + self._scripts()
+            + "\n</html>"
+        )
+
     # ------------------------------------------------------------------
     # 私有：各段落构建
     # ------------------------------------------------------------------
 
     def _head(self):
-        ts, dark = self.ts, self.is_dark
-        hljs_theme = "github-dark" if dark else "github"
+        links = "".join(f'<link rel="stylesheet" href="{url}">\n' for _, url in self.stylesheets())
+        bridge_script = '<script src="qrc:///qtwebchannel/qwebchannel.js"></script>\n' if self.bridge else ""
+        base = ""
+        if self.base_href:
+            base = f'<base id="previewBase" href="{html.escape(self.base_href)}">\n'
         return f"""<!DOCTYPE html>
 <html>
 <head>
-<meta charset="utf-8">
+{base}<meta charset="utf-8">
 <meta name="viewport" content="width=device-width, initial-scale=1.0">
-<link rel="stylesheet" href="{self.HIGHLIGHT_CDN}/styles/{hljs_theme}.min.css">
-<link rel="stylesheet" href="{self.KATEX_CDN}/katex.min.css">
-<script>
+{links}<script>
   if (typeof structuredClone === "undefined") {{
     window.structuredClone = function(obj) {{ return JSON.parse(JSON.stringify(obj)); }};
   }}
 </script>
-<script defer src="{self.HIGHLIGHT_CDN}/highlight.min.js"></script>
-<script defer src="{self.MERMAID_CDN}"></script>
-<script defer src="{self.KATEX_CDN}/katex.min.js"></script>
-<style>
-{self._css_base()}
-{self._css_typography()}
-{self._css_code()}
-{self._css_misc()}
-{self._css_outline()}
+<script defer src="{self.highlight_base}/highlight.min.js"></script>
+<script defer src="{self.mermaid_url}"></script>
+<script defer src="{self.katex_base}/katex.min.js"></script>
+{bridge_script}<style>
+{self.css()}
 </style>
 </head>"""
 
-    def _body(self, body_html):
+    def _body(self, body_html, virtual=False):
+        scroll_attrs = ' data-virtual="true"' if virtual else ""
         return f"""
 <body>
   <button class="outline-toggle" id="outlineToggle" title="大纲">☰</button>
@@ -79,7 +186,7 @@ class PreviewHtmlBuilder:
     <div id="outlineList"></div>
   </div>
   <div class="content">
-    <div class="scroll">
+    <div class="scroll"{scroll_attrs}>
       {body_html}
     </div>
   </div>
@@ -90,9 +197,219 @@ class PreviewHtmlBuilder:
         return f"""
 <script>
   document.addEventListener("DOMContentLoaded", function() {{
+    initVirtualPreview();
     decoratePreviewContent(document);
+    initPreviewBridge();
   }});
 
+  // ---- 与编辑器通信：QWebChannel 上的 previewBridge，导出等场景下不存在 ----
+  var previewBridge = null;
+
+  function initPreviewBridge() {{
+    if (typeof QWebChannel === "undefined" || typeof qt === "undefined") return;
+    new QWebChannel(qt.webChannelTransport, function(channel) {{
+      previewBridge = channel.objects.previewBridge;
+      previewBridge.scrollRequested.connect(syncScrollToLine);
+      var el = document.querySelector(".scroll");
+      var scrollPending = false;
+      if (el) {{
+        el.addEventListener("scroll", function() {{
+          if (scrollPending) return;
+          scrollPending = true;
+          requestAnimationFrame(function() {{
+            scrollPending = false;
+            previewBridge.previewScrolled(offsetToSourceLine(el.scrollTop));
+          }});
+        }});
+      }}
+      // 首屏内容已装饰完毕，编辑器可以开始发送增量更新
+      previewBridge.pageReady();
+      // 通道建立前就已进入视口附近的占位块，此时才能取回内容
+      loadVisibleBlocks();
+    }});
+  }}
+
+  // ---- 虚拟化预览：页面只含首屏的块，占位块接近视口时按 id 向编辑器取回内容再插入并装饰 ----
+  var virtualPreview = {{ enabled: false, requested: {{}}, queue: [], loadObserver: null, releaseObserver: null }};
+
+  function initVirtualPreview() {{
+    var root = document.querySelector(".scroll");
+    if (!root || !root.hasAttribute("data-virtual")) return;
+    virtualPreview.enabled = true;
+    virtualPreview.loadObserver = new IntersectionObserver(function(entries) {{
+      entries.forEach(function(entry) {{
+        if (entry.isIntersecting) materializeBlock(entry.target);
+      }});
+    }}, {{ root: root, rootMargin: "{self.VIRTUAL_LOAD_MARGIN}px 0px" }});
+    virtualPreview.releaseObserver = new IntersectionObserver(function(entries) {{
+      entries.forEach(function(entry) {{
+        if (!entry.isIntersecting) releaseBlock(entry.target);
+      }});
+    }}, {{ root: root, rootMargin: "{self.VIRTUAL_RELEASE_MARGIN}px 0px" }});
+    Array.prototype.forEach.call(root.children, watchBlock);
+  }}
+
+  function watchBlock(node) {{
+    if (!virtualPreview.enabled) return;
+    if (node.classList.contains("md-placeholder")) {{
+      virtualPreview.loadObserver.observe(node);
+    }} else {{
+      virtualPreview.releaseObserver.observe(node);
+    }}
+  }}
+
+  function htmlToNode(html) {{
+    var tpl = document.createElement("template");
+    tpl.innerHTML = html;
+    return tpl.content.firstElementChild;
+  }}
+
+  function findBlock(id) {{
+    return document.querySelector('.scroll > [data-block="' + id + '"]');
+  }}
+
+  function makePlaceholder(id, height, sourceLine, headings) {{
+    var ph = document.createElement("div");
+    ph.className = "md-block md-placeholder";
+    ph.setAttribute("data-block", id);
+    ph.setAttribute("data-source-line", sourceLine);
+    if (headings.length > 0) ph.setAttribute("data-headings", JSON.stringify(headings));
+    ph.style.height = height + "px";
+    return ph;
+  }}
+
+  // 占位块换成内容；未给出 html 时先向编辑器请求，取回后再插入
+  function materializeBlock(ph, html) {{
+    if (!ph.classList.contains("md-placeholder") || !ph.parentNode) return ph;
+    if (html === undefined) {{
+      requestBlock(ph.getAttribute("data-block"));
+      return ph;
+    }}
+    virtualPreview.loadObserver.unobserve(ph);
+    var node = htmlToNode(html);
+    // 块移动后占位块上的行号由增量更新改写过，以它为准
+    node.setAttribute("data-source-line", ph.getAttribute("data-source-line"));
+    ph.replaceWith(node);
+    decoratePreviewContent(node);
+    virtualPreview.releaseObserver.observe(node);
+    sourceMap.dirty = true;
+    return node;
+  }}
+
+  // 同一帧内的请求合并为一次；通道尚未建立时由 loadVisibleBlocks 补上
+  function requestBlock(id) {{
+    if (!previewBridge || virtualPreview.requested[id]) return;
+    virtualPreview.requested[id] = true;
+    if (virtualPreview.queue.length === 0) {{
+      requestAnimationFrame(function() {{
+        var ids = virtualPreview.queue;
+        virtualPreview.queue = [];
+        previewBridge.requestBlocks(ids, function(data) {{ receiveBlocks(ids, data); }});
+      }});
+    }}
+    virtualPreview.queue.push(id);
+  }}
+
+  // 编辑器不再认识的 id（块已被更新替换）不在返回结果中，对应占位块等待下一次增量更新
+  function receiveBlocks(ids, data) {{
+    var blocks = JSON.parse(data || "{{}}");
+    ids.forEach(function(id) {{
+      delete virtualPreview.requested[id];
+      var ph = findBlock(id);
+      if (ph && blocks[id] !== undefined && isNearViewport(ph)) materializeBlock(ph, blocks[id]);
+    }});
+  }}
+
+  function loadVisibleBlocks() {{
+    if (!virtualPreview.enabled) return;
+    var near = Array.prototype.filter.call(document.querySelectorAll(".scroll > .md-placeholder"), isNearViewport);
+    near.forEach(function(ph) {{ materializeBlock(ph); }});
+  }}
+
+  function headingsOf(node) {{
+    return Array.prototype.map.call(node.querySelectorAll("h1, h2, h3, h4"), function(h) {{
+      return [parseInt(h.tagName.charAt(1)), h.textContent];
+    }});
+  }}
+
+  // 内容不在页面中保留，再次接近视口时重新向编辑器取回（编辑器端命中块缓存）
+  function releaseBlock(node) {{
+    if (node.classList.contains("md-placeholder") || !node.parentNode) return;
+    virtualPreview.releaseObserver.unobserve(node);
+    var ph = makePlaceholder(
+      node.getAttribute("data-block"), node.offsetHeight, node.getAttribute("data-source-line"), headingsOf(node)
+    );
+    node.replaceWith(ph);
+    virtualPreview.loadObserver.observe(ph);
+    sourceMap.dirty = true;
+  }}
+
+  function isNearViewport(node) {{
+    var root = document.querySelector(".scroll");
+    var rect = node.getBoundingClientRect(), view = root.getBoundingClientRect();
+    var margin = {self.VIRTUAL_LOAD_MARGIN};
+    return rect.bottom >= view.top - margin && rect.top <= view.bottom + margin;
+  }}
+
+  // 预览区完整 HTML，供复制富文本使用；虚拟化时占位块输出为 <!--fmd-block:id-->，由编辑器填回
+  function getPreviewHtml() {{
+    var root = document.querySelector(".scroll");
+    if (!root) return "";
+    if (!virtualPreview.enabled) return root.innerHTML;
+    return Array.prototype.map.call(root.children, function(node) {{
+      if (node.classList.contains("md-placeholder")) {{
+        return "<!--fmd-block:" + node.getAttribute("data-block") + "-->";
+      }}
+      return node.outerHTML;
+    }}).join("\\n");
+  }}
+
+  // Mermaid SVG / KaTeX HTML 渲染缓存：源码（含主题）相同时直接插入上次的结果，不再重新排版。
+  // 页面内存放在 Map 中，并镜像到 sessionStorage，整页重载（切换字号等）后仍可复用。
+  var renderCache = {{
+    memory: new Map(),
+    get: function(kind, source) {{
+      var key = "fmd:" + kind + ":" + source;
+      if (this.memory.has(key)) return this.memory.get(key);
+      try {{
+        var value = window.sessionStorage.getItem(key);
+        if (value !== null) {{ this.memory.set(key, value); return value; }}
+      }} catch(e) {{}}
+      return null;
+    }},
+    set: function(kind, source, value) {{
+      var key = "fmd:" + kind + ":" + source;
+      this.memory.set(key, value);
+      try {{ window.sessionStorage.setItem(key, value); }} catch(e) {{}}
+    }}
+  }};
+
+  // 尚未完成的异步渲染（Mermaid）数，导出 PDF 时轮询 previewSettled() 等待页面排版完成
+  var pendingRenders = 0;
+
+  function previewSettled() {{
+    if (pendingRenders > 0) return false;
+    for (var i = 0; i < document.images.length; i++) {{
+      if (!document.images[i].complete) return false;
+    }}
+    return true;
+  }}
+
+  function renderMath(el, displayMode) {{
+    var source = el.textContent;
+    var kind = displayMode ? "katex-block" : "katex-inline";
+    var cached = renderCache.get(kind, source);
+    if (cached !== null) {{
+      el.innerHTML = cached;
+      return;
+    }}
+    if (typeof katex === "undefined") return;
+    try {{
+      katex.render(source, el, {{ displayMode: displayMode, throwOnError: false }});
+      renderCache.set(kind, source, el.innerHTML);
+    }} catch(e) {{}}
+  }}
+
   function decoratePreviewContent(root) {{
     root = root || document;
 
@@ -107,34 +424,41 @@ class PreviewHtmlBuilder:
 
     var mermaidBlocks = root.querySelectorAll("pre code.language-mermaid");
     if (mermaidBlocks.length > 0) {{
-      try {{
-        mermaid.initialize({{ startOnLoad: false, theme: "{mermaid_theme}" }});
-        mermaidBlocks.forEach(function(block, idx) {{
-          var pre = block.parentElement;
-          var container = document.createElement("div");
-          container.className = "mermaid";
-          container.id = "mermaid-" + Date.now() + "-" + idx;
-          container.textContent = block.textContent;
-          pre.replaceWith(container);
-        }});
-        mermaid.run();
-      }} catch(e) {{ console.warn("Mermaid init failed:", e); }}
-    }}
-
-    if (typeof katex !== "undefined") {{
-      root.querySelectorAll(".math-block").forEach(function(el) {{
-        try {{ katex.render(el.textContent, el, {{ displayMode: true, throwOnError: false }}); }} catch(e) {{}}
-      }});
-      root.querySelectorAll(".math-inline").forEach(function(el) {{
-        try {{ katex.render(el.textContent, el, {{ displayMode: false, throwOnError: false }}); }} catch(e) {{}}
+      var mermaidReady = typeof mermaid !== "undefined";
+      if (mermaidReady) {{
+        try {{
+          mermaid.initialize({{ startOnLoad: false, theme: "{mermaid_theme}" }});
+        }} catch(e) {{ mermaidReady = false; console.warn("Mermaid init failed:", e); }}
+      }}
+      mermaidBlocks.forEach(function(block, idx) {{
+        var source = block.textContent;
+        var cached = renderCache.get("mermaid-{mermaid_theme}", source);
+        if (cached === null && !mermaidReady) return;
+        var container = document.createElement("div");
+        container.className = "mermaid";
+        container.id = "mermaid-" + Date.now() + "-" + idx;
+        block.parentElement.replaceWith(container);
+        if (cached !== null) {{
+          container.innerHTML = cached;
+          return;
+        }}
+        container.textContent = source;
+        pendingRenders++;
+        mermaid.render(container.id + "-svg", source).then(function(result) {{
+          container.innerHTML = result.svg;
+          if (result.bindFunctions) result.bindFunctions(container);
+          renderCache.set("mermaid-{mermaid_theme}", source, result.svg);
+          pendingRenders--;
+        }}).catch(function(e) {{ pendingRenders--; console.warn("Mermaid render failed:", e); }});
       }});
     }}
 
+    root.querySelectorAll(".math-block").forEach(function(el) {{ renderMath(el, true); }});
+    root.querySelectorAll(".math-inline").forEach(function(el) {{ renderMath(el, false); }});
+
     root.querySelectorAll(".task-checkbox").forEach(function(cb) {{
       cb.addEventListener("change", function() {{
-        var idx = cb.getAttribute("data-task-index");
-        var checked = cb.checked ? "1" : "0";
-        window.location.href = "task-toggle://" + idx + "/" + checked;
+        if (previewBridge) previewBridge.toggleTask(parseInt(cb.getAttribute("data-task-index"), 10), cb.checked);
       }});
     }});
 
@@ -183,6 +507,83 @@ class PreviewHtmlBuilder:
     }}
   }}
 
+  // 按块 id 增量更新：order 为新的块顺序，blocks 只包含页面上还没有的块，
+  // lines 为各块的起始源码行（块前面插删行后，保留的块行号也会变）。
+  // 已有的块原样保留（不再重新高亮/渲染公式和图表），只对新插入的块做装饰。
+  // 返回 false 表示页面状态与调用方不一致，需要整页重载。
+  function patchMarkdownBlocks(order, blocks, keepScroll, lines) {{
+    var el = document.querySelector(".scroll");
+    if (!el) return false;
+    var existing = {{}};
+    Array.prototype.slice.call(el.children).forEach(function(node) {{
+      var id = node.getAttribute("data-block");
+      if (id) {{ existing[id] = node; }} else {{ node.remove(); }}
+    }});
+    for (var i = 0; i < order.length; i++) {{
+      if (!existing[order[i]] && blocks[order[i]] === undefined) return false;
+    }}
+
+    var fresh = [];
+    var cursor = el.firstElementChild;
+    order.forEach(function(id, i) {{
+      var node = existing[id];
+      if (node) {{
+        delete existing[id];
+        if (lines && node.getAttribute("data-source-line") !== String(lines[i])) {{
+          node.setAttribute("data-source-line", lines[i]);
+        }}
+      }} else {{
+        node = htmlToNode(blocks[id]);
+        if (lines) node.setAttribute("data-source-line", lines[i]);
+        fresh.push(node);
+      }}
+      if (node === cursor) {{
+        cursor = cursor.nextElementSibling;
+      }} else {{
+        el.insertBefore(node, cursor);
+      }}
+    }});
+    Object.keys(existing).forEach(function(id) {{
+      if (virtualPreview.enabled) {{
+        virtualPreview.loadObserver.unobserve(existing[id]);
+        virtualPreview.releaseObserver.unobserve(existing[id]);
+      }}
+      existing[id].remove();
+    }});
+
+    if (virtualPreview.enabled) {{
+      // 虚拟化时新块都以占位发来，只有落在视口附近的才立即取回内容
+      var near = fresh.filter(isNearViewport);
+      fresh.forEach(watchBlock);
+      near.forEach(function(ph) {{ materializeBlock(ph); }});
+    }} else {{
+      fresh.forEach(function(node) {{ decoratePreviewContent(node); }});
+    }}
+    if (fresh.length > 0 && document.body.classList.contains("has-outline")) {{
+      buildOutline();
+    }}
+    sourceMap.dirty = true;
+    if (!keepScroll) {{
+      el.scrollTop = 0;
+    }}
+    return true;
+  }}
+
+  // 预览中切换任务后，编辑器只改了一个字符：块内容已由复选框本身反映，只需换成新 id
+  function rekeyMarkdownBlock(oldId, newId) {{
+    var el = document.querySelector(".scroll");
+    if (!el) return false;
+    var node = null;
+    Array.prototype.some.call(el.children, function(child) {{
+      if (child.getAttribute("data-block") !== oldId) return false;
+      node = child;
+      return true;
+    }});
+    if (!node) return false;
+    node.setAttribute("data-block", newId);
+    return true;
+  }}
+
   function updatePreviewBase(href) {{
     var base = document.getElementById("previewBase");
     if (!base) {{
@@ -193,26 +594,119 @@ class PreviewHtmlBuilder:
     base.setAttribute("href", href || "");
   }}
 
-  function syncScrollTo(ratio) {{
-    var el = document.querySelector(".scroll");
-    if (el) {{ el.scrollTop = (el.scrollHeight - el.clientHeight) * ratio; }}
+  // ---- 滚动同步：按块起始源码行与块在预览中的偏移建有序表，二分查找后在相邻块间插值 ----
+  var sourceMap = {{ lines: [], tops: [], height: -1, dirty: true }};
+
+  function buildSourceMap() {{
+    var root = document.querySelector(".scroll");
+    // 图片、图表加载等导致的高度变化没有显式通知，以总高度变化为准重建
+    if (!sourceMap.dirty && sourceMap.height === root.scrollHeight) return;
+    var base = root.getBoundingClientRect().top - root.scrollTop;
+    var lines = [], tops = [];
+    Array.prototype.forEach.call(root.children, function(node) {{
+      var line = node.getAttribute("data-source-line");
+      if (line === null) return;
+      line = parseInt(line, 10);
+      if (lines.length > 0 && line <= lines[lines.length - 1]) return;
+      lines.push(line);
+      tops.push(node.getBoundingClientRect().top - base);
+    }});
+    sourceMap.lines = lines;
+    sourceMap.tops = tops;
+    sourceMap.height = root.scrollHeight;
+    sourceMap.dirty = false;
+  }}
+
+  // 有序数组中最后一个 <= value 的下标，没有时返回 -1
+  function bisectRight(values, value) {{
+    var lo = 0, hi = values.length;
+    while (lo < hi) {{
+      var mid = (lo + hi) >> 1;
+      if (values[mid] <= value) {{ lo = mid + 1; }} else {{ hi = mid; }}
+    }}
+    return lo - 1;
+  }}
+
+  function sourceLineToOffset(line) {{
+    buildSourceMap();
+    var lines = sourceMap.lines, tops = sourceMap.tops;
+    var i = bisectRight(lines, line);
+    if (i < 0) return 0;
+    if (i + 1 >= lines.length) return tops[i];
+    return tops[i] + (tops[i + 1] - tops[i]) * (line - lines[i]) / (lines[i + 1] - lines[i]);
+  }}
+
+  function offsetToSourceLine(top) {{
+    buildSourceMap();
+    var lines = sourceMap.lines, tops = sourceMap.tops;
+    var i = bisectRight(tops, top);
+    if (i < 0) return 0;
+    if (i + 1 >= lines.length) return lines[i];
+    var span = tops[i + 1] - tops[i];
+    return lines[i] + (span > 0 ? (lines[i + 1] - lines[i]) * (top - tops[i]) / span : 0);
+  }}
+
+  // 编辑器顶部所在的源码行（可带小数）；同一帧内的多次请求只执行最后一次
+  var pendingScrollLine = null;
+
+  function syncScrollToLine(line) {{
+    if (pendingScrollLine === null) {{
+      requestAnimationFrame(function() {{
+        var el = document.querySelector(".scroll");
+        var target = pendingScrollLine;
+        pendingScrollLine = null;
+        if (!el) return;
+        var maxScroll = el.scrollHeight - el.clientHeight;
+        el.scrollTop = target < 0 ? maxScroll : Math.min(maxScroll, sourceLineToOffset(target));
+      }});
+    }}
+    pendingScrollLine = line;
+  }}
+
+  // 收集标题；虚拟化时未插入 DOM 的块取占位块上记录的标题
+  function collectHeadings() {{
+    var root = document.querySelector(".scroll");
+    var result = [];
+    if (!root) return result;
+    Array.prototype.forEach.call(root.children, function(node) {{
+      if (node.classList.contains("md-placeholder")) {{
+        var headings = JSON.parse(node.getAttribute("data-headings") || "[]");
+        headings.forEach(function(h, ordinal) {{
+          result.push({{ level: h[0], text: h[1], block: node.getAttribute("data-block"), ordinal: ordinal }});
+        }});
+      }} else {{
+        node.querySelectorAll("h1, h2, h3, h4").forEach(function(h) {{
+          result.push({{ level: parseInt(h.tagName.charAt(1)), text: h.textContent, element: h }});
+        }});
+      }}
+    }});
+    return result;
+  }}
+
+  // 标题所在块仍是占位时先滚到占位处，内容取回后由 loadObserver 插入
+  function resolveHeading(item) {{
+    if (item.element) return item.element;
+    var node = findBlock(item.block);
+    if (!node) return document.querySelector(".scroll");
+    node = materializeBlock(node);
+    return node.querySelectorAll("h1, h2, h3, h4")[item.ordinal] || node;
   }}
 
   function buildOutline() {{
-    var headings = document.querySelectorAll(".scroll h1, .scroll h2, .scroll h3, .scroll h4");
+    var headings = collectHeadings();
     var list = document.getElementById("outlineList");
     if (!list || headings.length === 0) return;
     list.innerHTML = "";
-    headings.forEach(function(h, idx) {{
-      h.id = h.id || ("heading-" + idx);
-      var level = parseInt(h.tagName.charAt(1));
+    headings.forEach(function(item, idx) {{
+      if (item.element) item.element.id = item.element.id || ("heading-" + idx);
       var a = document.createElement("a");
-      a.className = "outline-item level-" + level;
-      a.textContent = h.textContent;
-      a.href = "#" + h.id;
+      a.className = "outline-item level-" + item.level;
+      a.textContent = item.text;
+      a.href = "#" + (item.element ? item.element.id : "");
       a.addEventListener("click", function(e) {{
         e.preventDefault();
-        h.scrollIntoView({{ behavior: "smooth", block: "start" }});
+        resolveHeading(item).scrollIntoView({{ behavior: "smooth", block: "start" }});
+        if (previewBridge) previewBridge.outlineClicked(idx, item.text);
         document.querySelectorAll(".outline-item.active").forEach(function(el) {{ el.classList.remove("active"); }});
         a.classList.add("active");
       }});
@@ -236,14 +730,34 @@ class PreviewHtmlBuilder:
     if (panel && panel.classList.contains("visible")) {{ hideOutline(); }} else {{ showOutline(); }}
   }}
   document.getElementById("outlineToggle").addEventListener("click", toggleOutline);
+
+  // 页面可能带 <base> 指向文档目录，正文中的 #锚点 链接需在页内跳转，不能按 base 解析
+  document.addEventListener("click", function(e) {{
+    var a = e.target.closest ? e.target.closest('a[href^="#"]') : null;
+    if (!a || a.classList.contains("outline-item")) return;
+    e.preventDefault();
+    var name = decodeURIComponent(a.getAttribute("href").slice(1));
+    var target = document.getElementById(name) || document.getElementsByName(name)[0];
+    if (target) target.scrollIntoView({{ block: "start" }});
+  }});
 </script>"""
 
     # ------------------------------------------------------------------
     # CSS 片段
     # ------------------------------------------------------------------
 
-    def _css_base(self):
+    def _css_base(self, static=False):
         ts, r = self.ts, self.radius
+        if static:
+            return f"""
+  html, body {{
+    margin: 0; padding: 0;
+    color: {ts["text_color"]};
+    font-family: -apple-system, BlinkMacSystemFont, "PingFang SC", "Microsoft YaHei", sans-serif;
+    font-size: {self.font_size}px;
+  }}
+  .content {{ background: {ts["background_color"]}; min-height: 100vh; }}
+  .scroll {{ max-width: 960px; margin: 0 auto; box-sizing: border-box; padding: 20px 20px 36px 20px; }}"""
         return f"""
   html, body {{
     margin: 0; padding: 0; height: 100%; overflow: hidden;
@@ -307,7 +821,8 @@ class PreviewHtmlBuilder:
     vertical-align: middle; cursor: pointer;
     accent-color: #0078d4;
   }
-  li:has(.task-checkbox) { list-style: none; margin-left: -20px; }"""
+  li:has(.task-checkbox) { list-style: none; margin-left: -20px; }
+  .md-placeholder { contain: strict; }"""
 
     def _d(self, dark_val, light_val):
         """暗色/亮色快捷选择"""
@@ -0,0 +1,291 @@
+"""Markdown 顶层块切分
+
+把文档按空行切成互不依赖的顶层块（段落、围栏代码、表格、列表、公式等），
+每块带起始行号和内容哈希，供渲染缓存和增量更新使用。
+
+切分宁可合并也不拆错：无法确定能否拆开的地方（列表续行、缩进内容、
+HTML 块、未闭合的围栏）一律并入同一块，保证逐块渲染与整篇渲染结果一致。
+"""
+
+import hashlib
+import re
+from collections import Counter, namedtuple
+
+
+# definitions 为块内处在顶层的链接引用 / 缩写定义（不含围栏、公式、HTML 中的）；
+# raw_html 表示块含块级 HTML 或注释，渲染时不附加引用定义
+MarkdownBlock = namedtuple(
+    "MarkdownBlock", ["text", "start_line", "line_count", "key", "definitions", "raw_html"],
+    defaults=((), False),
+)
+
+_FENCE_RE = re.compile(r'^(`{3,}|~{3,})')
+_LIST_RE = re.compile(r'^([-*+]|\d+[.)])\s')
+_HTML_OPEN_RE = re.compile(r'^ {0,3}<([a-zA-Z][a-zA-Z0-9]*)(?=[\s>/])')
+# 引用式链接和缩写定义会跨块生效，渲染时附加到每一块（见 BlockList.references）；
+# 脚注的编号和列表属于全文，出现脚注定义时退化为整篇一块
+_DEFINITION_RE = re.compile(r'^ {0,3}\*?\[(?!\^)[^\]\n]+\]:')
+_DEFINITION_TITLE_RE = re.compile(r'^[ \t]+["\'(]')
+_FOOTNOTE_RE = re.compile(r'^ {0,3}\[\^[^\]\n]+\]:', re.MULTILINE)
+
+# 会让块边界跨越编辑区域的标记：围栏、$$、HTML 标签和注释
+_MULTILINE_MARK_RE = re.compile(r'```|~~~|\$\$|<|-->')
+
+_HTML_BLOCK_TAGS = frozenset((
+    "address", "article", "aside", "blockquote", "details", "dialog", "div",
+    "dl", "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2",
+    "h3", "h4", "h5", "h6", "header", "hr", "main", "nav", "ol", "p", "pre",
+    "section", "table", "ul", "script", "style", "iframe", "canvas", "video",
+))
+
+
+def block_key(text):
+    """块内容哈希，作为渲染缓存的键"""
+    return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=8).hexdigest()
+
+
+class BlockList:
+    """顶层块序列（只读，每次更新生成新的对象，可交给后台线程遍历）。
+
+    编辑只让其后各块的行号整体平移时不逐个重建：下标 shift_from 起的块实际起始行为
+    记录值加 shift，取出时再换算。references 为全文的链接引用 / 缩写定义，
+    渲染时附加到每一块之后使引用跨块生效，随块的增删按计数增量维护。
+    whole 为真表示因脚注整篇作为一块。
+    """
+
+    def __init__(self, blocks, shift_from=None, shift=0, definitions=None, whole=False):
+        self._blocks = blocks
+        self._shift_from = len(blocks) if shift_from is None or not shift else shift_from
+        self._shift = shift
+        if definitions is None:
+            definitions = Counter()
+            for block in blocks:
+                definitions.update(block.definitions)
+        self._definitions = definitions
+        self.references = "\n\n".join(definitions)
+        self.whole = whole
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self._blocks)))]
+        if index < 0:
+            index += len(self._blocks)
+        block = self._blocks[index]
+        if index >= self._shift_from:
+            block = block._replace(start_line=block.start_line + self._shift)
+        return block
+
+    def __iter__(self):
+        for index in range(len(self._blocks)):
+            yield self[index]
+
+    def start(self, index):
+        line = self._blocks[index].start_line
+        return line + self._shift if index >= self._shift_from else line
+
+    def find(self, line):
+        """包含 line 行的块的下标"""
+        lo, hi = 0, len(self._blocks)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.start(mid) <= line:
+                lo = mid + 1
+            else:
+                hi = mid
+        return max(lo - 1, 0)
+
+    def splice(self, restart, tail, new_blocks, line_delta):
+        """用 new_blocks 替换 [restart, tail) 的块，tail 起的旧块行号平移 line_delta；
+        tail 为 None 表示替换到末尾。
+
+        只有上次平移的起点与本次编辑之间的块需要换算行号，就近连续编辑时几乎不重建块。
+        """
+        raw, pending_from, pending = self._blocks, self._shift_from, self._shift
+        end = len(raw) if tail is None else tail
+
+        definitions = Counter(self._definitions)
+        for block in raw[restart:end]:
+            definitions.subtract(block.definitions)
+        for block in new_blocks:
+            definitions.update(block.definitions)
+        definitions = +definitions
+
+        prefix = raw[:restart]
+        if pending and pending_from < restart:
+            prefix[pending_from:] = [
+                block._replace(start_line=block.start_line + pending) for block in prefix[pending_from:]
+            ]
+        if tail is None:
+            return BlockList(prefix + new_blocks, definitions=definitions)
+
+        rest = raw[tail:]
+        if pending and pending_from > tail:
+            # pending_from 之前的块只需平移 line_delta，先扣掉 pending 使整段基准一致
+            count = pending_from - tail
+            rest[:count] = [block._replace(start_line=block.start_line - pending) for block in rest[:count]]
+        shift_from = len(prefix) + len(new_blocks)
+        return BlockList(prefix + new_blocks + rest, shift_from, pending + line_delta, definitions)
+
+
+def split_blocks(text):
+    """将 Markdown 文本切分为 BlockList，块按行首尾相接覆盖全文"""
+    lines = text.split("\n")
+    if _FOOTNOTE_RE.search(text):
+        return BlockList([_make_block(lines, 0, len(lines))], whole=True)
+    return BlockList(list(iter_blocks(lines)))
+
+
+def update_blocks(blocks, lines, first_line, last_line, line_delta):
+    """在旧块列表上增量重新切分，返回新的 BlockList；需要整篇重新切分时返回 None。
+
+    lines 为新文本的行序列，可以是按需读取的对象（如编辑器文档），只会访问重新扫描到的行。
+    first_line..last_line 是新文本中被编辑过的行（含两端），line_delta 为总行数变化。
+    从受影响块的前一块开始重新扫描，遇到与旧块边界重合的位置后直接沿用旧块；
+    编辑前后的行里出现围栏、$$ 或 HTML 时块边界可能远距离变化，出现脚注时需整篇一块，
+    这两种情况返回 None。
+    """
+    if not len(blocks) or blocks.whole:
+        return None
+
+    old_last = max(last_line - line_delta, first_line)
+    first = blocks.find(first_line)
+    last = max(blocks.find(old_last), first)
+
+    first_start = blocks.start(first)
+    old_text = "\n".join(blocks[i].text for i in range(first, last + 1))
+    old_lines = old_text.split("\n")[first_line - first_start:old_last - first_start + 1]
+    new_lines = lines[first_line:last_line + 1]
+    if _MULTILINE_MARK_RE.search("\n".join(old_lines)) or _MULTILINE_MARK_RE.search("\n".join(new_lines)):
+        return None
+
+    restart = max(first - 1, 0)
+    new_blocks = []
+    for block in iter_blocks(lines, blocks.start(restart)):
+        if block.start_line > last_line:
+            old_start = block.start_line - line_delta
+            k = blocks.find(old_start)
+            if k > last and blocks.start(k) == old_start:
+                # 此后的行与旧文本相同，切分结果也相同，只需平移行号
+                return blocks.splice(restart, k, new_blocks, line_delta)
+        if _FOOTNOTE_RE.search(block.text):
+            return None
+        new_blocks.append(block)
+    return blocks.splice(restart, None, new_blocks, line_delta)
+
+
+def iter_blocks(lines, start=0):
+    """从 start 行开始逐块产出；start 必须是块边界。lines 只需支持 len() 和下标、切片"""
+    n = len(lines)
+    i = start
+    while i < n:
+        end, definitions, raw_html = _scan_block(lines, i)
+        yield _make_block(lines, i, end, definitions, raw_html)
+        i = end
+
+
+def _make_block(lines, start, end, definitions=(), raw_html=False):
+    text = "\n".join(lines[start:end])
+    return MarkdownBlock(text, start, end - start, block_key(text), definitions, raw_html)
+
+
+def _line_kind(line):
+    stripped = line.lstrip(" ")
+    if len(line) - len(stripped) < 4:
+        if stripped.startswith(">"):
+            return "quote"
+        if _LIST_RE.match(stripped):
+            return "list"
+    return "other"
+
+
+def _continues_block(kinds, line):
+    """空行之后的 line 是否仍属于上一块；kinds 为块内已出现的行类型。
+
+    不只看块的首行：标题后紧跟列表、引用中夹着列表行时，后面的列表项 / 引用仍与之合并渲染。
+    """
+    if line[0] in " \t" or line.startswith(":"):
+        # 缩进续行 / 缩进代码 / 定义列表
+        return True
+    if "list" in kinds and _LIST_RE.match(line):
+        return True
+    if "quote" in kinds and line.startswith(">"):
+        return True
+    return False
+
+
+def _find_line(lines, start, predicate):
+    for j in range(start, len(lines)):
+        if predicate(lines[j]):
+            return j
+    return -1
+
+
+def _scan_block(lines, start):
+    """返回从 start 开始的块的 (结束行（不含）, 顶层的引用定义, 是否含块级 HTML)"""
+    n = len(lines)
+    i = start
+    kinds = set()
+    definitions = []
+    raw_html = False
+    while i < n:
+        line = lines[i]
+
+        if not line.strip():
+            j = i + 1
+            while j < n and not lines[j].strip():
+                j += 1
+            if j >= n:
+                break
+            if kinds and not _continues_block(kinds, lines[j]):
+                return j, tuple(definitions), raw_html
+            i = j
+            continue
+
+        kinds.add(_line_kind(line))
+
+        # 围栏代码：仅在能找到闭合围栏时整体跳过，未闭合的 ``` 不算代码块
+        fence = _FENCE_RE.match(line)
+        if fence:
+            marker = fence.group(1)
+            close = _find_line(lines, i + 1, lambda l: l.rstrip() == marker)
+            if close != -1:
+                i = close + 1
+                continue
+
+        # $$ 公式块：与 _protect_math 一样按出现顺序两两配对
+        if line.count("$$") % 2:
+            close = _find_line(lines, i + 1, lambda l: l.count("$$") % 2 == 1)
+            if close != -1:
+                i = close + 1
+                continue
+
+        # 块级 HTML / 注释：到闭合标签为止
+        if line.lstrip().startswith("<!--"):
+            raw_html = True
+            if "-->" not in line:
+                close = _find_line(lines, i + 1, lambda l: "-->" in l)
+                i = n if close == -1 else close + 1
+                continue
+        else:
+            html = _HTML_OPEN_RE.match(line)
+            if html and html.group(1).lower() in _HTML_BLOCK_TAGS:
+                raw_html = True
+                closing = f"</{html.group(1).lower()}"
+                if closing not in line.lower():
+                    close = _find_line(lines, i + 1, lambda l: closing in l.lower())
+                    i = n if close == -1 else close + 1
+                    continue
+
+        if "]:" in line and _DEFINITION_RE.match(line):
+            # 标题可以写在下一行
+            if i + 1 < n and _DEFINITION_TITLE_RE.match(lines[i + 1]):
+                definitions.append(line + "\n" + lines[i + 1])
+                i += 2
+                continue
+            definitions.append(line)
+
+        i += 1
+    return n, tuple(definitions), raw_html
@@ -0,0 +1,87 @@
+"""按行的三方合并，用于磁盘文件被外部修改时合并编辑器中的修改"""
+
+import difflib
+
+CONFLICT_MINE = "<<<<<<< 编辑器中的版本\n"
+CONFLICT_SEPARATOR = "=======\n"
+CONFLICT_THEIRS = ">>>>>>> 磁盘上的版本\n"
+
+
+def _hunks(base, other):
+    """base -> other 的差异块 [(起始行, 结束行, 替换行列表)]"""
+    matcher = difflib.SequenceMatcher(None, base, other, autojunk=False)
+    return [(i1, i2, other[j1:j2]) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal"]
+
+
+def _apply(base, start, end, hunks):
+    """把落在 base[start:end] 内的差异块应用到这一段上"""
+    result = []
+    pos = start
+    for i1, i2, lines in hunks:
+        result.extend(base[pos:i1])
+        result.extend(lines)
+        pos = i2
+    result.extend(base[pos:end])
+    return result
+
+
+def _with_newline(lines):
+    if lines and not lines[-1].endswith("\n"):
+        return lines[:-1] + [lines[-1] + "\n"]
+    return lines
+
+
+def merge_texts(base, mine, theirs):
+    """三方合并，返回 (合并后的文本, 冲突数)。
+
+    两边只改了不同位置时各自的修改都保留；改了同一处且结果不同时写入冲突标记，
+    编辑器中的版本在前，磁盘上的版本在后。
+    """
+    if mine == base or mine == theirs:
+        return theirs, 0
+    if theirs == base:
+        return mine, 0
+
+    base_lines = base.splitlines(keepends=True)
+    mine_lines = mine.splitlines(keepends=True)
+    theirs_lines = theirs.splitlines(keepends=True)
+    hunks = sorted(
+        [(i1, i2, lines, 0) for i1, i2, lines in _hunks(base_lines, mine_lines)]
+        + [(i1, i2, lines, 1) for i1, i2, lines in _hunks(base_lines, theirs_lines)],
+        key=lambda h: (h[0], h[1])
+    )
+
+    result = []
+    conflicts = 0
+    pos = 0
+    i = 0
+    while i < len(hunks):
+        start, end = hunks[i][0], hunks[i][1]
+        group = [hunks[i]]
+        i += 1
+        # 区间重叠，或在同一位置插入/紧贴插入点时归为一组
+        while i < len(hunks) and (
+            hunks[i][0] < end or (hunks[i][0] == end and (hunks[i][0] == hunks[i][1] or start == end))
+        ):
+            end = max(end, hunks[i][1])
+            group.append(hunks[i])
+            i += 1
+
+        result.extend(base_lines[pos:start])
+        pos = end
+        sides = [[(h[0], h[1], h[2]) for h in group if h[3] == side] for side in (0, 1)]
+        mine_part = _apply(base_lines, start, end, sides[0])
+        theirs_part = _apply(base_lines, start, end, sides[1])
+        if not sides[1] or mine_part == theirs_part:
+            result.extend(mine_part)
+        elif not sides[0]:
+            result.extend(theirs_part)
+        else:
+            conflicts += 1
+            result.append(CONFLICT_MINE)
+            result.extend(_with_newline(mine_part))
+            result.append(CONFLICT_SEPARATOR)
+            result.extend(_with_newline(theirs_part))
+            result.append(CONFLICT_THEIRS)
+    result.extend(base_lines[pos:])
+    return "".join(result), conflicts
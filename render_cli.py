@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+无界面批量渲染：把目录中的 Markdown 文件渲染为带主题的独立 HTML 页面或 PDF，不需要 QApplication
+
+用法: python render_cli.py render 源目录或文件 [-o 输出目录] [--format html|pdf] [--theme github]
+                          [--dark] [--font-size 16] [-j 进程数] [--force]
+                          [--standalone [--images auto|embed|copy]]
+
+PDF 由 PdfWriter 直接排版，不启动浏览器进程，适合在服务器上运行。
+--standalone 输出不含脚本的静态 HTML：代码用 Pygments 预先高亮，只内联用到的样式，
+本地图片内嵌或复制到资源目录；公式和 Mermaid 图表需要浏览器渲染，保留源码。
+
+输出目录保持源目录结构；输出目录下的 .fmd_manifest.json 记录每个文件的内容哈希，
+内容和渲染选项都没变且输出文件仍在时跳过。
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from controllers.editor_controller import EditorController
+from controllers.export_controller import ExportController
+from models.document import MarkdownDocument
+from models.export_manifest import (
+    ExportManifest, decode_source, find_sources, is_unchanged, options_key, output_path
+)
+from models.themes import PreviewThemes
+
+# 每个工作进程一个常驻的 controller，解析器和块缓存在该进程处理的文件间复用
+_controller = None
+_is_dark = False
+_format = "html"
+# 独立 HTML 的图片处理方式，None 表示输出带脚本的预览页
+_images = None
+
+
+def _init_worker(theme, is_dark, font_size, fmt="html", images=None):
+    global _controller, _is_dark, _format, _images
+    controller = EditorController(MarkdownDocument())
+    controller.set_theme(theme)
+    controller.set_font_size(font_size)
+    controller.link_local_images = False
+    _controller = controller
+    _is_dark = is_dark
+    _format = fmt
+    _images = images
+
+
+def _render_job(job):
+    """渲染一个文件，返回 (输出文件, 内容哈希, 状态, 源文件字节数, 错误信息)。
+
+    状态为 "rendered" / "skipped" / "failed"；哈希与清单中记录的一致且输出文件存在时跳过。
+    """
+    src, dst, known_digest = job
+    try:
+        with open(src, "rb") as f:
+            data = f.read()
+        digest, unchanged = is_unchanged(data, dst, known_digest)
+        if unchanged:
+            return dst, digest, "skipped", len(data), ""
+        text = decode_source(data)
+
+        document = _controller.document
+        document.file_path = os.path.abspath(src)
+        document.content = text
+        os.makedirs(os.path.dirname(dst) or ".", exist_ok=True)
+
+        if _format == "pdf":
+            # 边渲染边排版，不保留整篇的渲染结果；预览字号为 px，换算为 pt
+            success, message = ExportController.export_pdf(
+                dst, text, _controller.iter_block_html(), os.path.dirname(document.file_path),
+                _controller.font_size * 0.75
+            )
+            if not success:
+                return dst, None, "failed", 0, message
+            return dst, digest, "rendered", len(data), ""
+
+        rendered = _controller.render_blocks()
+        if _images is not None:
+            success, message = ExportController.export_static_html(
+                dst, _controller.render_body_html(rendered), _controller.page_builder(_is_dark),
+                os.path.dirname(document.file_path), _images
+            )
+            if not success:
+                return dst, None, "failed", 0, message
+            return dst, digest, "rendered", len(data), ""
+
+        html = _controller.render_preview(_is_dark, rendered, local_assets=False)
+        with open(dst, "w", encoding="utf-8") as f:
+            f.write(html)
+        return dst, digest, "rendered", len(data), ""
+    except Exception as e:
+        return dst, None, "failed", 0, str(e) or e.__class__.__name__
+
+
+def render_tree(source, output_dir, theme="light", is_dark=False, font_size=16, jobs=None, force=False,
+                fmt="html", images=None):
+    """渲染 source 下的所有 Markdown 文件，返回 {"rendered", "skipped", "failed", "bytes", "seconds"}
+
+    images 不为 None 时输出独立 HTML，取值见 bundle_html。
+    """
+    start = time.perf_counter()
+    options = options_key(theme, is_dark, font_size)
+    if fmt == "html" and images is not None:
+        options += f":static-{images}"
+    else:
+        images = None
+    manifest = ExportManifest(output_dir)
+    work = []
+    for src, rel_path in find_sources(source):
+        dst = output_path(output_dir, rel_path, "." + fmt)
+        work.append((src, dst, None if force else manifest.known_digest(dst, options)))
+
+    jobs = jobs or os.cpu_count() or 1
+    jobs = max(1, min(jobs, len(work)))
+    if jobs == 1:
+        _init_worker(theme, is_dark, font_size, fmt, images)
+        results = [_render_job(job) for job in work]
+    else:
+        # 按块分发，减少进程间往返；每个进程至少分到几批以平衡负载
+        chunksize = max(1, len(work) // (jobs * 4))
+        initargs = (theme, is_dark, font_size, fmt, images)
+        with ProcessPoolExecutor(jobs, initializer=_init_worker, initargs=initargs) as pool:
+            results = list(pool.map(_render_job, work, chunksize=chunksize))
+
+    stats = {"rendered": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    for dst, digest, status, size, error in results:
+        stats[status] += 1
+        if status == "failed":
+            manifest.forget(dst)
+            print(f"失败 {os.path.relpath(dst, output_dir)}: {error}", file=sys.stderr)
+            continue
+        manifest.record(dst, digest, options)
+        if status == "rendered":
+            stats["bytes"] += size
+    manifest.save()
+    stats["seconds"] = time.perf_counter() - start
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fluent Markdown 命令行工具")
+    commands = parser.add_subparsers(dest="command", required=True)
+    render = commands.add_parser("render", help="批量把 Markdown 渲染为 HTML 或 PDF")
+    render.add_argument("source", help="Markdown 文件或目录")
+    render.add_argument("-o", "--output", default=None, help="输出目录（默认 ./html 或 ./pdf）")
+    render.add_argument("--format", default="html", choices=["html", "pdf"], help="输出格式")
+    render.add_argument("--theme", default="light", choices=PreviewThemes.get_available_themes(), help="预览主题")
+    render.add_argument("--dark", action="store_true", help="使用深色配色")
+    render.add_argument("--font-size", type=int, default=16, help="正文字号")
+    render.add_argument("-j", "--jobs", type=int, default=None, help="进程数（默认 CPU 核数）")
+    render.add_argument("--force", action="store_true", help="忽略清单，全部重新渲染")
+    render.add_argument("--standalone", action="store_true", help="输出不含脚本和外部资源的静态 HTML")
+    render.add_argument(
+        "--images", default="auto", choices=["auto", "embed", "copy"],
+        help="独立 HTML 中的本地图片：内嵌、复制到资源目录或按大小自动选择"
+    )
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.source):
+        parser.error(f"找不到 {args.source}")
+    stats = render_tree(
+        args.source, args.output or args.format, args.theme, args.dark, args.font_size, args.jobs,
+        args.force, args.format, args.images if args.standalone else None
+    )
+    seconds = stats["seconds"]
+    rendered = stats["rendered"]
+    print(
+        f"渲染 {rendered} 个，跳过 {stats['skipped']} 个，失败 {stats['failed']} 个，"
+        f"耗时 {seconds:.2f} s，{rendered / seconds:.1f} 文件/s，"
+        f"{stats['bytes'] / 1024 / 1024 / seconds:.2f} MB/s"
+    )
+    return 1 if stats["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
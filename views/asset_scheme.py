@@ -0,0 +1,102 @@
+"""fmd-asset:// 协议：从 resources/vendor 提供 highlight.js / KaTeX / Mermaid
+
+预览页通过 fmd-asset://<库名>/<路径> 引用本地资源，离线可用；文件首次读取后
+缓存在内存中，之后的整页重载（切换主题、字号等）不再访问磁盘和网络。
+资源由 fetch_assets.py 下载，缺失时预览页回退到 CDN，并记录警告、在状态栏提示。
+"""
+
+import logging
+import os
+
+from PyQt5.QtCore import QBuffer, QIODevice
+from PyQt5.QtWebEngineCore import (
+    QWebEngineUrlScheme, QWebEngineUrlSchemeHandler, QWebEngineUrlRequestJob
+)
+from PyQt5.QtWebEngineWidgets import QWebEngineProfile
+
+from models.html_template import missing_assets, vendor_dir
+
+ASSET_SCHEME = b"fmd-asset"
+
+_MIME_TYPES = {
+    ".js": b"application/javascript",
+    ".css": b"text/css",
+    ".woff2": b"font/woff2",
+    ".woff": b"font/woff",
+    ".ttf": b"font/ttf",
+    ".svg": b"image/svg+xml",
+}
+
+_handler = None
+_log = logging.getLogger(__name__)
+
+
+def local_assets_available():
+    return not missing_assets()
+
+
+def register_asset_scheme():
+    """注册自定义协议，必须在创建 QApplication 之前调用"""
+    scheme = QWebEngineUrlScheme(ASSET_SCHEME)
+    scheme.setSyntax(QWebEngineUrlScheme.Syntax.Host)
+    scheme.setFlags(
+        QWebEngineUrlScheme.SecureScheme
+        | QWebEngineUrlScheme.LocalAccessAllowed
+        | QWebEngineUrlScheme.CorsEnabled
+    )
+    QWebEngineUrlScheme.registerScheme(scheme)
+
+
+def install_asset_scheme_handler():
+    """在默认 profile 上安装协议处理器，返回本地资源是否可用"""
+    global _handler
+    missing = missing_assets()
+    if missing:
+        _log.warning("缺少本地前端资源 %s，预览改用 CDN，离线时代码高亮、公式和图表不可用；"
+                     "运行 fetch_assets.py 下载", ", ".join(missing))
+        return False
+    if _handler is not None:
+        return True
+    _handler = AssetSchemeHandler()
+    QWebEngineProfile.defaultProfile().installUrlSchemeHandler(ASSET_SCHEME, _handler)
+    return True
+
+
+class AssetSchemeHandler(QWebEngineUrlSchemeHandler):
+    """按 host + path 在 vendor 目录中查找文件，读过的文件常驻内存"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._base = os.path.normpath(vendor_dir())
+        self._cache = {}
+
+    def requestStarted(self, job):
+        url = job.requestUrl()
+        rel = (url.host() + url.path()).lstrip("/")
+        entry = self._cache.get(rel)
+        if entry is None:
+            entry = self._load(rel)
+            if entry is None:
+                job.fail(QWebEngineUrlRequestJob.UrlNotFound)
+                return
+            self._cache[rel] = entry
+        data, mime = entry
+        # Qt 5 的 QWebEngineUrlRequestJob.reply 只能给出 MIME 类型，无法附加 Cache-Control 等响应头，
+        # Chromium 也不会把自定义协议的响应放进 HTTP 缓存，每次整页重载都会重新请求；
+        # 因此由上面的 _cache 常驻内存，请求只做一次字典查找和内存拷贝
+        buffer = QBuffer(job)
+        buffer.setData(data)
+        buffer.open(QIODevice.ReadOnly)
+        job.reply(mime, buffer)
+
+    def _load(self, rel):
+        path = os.path.normpath(os.path.join(self._base, rel))
+        if not path.startswith(self._base + os.sep) or not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        mime = _MIME_TYPES.get(os.path.splitext(path)[1].lower(), b"application/octet-stream")
+        return data, mime
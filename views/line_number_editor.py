@@ -43,6 +43,8 @@ class LineNumberEditor(QPlainTextEdit):
         self._line_number_area = LineNumberArea(self)
         self._is_dark = False
         self._show_line_numbers = True
+        # 查找结果高亮，与当前行高亮一起作为 ExtraSelections 设置
+        self._search_selections = []
         self.setAcceptDrops(True)
 
         self.blockCountChanged.connect(self._update_line_number_area_width)
@@ -106,8 +108,13 @@ class LineNumberEditor(QPlainTextEdit):
             selection.cursor = self.textCursor()
             selection.cursor.clearSelection()
             extra_selections.append(selection)
+        extra_selections.extend(self._search_selections)
         self.setExtraSelections(extra_selections)
 
+    def set_search_selections(self, selections):
+        self._search_selections = selections
+        self._highlight_current_line()
+
     def line_number_area_paint_event(self, event):
         if not self._show_line_numbers:
             return
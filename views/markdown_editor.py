@@ -1,4 +1,5 @@
 import os
+import shutil
 import urllib.parse
 import tempfile
 import uuid
@@ -7,20 +8,29 @@ from PyQt5.QtWidgets import (
     QTextEdit, QVBoxLayout, QHBoxLayout, QFrame, QWidget, QStatusBar,
     QFileDialog, QSplitter, QApplication, QLineEdit, QPushButton
 )
-from PyQt5.QtCore import Qt, QPoint, QTimer, QCryptographicHash, QEvent, pyqtSlot
+from PyQt5.QtCore import Qt, QPoint, QTimer, QEvent, pyqtSlot
 from PyQt5.QtGui import QPainterPath, QRegion, QColor, QTextCursor, QTextCharFormat
 
 from qfluentwidgets import (
     FluentIcon, CommandBar, TransparentPushButton, TransparentToolButton, CardWidget,
     ComboBox, BodyLabel, isDarkTheme, MessageBox,
-    DropDownPushButton, RoundMenu, Action
+    DropDownPushButton, RoundMenu, Action, ProgressBar
 )
 from qframelesswindow.webengine import FramelessWebEngineView
 
-from models.document import MarkdownDocument
+from models.document import LARGE_FILE_SIZE, MarkdownDocument, is_large_file
+from models.edit_journal import EditJournal
+from models.text_merge import merge_texts
+from controllers.background_worker import BackgroundWorker
 from controllers.editor_controller import EditorController
 from controllers.export_controller import ExportController
+from controllers.file_loader import ChunkedFileLoader
+from controllers.file_watcher import FileWatcher
+from controllers.find_engine import FindEngine
+from controllers.save_service import SaveService
+from views.asset_scheme import install_asset_scheme_handler
 from views.line_number_editor import LineNumberEditor
+from views.preview_bridge import PreviewBridge
 from views.syntax_highlighter import MarkdownHighlighter
 
 
@@ -31,6 +41,11 @@ class MarkdownWidget(QFrame):
     PREVIEW_UPDATE_DELAY = 300
     PREVIEW_UPDATE_DELAY_LARGE = 600  # 大文件用更长 debounce
     LARGE_FILE_THRESHOLD = 5000  # 超过此字符数视为大文件
+    VIRTUAL_PREVIEW_LINE_THRESHOLD = 20000  # 超过此行数的文档启用虚拟化预览
+    PREVIEW_SCROLL_SYNC_INTERVAL = 16  # 编辑器滚动同步到预览的最小间隔（约一帧）
+    JOURNAL_FLUSH_DELAY = 500  # 编辑日志批量 fsync 的间隔
+    PREVIEW_READY_FALLBACK_DELAY = 300  # loadFinished 后仍未收到 pageReady 时的兜底等待
+    FIND_HIGHLIGHT_LIMIT = 2000  # 可见区域内最多高亮的查找结果数
 
     def __init__(self, parent=None):
         super().__init__(parent=parent)
@@ -38,15 +53,34 @@ class MarkdownWidget(QFrame):
 
         self.document = MarkdownDocument()
         self.controller = EditorController(self.document)
+        self.controller.local_assets = install_asset_scheme_handler()
 
         self.is_fullscreen = False
         self.is_editor_fullscreen = False
 
-        self._preview_updating = False
-        self._preview_dirty = False
-        self._last_md5 = None
+        self._last_signature = None
         self._last_preview_page_signature = None
+        self._preview_block_ids = set()
+        # 预览当前显示的渲染结果，用于把任务序号定位到源码；按块 id 的索引在虚拟化预览取块时才建立
+        self._preview_rendered = None
+        self._preview_items = None
+        self._preview_virtual = False
+        # 整页写入临时目录后按 file:// 载入，不受 setHtml 的 2 MB 上限限制
+        self._preview_page_dir = None
+        self._preview_page_serial = 0
         self._keep_preview_scroll_once = True
+        # 整页载入后到页面确认就绪前，增量补丁先积压在 _deferred_patch
+        self._preview_loading = False
+        self._preview_loaded = False
+        self._restore_preview_scroll = False
+        self._deferred_patch = None
+        self._suppress_scroll_sync = False
+        self._scroll_sync_timer = QTimer(self)
+        self._scroll_sync_timer.setSingleShot(True)
+        self._scroll_sync_timer.timeout.connect(self._send_preview_scroll)
+        self._preview_ready_timer = QTimer(self)
+        self._preview_ready_timer.setSingleShot(True)
+        self._preview_ready_timer.timeout.connect(self._on_preview_ready)
         self._command_bar_buttons = {}
         self._auto_save_timer = QTimer(self)
         self._auto_save_timer.timeout.connect(self._auto_save)
@@ -56,10 +90,46 @@ class MarkdownWidget(QFrame):
         self._preview_timer.setSingleShot(True)
         self._preview_timer.timeout.connect(self._do_preview_update)
 
+        # 后台渲染：同一时刻只保留最新的渲染任务，过期结果直接丢弃
+        self._pending_render = None
+        # 大文件分块载入期间暂停预览
+        self._file_loader = None
+        self._render_worker = BackgroundWorker(self._render_preview_job, self)
+        self._render_worker.job_finished.connect(self._on_render_finished)
+        QApplication.instance().aboutToQuit.connect(self._render_worker.stop)
+
+        # 保存在后台线程进行；退出前写完所有待保存的快照
+        self._save_service = SaveService(self)
+        self._save_service.save_finished.connect(self._on_save_finished)
+        QApplication.instance().aboutToQuit.connect(self._save_service.stop)
+
+        # 未保存的编辑实时记入崩溃恢复日志，批量落盘
+        self._journal = EditJournal()
+        self._journal_timer = QTimer(self)
+        self._journal_timer.setSingleShot(True)
+        self._journal_timer.timeout.connect(self._journal.flush)
+        QApplication.instance().aboutToQuit.connect(self._journal.close)
+
+        # 磁盘上的文件被外部修改时提示重新载入或合并
+        self._file_watcher = FileWatcher(self.document, self)
+        self._file_watcher.file_changed.connect(self._on_external_change)
+        self._external_change_pending = False
+        QApplication.instance().aboutToQuit.connect(self._file_watcher.stop)
+
+        # PDF 导出复用预热的 WebEngine 视图，首次导出时创建
+        self._pdf_export_service = None
+        # 单个导出中等待结果的 PDF 路径（批量导出的结果由 BatchExporter 处理）
+        self._pdf_single_exports = set()
+        # 等待预览正文渲染完成的独立 HTML 导出：路径 -> (页面构建器, 图片目录)
+        self._html_exports = {}
+        self._batch_exporter = None
+        self._batch_failures = []
+
         self._setup_ui()
         self._connect_signals()
 
         QTimer.singleShot(0, self._show_welcome_page)
+        QTimer.singleShot(0, self._recover_journal)
 
     def _setup_ui(self):
         self.vBoxLayout = QVBoxLayout(self)
@@ -125,6 +195,19 @@ class MarkdownWidget(QFrame):
 
         # ── 导出 ──
         self._add_icon_button('export', FluentIcon.SHARE, "导出", self.export_file)
+
+        batch_menu = RoundMenu(parent=self)
+        batch_menu.addAction(Action(FluentIcon.DOCUMENT, "导出为 PDF", triggered=lambda: self.batch_export(["pdf"])))
+        batch_menu.addAction(Action(FluentIcon.DOCUMENT, "导出为 Word", triggered=lambda: self.batch_export(["docx"])))
+        batch_menu.addAction(Action(FluentIcon.DOCUMENT, "导出为 HTML", triggered=lambda: self.batch_export(["html"])))
+        batch_menu.addAction(Action(
+            FluentIcon.DOCUMENT, "导出全部格式", triggered=lambda: self.batch_export(["pdf", "docx", "html"])
+        ))
+        batch_menu.addSeparator()
+        batch_menu.addAction(Action(FluentIcon.CLOSE, "取消批量导出", triggered=self.cancel_batch_export))
+        batch_button = DropDownPushButton(FluentIcon.FOLDER, "批量导出", self)
+        batch_button.setMenu(batch_menu)
+        self.command_bar.addWidget(batch_button)
         self._add_icon_button('copy_rich', FluentIcon.COPY, "复制为富文本", self.copy_as_rich_text)
 
         self.vBoxLayout.addWidget(self.command_bar)
@@ -413,59 +496,17 @@ class MarkdownWidget(QFrame):
         self._clear_find_highlights()
         self.editor.setFocus()
 
-    def _get_find_matches(self):
-        """获取所有匹配位置（支持大小写、全字、正则）"""
-        import re
-        keyword = self.find_input.text()
-        if not keyword:
-            return []
-        text = self.editor.toPlainText()
-        flags = 0 if self._find_case_sensitive else re.IGNORECASE
-
-        if self._find_regex_mode:
-            try:
-                pattern = keyword
-                if self._find_whole_word:
-                    pattern = r'\b' + pattern + r'\b'
-                return [(m.start(), m.end()) for m in re.finditer(pattern, text, flags)]
-            except re.error:
-                return []
-        else:
-            pattern = re.escape(keyword)
-            if self._find_whole_word:
-                pattern = r'\b' + pattern + r'\b'
-            try:
-                return [(m.start(), m.end()) for m in re.finditer(pattern, text, flags)]
-            except re.error:
-                return []
-
     def _find_next(self):
-        matches = self._get_find_matches()
-        if not matches:
-            return
-        cursor = self.editor.textCursor()
-        current_pos = cursor.position()
-        for start, end in matches:
-            if start >= current_pos:
-                self._select_range(start, end)
-                self._update_find_count()
-                return
-        self._select_range(matches[0][0], matches[0][1])
         self._update_find_count()
+        match = self._find_engine.next_match(self.editor.textCursor().position())
+        if match is not None:
+            self._select_range(*self._find_engine.match_range(match))
 
     def _find_prev(self):
-        matches = self._get_find_matches()
-        if not matches:
-            return
-        cursor = self.editor.textCursor()
-        current_pos = cursor.selectionStart()
-        for start, end in reversed(matches):
-            if end <= current_pos:
-                self._select_range(start, end)
-                self._update_find_count()
-                return
-        self._select_range(matches[-1][0], matches[-1][1])
         self._update_find_count()
+        match = self._find_engine.prev_match(self.editor.textCursor().selectionStart())
+        if match is not None:
+            self._select_range(*self._find_engine.match_range(match))
 
     def _select_range(self, start, end):
         cursor = self.editor.textCursor()
@@ -505,54 +546,86 @@ class MarkdownWidget(QFrame):
         self._update_find_count()
 
     def _replace_all(self):
+        """在一个编辑块内从后往前逐个替换，保留撤销历史，只重绘改动的行"""
         import re
-        keyword = self.find_input.text()
-        replacement = self.replace_input.text()
-        if not keyword:
+        if not self.find_input.text():
             return
-        text = self.editor.toPlainText()
-        if self._find_regex_mode:
-            try:
-                new_text, count = re.subn(keyword, replacement, text)
-            except re.error:
-                self.find_count_label.setText("正则错误")
-                return
-        else:
-            count = text.count(keyword)
-            new_text = text.replace(keyword, replacement)
-        if count == 0:
+        self._update_find_count()
+        if self._find_engine.error is not None:
+            self.find_count_label.setText("正则错误")
             return
-        cursor = self.editor.textCursor()
-        pos = cursor.position()
-        self.editor.setPlainText(new_text)
-        cursor = self.editor.textCursor()
-        cursor.setPosition(min(pos, len(new_text)))
-        self.editor.setTextCursor(cursor)
-        self.find_count_label.setText(f"已替换 {count} 个")
+        try:
+            edits = self._find_engine.replacements(self.replace_input.text())
+        except (re.error, IndexError):
+            # 替换串里引用了不存在的分组
+            self.find_count_label.setText("替换串无效")
+            return
+        if not edits:
+            return
+        cursor = QTextCursor(self.editor.document())
+        cursor.beginEditBlock()
+        for start, end, text in reversed(edits):
+            cursor.setPosition(start)
+            cursor.setPosition(end, QTextCursor.KeepAnchor)
+            cursor.insertText(text)
+        cursor.endEditBlock()
+        self.find_count_label.setText(f"已替换 {len(edits)} 个")
 
     def _update_find_count(self):
-        keyword = self.find_input.text()
-        if not keyword:
+        """把当前查找条件交给查找引擎；条件未变时引擎沿用已有索引"""
+        self._find_engine.set_query(
+            self.find_input.text() if self.find_replace_bar.isVisible() else "",
+            self._find_case_sensitive, self._find_whole_word, self._find_regex_mode,
+        )
+        self._on_find_matches_changed()
+
+    def _on_find_matches_changed(self):
+        if not self.find_input.text() or not self.find_replace_bar.isVisible():
             self.find_count_label.setText("")
-            return
-        matches = self._get_find_matches()
-        count = len(matches)
-        if self._find_regex_mode and count == 0:
-            import re
-            try:
-                re.compile(keyword)
-                self.find_count_label.setText("无匹配")
-            except re.error:
-                self.find_count_label.setText("正则无效")
-        elif count == 0:
-            self.find_count_label.setText("无匹配")
+        elif self._find_engine.error is not None:
+            self.find_count_label.setText("正则无效")
         else:
-            self.find_count_label.setText(f"{count} 个匹配")
+            count = self._find_engine.count()
+            if count is None:
+                self.find_count_label.setText("计数中…")
+            elif count == 0:
+                self.find_count_label.setText("无匹配")
+            else:
+                self.find_count_label.setText(f"{count} 个匹配")
+        self._refresh_find_highlights()
+
+    def _refresh_find_highlights(self):
+        """只为可见区域内的匹配生成 ExtraSelection"""
+        if not self.find_replace_bar.isVisible():
+            return
+        block = self.editor.firstVisibleBlock()
+        first_line = last_line = block.blockNumber()
+        offset = self.editor.contentOffset()
+        height = self.editor.viewport().height()
+        while block.isValid():
+            if self.editor.blockBoundingGeometry(block).translated(offset).top() > height:
+                break
+            last_line = block.blockNumber()
+            block = block.next()
+
+        color = QColor(255, 213, 79, 90) if isDarkTheme() else QColor(255, 213, 79, 150)
+        selections = []
+        for match in self._find_engine.visible_matches(first_line, last_line)[:self.FIND_HIGHLIGHT_LIMIT]:
+            start, end = self._find_engine.match_range(match)
+            selection = QTextEdit.ExtraSelection()
+            selection.format.setBackground(color)
+            selection.cursor = QTextCursor(self.editor.document())
+            selection.cursor.setPosition(start)
+            selection.cursor.setPosition(end, QTextCursor.KeepAnchor)
+            selections.append(selection)
+        self.editor.set_search_selections(selections)
 
     def _clear_find_highlights(self):
         cursor = self.editor.textCursor()
         cursor.clearSelection()
         self.editor.setTextCursor(cursor)
+        self.editor.set_search_selections([])
+        self._find_engine.set_query("")
 
     # ─── Markdown 格式化快捷操作 ───
 
@@ -862,18 +935,6 @@ class MarkdownWidget(QFrame):
 
         class ExternalLinkPage(QWebEnginePage):
             def acceptNavigationRequest(self, url, nav_type, is_main_frame):
-                url_str = url.toString()
-                # 任务列表 checkbox 交互
-                if url_str.startswith("task-toggle://"):
-                    parts = url_str.replace("task-toggle://", "").split("/")
-                    if len(parts) >= 2:
-                        try:
-                            task_index = int(parts[0])
-                            checked = parts[1] == "1"
-                            widget_ref._on_task_toggled(task_index, checked)
-                        except (ValueError, IndexError):
-                            pass
-                    return False
                 if nav_type == QWebEnginePage.NavigationTypeLinkClicked:
                     path = url.toLocalFile()
                     if path and path.lower().endswith('.md'):
@@ -886,6 +947,15 @@ class MarkdownWidget(QFrame):
         custom_page = ExternalLinkPage(self.preview)
         self.preview.setPage(custom_page)
 
+        # 页面与编辑器之间的交互（任务切换、滚动、大纲点击、页面就绪）走 QWebChannel
+        self._preview_bridge = PreviewBridge(self)
+        self._preview_bridge.attach(custom_page)
+        self._preview_bridge.task_toggled.connect(self._on_task_toggled)
+        self._preview_bridge.outline_clicked.connect(self._on_outline_clicked)
+        self._preview_bridge.page_ready.connect(self._on_preview_ready)
+        self._preview_bridge.block_provider = self._provide_preview_blocks
+        self.preview.loadFinished.connect(self._on_preview_load_finished)
+
         try:
             self.preview.page().setBackgroundColor(QColor(0, 0, 0, 0))
         except Exception:
@@ -926,15 +996,30 @@ class MarkdownWidget(QFrame):
         self.selection_label = BodyLabel("选中: 0", self)
         self.encoding_label = BodyLabel("编码: UTF-8", self)
         self.theme_label = BodyLabel("预览主题: 默认", self)
+        # 本地前端资源缺失时预览回退到 CDN，离线时高亮、公式和图表不可用，需让用户看到
+        self.asset_label = BodyLabel("预览资源: CDN", self)
+        self.asset_label.setToolTip("resources/vendor 中缺少本地前端资源，运行 fetch_assets.py 下载后可离线预览")
+        self.asset_label.setVisible(not self.controller.local_assets)
 
         text_color = "#ffffff" if is_dark else "#333333"
         label_style = f"color: {text_color}; padding: 0 8px;"
-        for label in [self.char_count_label, self.selection_label, self.theme_label, self.encoding_label]:
+        for label in [self.char_count_label, self.selection_label, self.theme_label, self.encoding_label,
+                      self.asset_label]:
             label.setStyleSheet(label_style)
 
         self.status_bar.addWidget(self.char_count_label)
         self.status_bar.addWidget(self.selection_label)
         self.status_bar.addWidget(self.theme_label)
+        self.load_progress = ProgressBar(self)
+        self.load_progress.setFixedWidth(160)
+        self.load_progress.setRange(0, 100)
+        self.load_progress.hide()
+        self.status_bar.addPermanentWidget(self.load_progress)
+        self.export_progress = ProgressBar(self)
+        self.export_progress.setFixedWidth(160)
+        self.export_progress.hide()
+        self.status_bar.addPermanentWidget(self.export_progress)
+        self.status_bar.addPermanentWidget(self.asset_label)
         self.status_bar.addPermanentWidget(self.encoding_label)
 
         self.vBoxLayout.addWidget(self.status_bar)
@@ -971,6 +1056,13 @@ class MarkdownWidget(QFrame):
             self.save_file_dialog()
 
     def _connect_signals(self):
+        self.controller.bind_editor(self.editor.document(), self.editor.toPlainText)
+        self._find_engine = FindEngine(self.editor.document(), self.controller.get_content, self)
+        self._find_engine.matches_changed.connect(self._on_find_matches_changed)
+        self.controller.add_line_change_listener(self._find_engine.on_lines_changed)
+        self.controller.add_edit_listener(self._on_edit)
+        QApplication.instance().aboutToQuit.connect(self._find_engine.stop)
+        self.editor.verticalScrollBar().valueChanged.connect(self._refresh_find_highlights)
         self.editor.textChanged.connect(self._on_text_changed)
         self.editor.selectionChanged.connect(self.update_status_bar)
         self.editor.verticalScrollBar().valueChanged.connect(self._sync_preview_scroll)
@@ -1084,7 +1176,7 @@ class MarkdownWidget(QFrame):
 '''
 
     def _hide_welcome_page(self):
-        self._preview_updating = False
+        self._cancel_preview_render()
         self.editor.show()
         self.splitter.setEnabled(True)
         w = self.splitter.width()
@@ -1159,31 +1251,23 @@ class MarkdownWidget(QFrame):
         if not self.document.has_file:
             return
         self.document.is_modified = True
-        content = self.editor.toPlainText()
-        self.controller.set_content(content)
         self._update_window_title()
         self.update_status_bar()
 
-        if self._preview_updating:
-            self._preview_dirty = True
-            return
-        delay = self.PREVIEW_UPDATE_DELAY_LARGE if len(content) > self.LARGE_FILE_THRESHOLD else self.PREVIEW_UPDATE_DELAY
+        length = self.editor.document().characterCount() - 1
+        delay = self.PREVIEW_UPDATE_DELAY_LARGE if length > self.LARGE_FILE_THRESHOLD else self.PREVIEW_UPDATE_DELAY
         self._preview_timer.stop()
         self._preview_timer.start(delay)
 
     def _do_preview_update(self):
         if not self.document.has_file:
             return
-        if self._preview_updating:
-            self._preview_dirty = True
-            return
         self.update_preview()
-        while self._preview_dirty:
-            self._preview_dirty = False
-            self.update_preview()
 
     def update_preview(self):
-        content = self.controller.get_content()
+        """提交预览渲染任务；Markdown 转换在后台线程进行，完成后由 _on_render_finished 应用"""
+        if self._file_loader is not None:
+            return
         is_dark = isDarkTheme()
 
         from PyQt5.QtCore import QUrl
@@ -1192,59 +1276,187 @@ class MarkdownWidget(QFrame):
         else:
             base_url = QUrl.fromLocalFile(os.getcwd() + '/')
 
+        virtual = self.editor.blockCount() > self.VIRTUAL_PREVIEW_LINE_THRESHOLD
         page_signature = "\n".join([
             self.controller.preview_theme,
             str(self.controller.font_size),
             "dark" if is_dark else "light",
+            "virtual" if virtual else "full",
         ])
-        signature_source = "\n".join([
-            content,
-            base_url.toString(),
-            page_signature,
-        ])
-        current_md5 = QCryptographicHash.hash(
-            signature_source.encode('utf-8'),
-            QCryptographicHash.Md5
-        ).toHex().data().decode()
+        # 文档每次编辑都会递增 revision，比较签名无需读取全文
+        signature = (self.document.revision, base_url.toString(), page_signature)
 
-        if current_md5 == self._last_md5:
+        if self._pending_render is not None:
+            if self._pending_render["signature"] == signature:
+                return
+        elif signature == self._last_signature:
             return
 
-        self._preview_updating = True
-
+        # 整页仍在加载时也可提交增量任务，补丁会等页面就绪后再应用
         page_can_update_incrementally = (
-            self._last_md5 is not None
-            and hasattr(self, '_preview_loaded')
-            and self._preview_loaded
+            self._last_signature is not None
+            and (self._preview_loaded or self._preview_loading)
             and self._last_preview_page_signature == page_signature
         )
 
-        if page_can_update_incrementally:
-            html_body = self.controller.render_body_html()
-            import json
-            keep_scroll = self._keep_preview_scroll_once
-            js = (
-                f'updatePreviewBase({json.dumps(base_url.toString())});'
-                f'replaceMarkdownBody({json.dumps(html_body)}, {str(keep_scroll).lower()});'
+        full_page = not page_can_update_incrementally
+        eager_height = None
+        if virtual:
+            # 虚拟化时只渲染首屏，增量更新只发占位，其余块由页面滚动到附近时再取
+            from models.html_template import PreviewHtmlBuilder
+            eager_height = PreviewHtmlBuilder.VIRTUAL_EAGER_HEIGHT if full_page else 0
+        job = {
+            "blocks": self.document.blocks(),
+            "full_page": full_page,
+            "is_dark": is_dark,
+            "virtual": virtual,
+            "eager_height": eager_height,
+            "base_href": base_url.toString(),
+        }
+        self._pending_render = {
+            "generation": self._render_worker.submit(job),
+            "signature": signature,
+            "page_signature": page_signature,
+            "base_url": base_url,
+            "full_page": job["full_page"],
+            "virtual": virtual,
+        }
+
+    def _render_preview_job(self, job, is_cancelled):
+        """在渲染线程中执行：逐块渲染，整页更新时顺带拼好完整 HTML"""
+        rendered = self.controller.render_blocks(
+            blocks=job["blocks"], is_cancelled=is_cancelled, eager_height=job["eager_height"]
+        )
+        if rendered is None:
+            return None
+        html = None
+        if job["full_page"]:
+            html = self.controller.render_preview(
+                is_dark=job["is_dark"], rendered=rendered, virtual=job["virtual"], bridge=True,
+                base_href=job["base_href"]
             )
-            self.preview.page().runJavaScript(js)
+        return rendered, html
+
+    def _on_render_finished(self, generation, result):
+        pending = self._pending_render
+        if pending is None or pending["generation"] != generation:
+            return
+        self._pending_render = None
+        if not self.document.has_file:
+            return
+
+        rendered, html = result
+        base_url = pending["base_url"]
+        self._preview_virtual = pending["virtual"]
+        if pending["full_page"]:
+            self._restore_preview_scroll = self._keep_preview_scroll_once
+            self._deferred_patch = None
+            self._preview_loading = True
+            self._preview_loaded = False
+            self._preview_ready_timer.stop()
+            self._load_preview_page(html, base_url)
+            self._preview_block_ids = {item.block_id for item in rendered}
+        elif self._preview_loading:
+            # 页面尚未完成装饰，只保留最新的一次补丁
+            self._deferred_patch = (rendered, base_url, self._keep_preview_scroll_once)
         else:
-            html = self.controller.render_preview(is_dark=is_dark)
-            self.preview.setHtml(html, base_url)
-            self._preview_loaded = True
+            self._apply_preview_patch(rendered, base_url, self._keep_preview_scroll_once)
+        self._preview_rendered = rendered
+        self._preview_items = None
 
         self.controller._cached_html_template = None
-        self._last_md5 = current_md5
-        self._last_preview_page_signature = page_signature
+        self._last_signature = pending["signature"]
+        self._last_preview_page_signature = pending["page_signature"]
         self._keep_preview_scroll_once = True
-        self._preview_updating = False
-
-        if self._preview_dirty:
-            self._preview_dirty = False
-            QTimer.singleShot(0, self._do_preview_update)
 
         self._updatePreviewRoundMask()
 
+    def _load_preview_page(self, html, base_url):
+        """整页写入临时目录后按 file:// 地址载入；setHtml 超过 2 MB 时页面空白。
+
+        页面中的 <base> 指向文档目录，相对路径仍按文档解析。写入失败时退回 setHtml。
+        """
+        from PyQt5.QtCore import QUrl
+        try:
+            if self._preview_page_dir is None:
+                self._preview_page_dir = tempfile.mkdtemp(prefix="fmd-preview-")
+                QApplication.instance().aboutToQuit.connect(
+                    lambda: shutil.rmtree(self._preview_page_dir, ignore_errors=True)
+                )
+            self._preview_page_serial += 1
+            # 每次用新文件名，避免同一地址被当作刷新；旧页面已载入内存，文件随即删除
+            name = f"page-{self._preview_page_serial}.html"
+            page_path = os.path.join(self._preview_page_dir, name)
+            with open(page_path, "w", encoding="utf-8") as f:
+                f.write(html)
+            for old_name in os.listdir(self._preview_page_dir):
+                if old_name != name:
+                    try:
+                        os.remove(os.path.join(self._preview_page_dir, old_name))
+                    except OSError:
+                        pass
+        except OSError:
+            self.preview.setHtml(html, base_url)
+            return
+        self.preview.load(QUrl.fromLocalFile(page_path))
+
+    def _provide_preview_blocks(self, block_ids):
+        """虚拟化预览按 id 取块：在当前渲染结果中找到块，未渲染的此时渲染（见 PreviewBridge.requestBlocks）"""
+        items = self._preview_item_map()
+        return {
+            block_id: self.controller.render_block_html(items[block_id])
+            for block_id in block_ids if block_id in items
+        }
+
+    def _preview_item_map(self):
+        if self._preview_items is None:
+            self._preview_items = {item.block_id: item for item in self._preview_rendered or ()}
+        return self._preview_items
+
+    def _apply_preview_patch(self, rendered, base_url, keep_scroll):
+        """只把页面上没有的块发过去，其余块在页面内复用"""
+        import json
+        order, blocks, lines = self.controller.build_block_patch(
+            rendered, self._preview_block_ids, virtual=self._preview_virtual
+        )
+        js = (
+            f'updatePreviewBase({json.dumps(base_url.toString())});'
+            f'patchMarkdownBlocks({json.dumps(order)}, {json.dumps(blocks)}, '
+            f'{str(keep_scroll).lower()}, {json.dumps(lines)});'
+        )
+        self.preview.page().runJavaScript(js, self._on_preview_patched)
+        self._preview_block_ids = {item.block_id for item in rendered}
+
+    def _on_preview_ready(self):
+        """页面通过通道确认整页装饰完成：应用积压的补丁，恢复滚动位置"""
+        if not self._preview_loading:
+            return
+        self._preview_ready_timer.stop()
+        self._preview_loading = False
+        self._preview_loaded = True
+        if self._restore_preview_scroll:
+            self._preview_bridge.scrollRequested.emit(self._preview_bridge.scroll_line)
+        deferred, self._deferred_patch = self._deferred_patch, None
+        if deferred is not None:
+            self._apply_preview_patch(*deferred)
+
+    def _on_preview_load_finished(self, ok):
+        # 通道不可用时以 loadFinished 兜底，稍等片刻让 pageReady 优先到达
+        if self._preview_loading:
+            self._preview_ready_timer.start(self.PREVIEW_READY_FALLBACK_DELAY)
+
+    def _cancel_preview_render(self):
+        self._render_worker.cancel()
+        self._pending_render = None
+
+    def _on_preview_patched(self, ok):
+        """增量更新失败（页面未就绪或块状态不一致）时整页重载"""
+        if ok is True:
+            return
+        self._last_signature = None
+        self._preview_loaded = False
+        QTimer.singleShot(0, self._do_preview_update)
+
     def update_editor_style(self):
         is_dark = isDarkTheme()
         size = self.controller.font_size
@@ -1307,12 +1519,13 @@ class MarkdownWidget(QFrame):
         # 同步暗色模式到行号和高亮器
         self.editor.set_dark_mode(is_dark)
         if hasattr(self, '_highlighter'):
-            self._highlighter.set_dark_mode(is_dark)
+            self._highlighter.set_dark_mode(is_dark, self.editor.firstVisibleBlock().blockNumber())
 
     def update_status_bar(self):
-        text = self.editor.toPlainText()
-        self.char_count_label.setText(f"字符: {len(text)}")
-        self.selection_label.setText(f"选中: {len(self.editor.textCursor().selectedText())}")
+        # characterCount 由 QTextDocument 维护，含末尾段落分隔符；选区长度直接由端点相减
+        cursor = self.editor.textCursor()
+        self.char_count_label.setText(f"字符: {self.editor.document().characterCount() - 1}")
+        self.selection_label.setText(f"选中: {cursor.selectionEnd() - cursor.selectionStart()}")
 
         from models.themes import PreviewThemes
         theme_info = PreviewThemes.get_theme_styles(self.controller.preview_theme)
@@ -1323,12 +1536,15 @@ class MarkdownWidget(QFrame):
         themes = PreviewThemes.get_available_themes()
         if 0 <= index < len(themes):
             self.controller.set_theme(themes[index])
-            self._last_md5 = None
+            self._last_signature = None
             self.controller._cached_html_template = None
             self.update_preview()
             self.update_status_bar()
 
     def new_file(self):
+        self._cancel_file_load()
+        self._journal.reset()
+        self._file_watcher.watch(None)
         self.document.new()
         self.editor.blockSignals(True)
         self.editor.clear()
@@ -1349,7 +1565,14 @@ class MarkdownWidget(QFrame):
         if not file_path:
             return
 
+        self._cancel_file_load()
+        if is_large_file(file_path):
+            self._open_large_file(file_path)
+            return
+
         if self.document.load(file_path):
+            self._journal.reset(file_path)
+            self._file_watcher.watch(file_path)
             self.editor.blockSignals(True)
             self.editor.setPlainText(self.document.content)
             self.editor.blockSignals(False)
@@ -1360,18 +1583,176 @@ class MarkdownWidget(QFrame):
             self._update_window_title()
             self._start_auto_save_timer()
             self._keep_preview_scroll_once = False
-            # 切换文件时不重置 _last_md5，让增量更新路径生效
+            # 切换文件时不重置 _last_signature，让增量更新路径生效
             QTimer.singleShot(0, self._do_preview_update)
 
+    def _open_large_file(self, file_path):
+        """大文件：mmap 增量解码后分块追加到编辑器，载入完成前编辑器只读、预览暂停"""
+        self._cancel_preview_render()
+        self._auto_save_timer.stop()
+        self.editor.blockSignals(True)
+        self.editor.clear()
+        self.editor.setReadOnly(True)
+        self._hide_welcome_page()
+
+        self.load_progress.setValue(0)
+        self.load_progress.show()
+        self._file_loader = ChunkedFileLoader(self.editor.document(), file_path, self)
+        self._file_loader.progress.connect(self.load_progress.setValue)
+        self._file_loader.finished.connect(self._on_large_file_loaded)
+        self._file_loader.failed.connect(self._on_large_file_failed)
+        self._file_loader.start()
+
+    def _end_file_load(self):
+        self._file_loader.deleteLater()
+        self._file_loader = None
+        self.load_progress.hide()
+        self.editor.setReadOnly(False)
+        self.editor.blockSignals(False)
+
+    def _cancel_file_load(self):
+        if self._file_loader is None:
+            return
+        self._file_loader.cancel()
+        self._end_file_load()
+
+    def _on_large_file_loaded(self, file_path):
+        digest = self._file_loader.digest()
+        self._end_file_load()
+        self.document.finish_chunked_load(file_path, digest)
+        self._journal.reset(file_path)
+        self._file_watcher.watch(file_path)
+        self.editor.moveCursor(QTextCursor.Start)
+        self._update_command_bar_enabled()
+        self._update_history_menu()
+        self._update_window_title()
+        self.update_status_bar()
+        self._start_auto_save_timer()
+        self._keep_preview_scroll_once = False
+        QTimer.singleShot(0, self._do_preview_update)
+
+    def _on_large_file_failed(self, file_path, error):
+        self._end_file_load()
+        # 编辑器中只有部分内容，不再与原先打开的文件关联
+        self.new_file()
+        self._show_info_dialog("打开失败", f"无法读取文件：{os.path.basename(file_path)}\n{error}")
+
     def save_file_dialog(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "Save File", "", "Markdown Files (*.md);;All Files (*)")
         self.save_file(file_path)
 
     def save_file(self, file_path=None):
-        if self.document.save(file_path):
-            self.document.is_modified = False
-            self._update_window_title()
-            self._start_auto_save_timer()
+        """取内容快照交给保存线程，写入完成后由 _on_save_finished 更新状态"""
+        if self._file_loader is not None:
+            # 编辑器里只有部分内容，不能写回
+            return
+        snapshot = self.document.begin_save(file_path)
+        if snapshot is None:
+            return
+        save_path, content, revision = snapshot
+        self._file_watcher.hold()
+        self._save_service.save(save_path, content, revision)
+        self._update_window_title()
+        self._start_auto_save_timer()
+
+    def _on_save_finished(self, file_path, revision, error, state):
+        if error:
+            self.document.abort_save(file_path, revision)
+            if not self._save_service.is_pending(file_path):
+                self._file_watcher.release()
+            self._show_info_dialog("保存失败", f"无法写入文件：{os.path.basename(file_path)}\n{error}")
+            return
+        if self.document.finish_save(file_path, revision, state):
+            self._journal.reset(file_path)
+        elif file_path == self.document.file_path:
+            # 快照之后又有编辑，日志原先引用的文件内容已被覆盖，改记全文
+            self._journal.checkpoint(self.document.content, file_path)
+        if file_path == self.document.file_path:
+            self._file_watcher.watch(file_path)
+        if not self._save_service.is_pending(file_path):
+            self._file_watcher.release()
+        self._update_window_title()
+
+    def _on_external_change(self, file_path, state):
+        """磁盘上的文件被其他程序修改：未修改时直接重新载入，否则询问合并或保留。
+
+        state 带有 FileWatcher 在后台算好的哈希，只在需要正文时（重新载入、合并、保留合并基准）才读取文件；
+        大文件经 ChunkedFileLoader 分块重新载入，不在界面线程一次性读入。
+        """
+        if file_path != self.document.file_path or self._external_change_pending:
+            return
+        if self._file_loader is not None:
+            return
+        if not state.digest:
+            # 后台读取或解码失败，等下一次变化再处理
+            return
+        if not self.document.is_modified:
+            self._reload_from_disk(file_path, state)
+            return
+
+        name = os.path.basename(file_path)
+        base = self.document.disk_text
+        self._external_change_pending = True
+        try:
+            if base is not None:
+                if self._show_yes_no_dialog(
+                    "文件已在外部修改",
+                    f"磁盘上的 {name} 已被其他程序修改。合并：保留编辑器中未保存的修改并并入磁盘上的修改；"
+                    f"保留：忽略磁盘上的修改，保存时将覆盖。",
+                    "合并", "保留"
+                ):
+                    disk_text = self._read_disk_text(file_path)
+                    if disk_text is None:
+                        return
+                    merged, conflicts = merge_texts(base, self.document.content, disk_text)
+                    self._apply_disk_text(file_path, merged, disk_text, state)
+                    if conflicts:
+                        self._show_info_dialog("合并有冲突", f"有 {conflicts} 处修改冲突，已用 <<<<<<< 和 >>>>>>> 标出。")
+                    return
+            elif self._show_yes_no_dialog(
+                "文件已在外部修改",
+                f"磁盘上的 {name} 已被其他程序修改。重新载入将丢弃编辑器中未保存的修改。",
+                "重新载入", "保留"
+            ):
+                self._reload_from_disk(file_path, state)
+                return
+            # 保留编辑器中的版本：以磁盘上的新状态为准，不再重复提示；
+            # 新内容能作为下次合并的基准时才读取，否则只记录哈希
+            disk_text = None if state.size > LARGE_FILE_SIZE else self._read_disk_text(file_path)
+            self.document.set_disk_content(file_path, disk_text, state=state)
+        finally:
+            self._external_change_pending = False
+
+    def _reload_from_disk(self, file_path, state):
+        """用磁盘上的内容替换编辑器内容；大文件分块重新载入"""
+        if state.size > LARGE_FILE_SIZE:
+            self._open_large_file(file_path)
+            return
+        disk_text = self._read_disk_text(file_path)
+        if disk_text is not None:
+            self._apply_disk_text(file_path, disk_text, disk_text, state)
+
+    def _read_disk_text(self, file_path):
+        """读取 file_path 的全文，失败时返回 None"""
+        try:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return f.read()
+        except (OSError, ValueError):
+            return None
+
+    def _apply_disk_text(self, file_path, text, disk_text, state):
+        """把编辑器内容改为 text（重新载入或合并的结果），只替换有差异的行，保留滚动位置和撤销历史"""
+        scrollbar = self.editor.verticalScrollBar()
+        scroll = scrollbar.value()
+        self.controller.apply_text(text)
+        scrollbar.setValue(scroll)
+        self.document.set_disk_content(file_path, disk_text, state=state)
+        self.document.is_modified = text != disk_text
+        if self.document.is_modified:
+            self._journal.checkpoint(text, file_path)
+        else:
+            self._journal.reset(file_path)
+        self._update_window_title()
 
     def copy(self):
         self.editor.copy()
@@ -1387,7 +1768,6 @@ class MarkdownWidget(QFrame):
                 if image.save(file_path, "PNG"):
                     file_url = self._local_path_to_url(file_path)
                     self.editor.textCursor().insertText(f"![{file_name}]({file_url})")
-                    self.controller.set_content(self.editor.toPlainText())
                     self.update_preview()
                     return
         self.editor.paste()
@@ -1398,14 +1778,23 @@ class MarkdownWidget(QFrame):
             return
         # 通过 JS 获取预览区的 innerHTML
         self.preview.page().runJavaScript(
-            'document.querySelector(".scroll") ? document.querySelector(".scroll").innerHTML : ""',
+            'typeof getPreviewHtml === "function" ? getPreviewHtml() : ""',
             self._on_rich_text_ready
         )
 
     def _on_rich_text_ready(self, html_content):
         if not html_content:
             return
+        import re
         from PyQt5.QtCore import QMimeData
+        if self._preview_virtual:
+            # 虚拟化预览中未插入的块以 <!--fmd-block:id--> 标记，在这里补上内容
+            items = self._preview_item_map()
+            html_content = re.sub(
+                r"<!--fmd-block:([\w-]+)-->",
+                lambda m: self.controller.render_block_html(items[m.group(1)]) if m.group(1) in items else "",
+                html_content,
+            )
         mime_data = QMimeData()
         mime_data.setHtml(html_content)
         # 同时设置纯文本作为 fallback
@@ -1414,28 +1803,92 @@ class MarkdownWidget(QFrame):
         self._show_info_dialog("复制成功", "预览内容已复制为富文本，可直接粘贴到飞书、钉钉、邮件等应用。")
 
     def _on_task_toggled(self, task_index, checked):
-        """预览中 checkbox 被点击时，同步修改编辑器中对应的 - [ ] / - [x]"""
+        """预览中 checkbox 被点击时，只改编辑器中对应 [ ]/[x] 的一个字符"""
+        import json
         import re
-        text = self.editor.toPlainText()
-        pattern = re.compile(r'^(\s*[-*+]\s*)\[([ xX])\]', re.MULTILINE)
-        count = 0
-        for match in pattern.finditer(text):
-            if count == task_index:
-                old_mark = match.group(2)
-                new_mark = "x" if checked else " "
-                start = match.start(2)
-                end = match.end(2)
-                new_text = text[:start] + new_mark + text[end:]
-                cursor_pos = self.editor.textCursor().position()
-                self.editor.blockSignals(True)
-                self.editor.setPlainText(new_text)
-                cursor = self.editor.textCursor()
-                cursor.setPosition(min(cursor_pos, len(new_text)))
-                self.editor.setTextCursor(cursor)
-                self.editor.blockSignals(False)
-                self.controller.set_content(new_text)
+        located = None
+        preview_current = (
+            self._preview_rendered is not None
+            and self._last_signature is not None
+            and self._last_signature[0] == self.document.revision
+        )
+        if preview_current:
+            located = self.controller.locate_task(self._preview_rendered, task_index)
+        if located is not None:
+            item, line_no, col = located
+            text = self.editor.document().findBlockByNumber(line_no).text()
+            if not (0 < col < len(text) - 1 and text[col - 1] == "[" and text[col + 1] == "]"):
+                # 渲染结果已落后于编辑器内容
+                located = None
+        if located is None:
+            item = None
+            pattern = re.compile(r'^(\s*[-*+]\s*)\[([ xX])\]')
+            count = 0
+            for line_no, text in enumerate(self.controller.get_content().split("\n")):
+                match = pattern.match(text)
+                if match:
+                    if count == task_index:
+                        col = match.start(2)
+                        break
+                    count += 1
+            else:
                 return
-            count += 1
+
+        block = self.editor.document().findBlockByNumber(line_no)
+        start = block.position() + len(text[:col].encode("utf-16-le")) // 2
+        cursor = QTextCursor(self.editor.document())
+        cursor.setPosition(start)
+        cursor.setPosition(start + 1, QTextCursor.KeepAnchor)
+        cursor.insertText("x" if checked else " ")
+
+        if item is None:
+            return
+        new_id = self.controller.toggle_task_block(item, task_index, checked)
+        if new_id is None:
+            return
+        # 预览中的复选框已是新状态，把块 id 换成新内容对应的 id，之后的增量更新不会替换该块
+        self._preview_block_ids.discard(item.block_id)
+        self._preview_block_ids.add(new_id)
+        self.preview.page().runJavaScript(
+            f'rekeyMarkdownBlock({json.dumps(item.block_id)}, {json.dumps(new_id)})',
+            lambda ok: ok is True or self._preview_block_ids.discard(new_id)
+        )
+
+    def _on_outline_clicked(self, index, text):
+        """预览大纲被点击时，把编辑器光标移到对应标题行"""
+        import re
+        heading = re.compile(r'^ {0,3}#{1,4}\s+(.*?)(?:\s+#+)?\s*$')
+        fence = re.compile(r'^ {0,3}(`{3,}|~{3,})')
+        lines = []
+        in_fence = None
+        block = self.editor.document().begin()
+        while block.isValid():
+            line = block.text()
+            match = fence.match(line)
+            if in_fence is not None:
+                if match and match.group(1)[0] == in_fence:
+                    in_fence = None
+            elif match:
+                in_fence = match.group(1)[0]
+            else:
+                match = heading.match(line)
+                if match:
+                    lines.append((block.blockNumber(), match.group(1)))
+            block = block.next()
+        if not lines:
+            return
+        # 优先按标题文本定位（同名标题取与序号最接近的一个），否则按序号
+        same = [i for i, (_, title) in enumerate(lines) if title.strip() == text.strip()]
+        if same:
+            line_no = lines[min(same, key=lambda i: abs(i - index))][0]
+        else:
+            line_no = lines[min(index, len(lines) - 1)][0]
+        cursor = QTextCursor(self.editor.document().findBlockByNumber(line_no))
+        # 预览已自行滚动到标题，编辑器这次滚动不再反向同步
+        self._suppress_scroll_sync = True
+        self.editor.setTextCursor(cursor)
+        self.editor.centerCursor()
+        self._suppress_scroll_sync = False
 
     def _on_images_dropped(self, image_paths):
         """拖拽图片到编辑器时插入 Markdown 图片标记"""
@@ -1448,7 +1901,6 @@ class MarkdownWidget(QFrame):
             url = self._local_path_to_url(path)
             lines.append(f"![{name}]({url})")
         cursor.insertText("\n".join(lines))
-        self.controller.set_content(self.editor.toPlainText())
         self.update_preview()
 
     def _on_md_file_dropped(self, file_path):
@@ -1466,7 +1918,6 @@ class MarkdownWidget(QFrame):
             image_name = os.path.basename(file_path)
             file_url = self._local_path_to_url(file_path)
             self.editor.textCursor().insertText(f"![{image_name}]({file_url})")
-            self.controller.set_content(self.editor.toPlainText())
             self.update_preview()
 
     def _local_path_to_url(self, path):
@@ -1551,6 +2002,7 @@ class MarkdownWidget(QFrame):
     def export_file(self):
         if not self.document.has_file:
             return
+        self._prewarm_pdf_export()
         file_path, file_type = QFileDialog.getSaveFileName(
             self, "Export File", "",
             "PDF Files (*.pdf);;Word Files (*.docx);;HTML Files (*.html);;All Files (*)"
@@ -1579,47 +2031,116 @@ class MarkdownWidget(QFrame):
             self._export_pdf_via_webengine(file_path)
             return
         elif ext == '.docx':
-            success, message = ExportController.export_word(file_path, content)
+            base_dir = os.path.dirname(self.document.file_path) if self.document.file_path else None
+            success, message = ExportController.export_word(
+                file_path, content, self.controller.render_body_html(), base_dir
+            )
         elif ext == '.html':
-            rendered_html = self.controller.render_preview(is_dark=False)
-            success, message = ExportController.export_html(file_path, rendered_html)
+            self._export_static_html(file_path)
+            return
 
         self._show_info_dialog("导出成功" if success else "导出失败", message)
 
-    def _export_pdf_via_webengine(self, file_path):
-        """通过 WebEngineView 导出 PDF，完美支持中文和样式"""
-        from PyQt5.QtCore import QMarginsF, QUrl
-        from PyQt5.QtWebEngineWidgets import QWebEngineView, QWebEnginePage
-        from PyQt5.QtGui import QPageLayout, QPageSize
-
-        html = self.controller.render_preview(is_dark=False)
-        # 去掉容器高度限制和 overflow 裁剪，让内容自然展开
-        html = html.replace('height: 100%;', 'height: auto;')
-        html = html.replace('overflow: hidden;', 'overflow: visible;')
-        html = html.replace('overflow-y: auto;', 'overflow-y: visible;')
-        temp_view = QWebEngineView()
+    def _pdf_shell(self):
+        """PDF 导出用的页面骨架（不含正文的完整页面）及基础 URL"""
+        from PyQt5.QtCore import QUrl
+
+        shell_html = self.controller.render_preview(is_dark=False, rendered=[])
         if self.document.file_path:
             base_url = QUrl.fromLocalFile(os.path.dirname(self.document.file_path) + '/')
         else:
             base_url = QUrl.fromLocalFile(os.getcwd() + '/')
+        return shell_html, base_url
 
-        def on_load_finished(ok):
-            if not ok:
-                self._show_info_dialog("导出失败", "页面加载失败")
-                temp_view.deleteLater()
-                return
-            page_layout = QPageLayout(
-                QPageSize(QPageSize.A4),
-                QPageLayout.Portrait,
-                QMarginsF(15, 15, 15, 15)
-            )
-            temp_view.page().printToPdf(
-                lambda data: self._on_pdf_exported(data, file_path, temp_view),
-                page_layout
-            )
+    def _pdf_exporter(self):
+        """按需创建 PDF 导出服务（其中的 WebEngine 视图较重，不在启动时创建）"""
+        if self._pdf_export_service is None:
+            from views.pdf_export_service import PdfExportService
+            self._pdf_export_service = PdfExportService(self)
+            self._pdf_export_service.export_finished.connect(self._on_pdf_exported)
+            self._pdf_export_service.body_captured.connect(self._on_html_body_captured)
+        return self._pdf_export_service
+
+    def _prewarm_pdf_export(self):
+        """打开导出对话框时预先载入页面骨架，选好路径后只需替换正文即可打印"""
+        self._pdf_exporter().prewarm(*self._pdf_shell())
+
+    def _export_pdf_via_webengine(self, file_path):
+        """通过 WebEngineView 导出 PDF，完美支持中文和样式"""
+        shell_html, base_url = self._pdf_shell()
+        self._pdf_single_exports.add(file_path)
+        rendered = self.controller.render_blocks()
+        page_html = self.controller.render_preview(is_dark=False, rendered=rendered)
+        body_html = self.controller.render_body_html(rendered)
+        self._pdf_exporter().export(file_path, shell_html, page_html, body_html, base_url)
+
+    def _export_static_html(self, file_path):
+        """在隐藏视图中渲染正文（代码高亮、公式、Mermaid），取回静态结果后打包为独立 HTML"""
+        shell_html, base_url = self._pdf_shell()
+        base_dir = os.path.dirname(self.document.file_path) if self.document.file_path else None
+        self._html_exports[file_path] = (self.controller.page_builder(is_dark=False), base_dir)
+        rendered = self.controller.render_blocks()
+        page_html = self.controller.render_preview(is_dark=False, rendered=rendered)
+        body_html = self.controller.render_body_html(rendered)
+        self._pdf_exporter().capture(file_path, shell_html, page_html, body_html, base_url)
+
+    def _on_html_body_captured(self, file_path, body_html, error):
+        if file_path not in self._html_exports:
+            return
+        builder, base_dir = self._html_exports.pop(file_path)
+        if error:
+            self._show_info_dialog("导出失败", error)
+            return
+        success, message = ExportController.export_static_html(file_path, body_html, builder, base_dir)
+        self._show_info_dialog("导出成功" if success else "导出失败", message)
+
+    def batch_export(self, formats):
+        """把一个目录中的 Markdown 文件批量导出到另一个目录，未修改的文件跳过"""
+        if self._batch_exporter is not None and self._batch_exporter.is_running():
+            self._show_info_dialog("批量导出", "已有批量导出正在进行")
+            return
+        source_dir = QFileDialog.getExistingDirectory(self, "选择 Markdown 文件所在目录")
+        if not source_dir:
+            return
+        output_dir = QFileDialog.getExistingDirectory(self, "选择导出目录")
+        if not output_dir:
+            return
+        if self._batch_exporter is None:
+            from controllers.batch_export import BatchExporter
+            self._batch_exporter = BatchExporter(self._pdf_exporter(), self)
+            self._batch_exporter.progress.connect(self._on_batch_progress)
+            self._batch_exporter.file_failed.connect(self._on_batch_file_failed)
+            self._batch_exporter.finished.connect(self._on_batch_finished)
+            QApplication.instance().aboutToQuit.connect(self._batch_exporter.cancel)
+        self._batch_failures = []
+        self.export_progress.setValue(0)
+        self.export_progress.show()
+        self._batch_exporter.start(
+            source_dir, output_dir, formats, self.controller.preview_theme, self.controller.font_size,
+            self.controller.local_assets
+        )
+
+    def cancel_batch_export(self):
+        if self._batch_exporter is not None:
+            self._batch_exporter.cancel()
 
-        temp_view.loadFinished.connect(on_load_finished)
-        temp_view.setHtml(html, base_url)
+    def _on_batch_progress(self, done, total):
+        self.export_progress.setRange(0, max(total, 1))
+        self.export_progress.setValue(done)
+        self.export_progress.setToolTip(f"批量导出 {done}/{total}")
+
+    def _on_batch_file_failed(self, file_path, error):
+        self._batch_failures.append(f"{os.path.basename(file_path)}: {error}")
+
+    def _on_batch_finished(self, stats):
+        self.export_progress.hide()
+        message = (
+            f"导出 {stats['exported']} 个，未修改跳过 {stats['skipped']} 个，"
+            f"失败 {stats['failed']} 个，取消 {stats['cancelled']} 个"
+        )
+        if self._batch_failures:
+            message += "\n" + "\n".join(self._batch_failures[:5])
+        self._show_info_dialog("批量导出完成", message)
 
     def _create_fluent_dialog(self, width, height):
         """创建 Fluent Design 风格弹窗基础框架"""
@@ -1693,16 +2214,15 @@ class MarkdownWidget(QFrame):
             "divider": "rgba(255,255,255,0.08)" if is_dark else "rgba(0,0,0,0.06)",
         }
 
-    def _on_pdf_exported(self, pdf_data, file_path, temp_view):
+    def _on_pdf_exported(self, file_path, error):
         """PDF 导出回调"""
-        try:
-            with open(file_path, 'wb') as f:
-                f.write(pdf_data.data())
+        if file_path not in self._pdf_single_exports:
+            return
+        self._pdf_single_exports.discard(file_path)
+        if error:
+            self._show_info_dialog("导出失败", error)
+        else:
             self._show_info_dialog("导出成功", f"PDF 已成功导出到:\n{file_path}")
-        except Exception as e:
-            self._show_info_dialog("导出失败", f"写入 PDF 文件时出错:\n{str(e)}")
-        finally:
-            temp_view.deleteLater()
 
     def _show_info_dialog(self, title, content):
         from PyQt5.QtWidgets import QVBoxLayout, QLabel, QPushButton, QHBoxLayout
@@ -1763,7 +2283,7 @@ class MarkdownWidget(QFrame):
 
         dialog.exec()
 
-    def _show_yes_no_dialog(self, title, content):
+    def _show_yes_no_dialog(self, title, content, yes_text="保存", no_text="不保存"):
         from PyQt5.QtWidgets import QVBoxLayout, QLabel, QPushButton, QHBoxLayout, QDialog
         from PyQt5.QtCore import Qt
 
@@ -1800,7 +2320,7 @@ class MarkdownWidget(QFrame):
         button_layout.setSpacing(8)
         button_layout.addStretch()
 
-        save_btn = QPushButton("保存")
+        save_btn = QPushButton(yes_text)
         save_btn.setFixedSize(120, 32)
         save_btn.setCursor(Qt.PointingHandCursor)
         save_btn.setStyleSheet(f"""
@@ -1818,7 +2338,7 @@ class MarkdownWidget(QFrame):
         save_btn.clicked.connect(dialog.accept)
         button_layout.addWidget(save_btn)
 
-        discard_btn = QPushButton("不保存")
+        discard_btn = QPushButton(no_text)
         discard_btn.setFixedSize(120, 32)
         discard_btn.setCursor(Qt.PointingHandCursor)
         discard_btn.setStyleSheet(f"""
@@ -1843,13 +2363,55 @@ class MarkdownWidget(QFrame):
         return result == QDialog.Accepted
 
     def _auto_save(self):
-        if self.document.has_file and self.document.is_modified and self.document.file_path:
+        """定期整理崩溃恢复日志；未保存的内容由日志保护，不再整篇写回文件"""
+        self._journal.flush()
+        if self._journal.needs_compaction():
+            self._journal.checkpoint(self.document.content, self.document.file_path)
+
+    def _on_edit(self, position, chars_removed, inserted):
+        """编辑器内容变化时记入日志；载入文件等屏蔽信号的整篇替换不记录"""
+        if self.editor.signalsBlocked() or not self.document.has_file:
+            return
+        self._journal.record(position, chars_removed, inserted)
+        if not self._journal_timer.isActive():
+            self._journal_timer.start(self.JOURNAL_FLUSH_DELAY)
+
+    def _recover_journal(self):
+        """启动时检查异常退出的实例留下的内容，确认后恢复到编辑器；丢弃时继续检查下一份"""
+        recovered = self._journal.recover()
+        if recovered is None:
+            return
+        file_path, text = recovered
+        disk_text = None
+        if file_path and os.path.isfile(file_path):
             try:
-                with open(self.document.file_path, 'w', encoding='utf-8') as f:
-                    f.write(self.editor.toPlainText())
-                self.document.is_modified = False
-            except Exception:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    disk_text = f.read()
+            except (OSError, ValueError):
                 pass
+            if disk_text == text:
+                self._journal.reset()
+                QTimer.singleShot(0, self._recover_journal)
+                return
+        name = os.path.basename(file_path) if file_path else "未命名"
+        if not self._show_yes_no_dialog(
+            "恢复未保存的内容", f"检测到 {name} 有上次未保存的修改，是否恢复？", "恢复", "丢弃"
+        ):
+            self._journal.reset()
+            QTimer.singleShot(0, self._recover_journal)
+            return
+        self.new_file()
+        self.editor.blockSignals(True)
+        self.editor.setPlainText(text)
+        self.editor.blockSignals(False)
+        self.document.file_path = file_path
+        self.document.is_modified = True
+        if disk_text is not None:
+            self.document.set_disk_content(file_path, disk_text)
+        self._file_watcher.watch(file_path)
+        self._journal.checkpoint(text, file_path)
+        self._update_window_title()
+        self.update_status_bar()
 
     def _start_auto_save_timer(self):
         self._auto_save_timer.start(self._auto_save_interval)
@@ -1867,6 +2429,8 @@ class MarkdownWidget(QFrame):
                     self.save_file()
                 else:
                     self.save_file_dialog()
+            else:
+                self._journal.reset()
         return True
 
     def _open_md_preview_window(self, file_path):
@@ -1881,9 +2445,8 @@ class MarkdownWidget(QFrame):
         from PyQt5.QtWebEngineWidgets import QWebEngineView
         from PyQt5.QtCore import QUrl
         from qfluentwidgets import FluentWidget
-        import markdown
 
-        html_body = markdown.markdown(md_content, extensions=['fenced_code', 'extra', 'tables'])
+        html_body = self.controller.convert_markdown(md_content)
         is_dark = isDarkTheme()
         ts = self.controller._get_theme_styles(is_dark)
         full_html = self.controller._build_html(html_body, ts, is_dark)
@@ -1948,17 +2511,23 @@ class MarkdownWidget(QFrame):
         self._md_preview_windows.append(preview_win)
 
     def _sync_preview_scroll(self):
-        """编辑器滚动时同步预览滚动位置"""
+        """编辑器滚动时同步预览滚动位置，每帧最多发送一次"""
+        if self._suppress_scroll_sync or self._scroll_sync_timer.isActive():
+            return
+        self._scroll_sync_timer.start(self.PREVIEW_SCROLL_SYNC_INTERVAL)
+
+    def _send_preview_scroll(self):
+        """把编辑器顶部所在的源码行（含行内比例）发给预览，滚到底时发 -1"""
         scrollbar = self.editor.verticalScrollBar()
-        max_val = scrollbar.maximum()
-        if max_val <= 0:
+        if scrollbar.maximum() > 0 and scrollbar.value() >= scrollbar.maximum():
+            self._preview_bridge.scrollRequested.emit(-1.0)
             return
-        ratio = scrollbar.value() / max_val
-        js = f"syncScrollTo({ratio});"
-        try:
-            self.preview.page().runJavaScript(js)
-        except Exception:
-            pass
+        block = self.editor.firstVisibleBlock()
+        if not block.isValid():
+            return
+        rect = self.editor.blockBoundingGeometry(block).translated(self.editor.contentOffset())
+        fraction = min(max(-rect.top() / rect.height(), 0.0), 1.0) if rect.height() > 0 else 0.0
+        self._preview_bridge.scrollRequested.emit(block.blockNumber() + fraction)
 
     def _updatePreviewRoundMask(self):
         if not hasattr(self, "preview_container"):
@@ -0,0 +1,250 @@
+"""预热的 QWebEngineView 池，用于把预览页打印为 PDF 或取出渲染完成的正文"""
+
+import hashlib
+import json
+from collections import deque
+
+from PyQt5.QtCore import QMarginsF, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QPageLayout, QPageSize
+from PyQt5.QtWebEngineWidgets import QWebEngineView
+
+
+def printable_html(html):
+    """去掉容器高度限制和 overflow 裁剪，让内容在打印时自然展开"""
+    html = html.replace('height: 100%;', 'height: auto;')
+    html = html.replace('overflow: hidden;', 'overflow: visible;')
+    return html.replace('overflow-y: auto;', 'overflow-y: visible;')
+
+
+class _PdfView:
+    """池中的一个隐藏视图及其当前载入的页面骨架"""
+
+    def __init__(self):
+        self.view = QWebEngineView()
+        # 已载入页面（样式、脚本）的标识；None 表示尚未载入或载入失败
+        self.shell_key = None
+        self.loading_key = None
+        self.loading = False
+        # 导出任务 (输出路径, 骨架标识, "pdf" 或 "html")，空闲时为 None
+        self.job = None
+        # 任务落在正在预热的视图上时，载入完成后再替换的 (正文, 基础 URL)
+        self.pending_body = None
+        self.settle_deadline = 0
+
+
+class PdfExportService(QObject):
+    """排队导出 PDF，复用池中已载入前端资源的隐藏视图。
+
+    页面骨架（head 中的样式和 highlight.js / KaTeX / Mermaid 脚本）相同的导出，
+    复用已载入该骨架的视图，只通过 replaceMarkdownBody 替换正文，省去渲染进程启动
+    和脚本加载；骨架不同（主题、字号变化）或没有空闲视图时才整页载入。
+    正文装饰完成（previewSettled()，含 Mermaid 异步渲染和图片加载）后开始打印。
+    每次导出结束发出 export_finished(PDF 路径, 错误信息)，成功时错误信息为空串。
+    capture 排队的任务不打印，而是取出装饰完成的正文（高亮、公式、图表均已渲染为静态
+    HTML/SVG），发出 body_captured(输出路径, 正文, 错误信息)，用于导出独立 HTML。
+    池中视图空闲 IDLE_RELEASE 毫秒后释放。
+    """
+
+    POOL_SIZE = 2
+    SETTLE_POLL = 50
+    SETTLE_TIMEOUT = 5000
+    IDLE_RELEASE = 5 * 60 * 1000
+
+    export_finished = pyqtSignal(str, str)
+    body_captured = pyqtSignal(str, str, str)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._views = []
+        self._queue = deque()
+        self._idle_timer = QTimer(self)
+        self._idle_timer.setSingleShot(True)
+        self._idle_timer.timeout.connect(self.release)
+        self._settle_timer = QTimer(self)
+        self._settle_timer.setInterval(self.SETTLE_POLL)
+        self._settle_timer.timeout.connect(self._poll_settled)
+
+    @staticmethod
+    def shell_key(shell_html):
+        return hashlib.blake2b(shell_html.encode("utf-8"), digest_size=16).hexdigest()
+
+    def prewarm(self, shell_html, base_url):
+        """提前载入不含正文的页面骨架，之后同骨架的导出只需替换正文"""
+        key = self.shell_key(shell_html)
+        slot = self._free_view(key)
+        if slot is None or slot.shell_key == key or slot.loading:
+            return
+        self._load(slot, printable_html(shell_html), base_url, key)
+
+    def export(self, file_path, shell_html, page_html, body_html, base_url):
+        """排队导出。
+
+        Parameters
+        ----------
+        file_path : str
+            PDF 路径。
+        shell_html : str
+            不含正文的完整页面，用于判断能否复用视图。
+        page_html : str
+            含正文的完整页面，需要整页载入时使用。
+        body_html : str
+            正文 HTML 片段，复用视图时传给 replaceMarkdownBody。
+        base_url : QUrl
+            解析相对路径用的基础 URL。
+        """
+        self._enqueue("pdf", file_path, shell_html, page_html, body_html, base_url)
+
+    def capture(self, file_path, shell_html, page_html, body_html, base_url):
+        """排队渲染正文并取回装饰后的 HTML，参数同 export，结果由 body_captured 发出"""
+        self._enqueue("html", file_path, shell_html, page_html, body_html, base_url)
+
+    def _enqueue(self, kind, file_path, shell_html, page_html, body_html, base_url):
+        self._idle_timer.stop()
+        self._queue.append((file_path, self.shell_key(shell_html), page_html, body_html, base_url, kind))
+        self._dispatch()
+
+    def discard(self, file_paths):
+        """从队列中移除尚未开始的导出，返回被移除的路径"""
+        file_paths = set(file_paths)
+        removed = [job[0] for job in self._queue if job[0] in file_paths]
+        self._queue = deque(job for job in self._queue if job[0] not in file_paths)
+        return removed
+
+    def is_busy(self):
+        return bool(self._queue) or any(slot.job is not None for slot in self._views)
+
+    def release(self):
+        """释放所有空闲视图"""
+        for slot in [slot for slot in self._views if slot.job is None and not slot.loading]:
+            self._views.remove(slot)
+            slot.view.deleteLater()
+
+    def _free_view(self, key):
+        """取一个空闲视图：优先已载入同一骨架的，其次新建，最后挪用其他骨架的"""
+        idle = [slot for slot in self._views if slot.job is None]
+        for slot in idle:
+            if (slot.loading_key if slot.loading else slot.shell_key) == key:
+                return slot
+        if len(self._views) < self.POOL_SIZE:
+            slot = _PdfView()
+            slot.view.loadFinished.connect(lambda ok, slot=slot: self._on_load_finished(slot, ok))
+            self._views.append(slot)
+            return slot
+        idle = [slot for slot in idle if not slot.loading]
+        return idle[0] if idle else None
+
+    def _dispatch(self):
+        while self._queue:
+            file_path, key, page_html, body_html, base_url, kind = self._queue[0]
+            slot = self._free_view(key)
+            if slot is None:
+                return
+            self._queue.popleft()
+            slot.job = (file_path, key, kind)
+            if slot.loading and slot.loading_key == key:
+                slot.pending_body = (body_html, base_url)
+            elif slot.shell_key == key:
+                self._replace_body(slot, body_html, base_url)
+            else:
+                self._load(slot, printable_html(page_html), base_url, key)
+
+    def _load(self, slot, html, base_url, key):
+        slot.shell_key = None
+        slot.loading_key = key
+        slot.loading = True
+        slot.view.setHtml(html, base_url)
+
+    def _replace_body(self, slot, body_html, base_url):
+        """骨架已就绪：只替换正文并更新基础 URL"""
+        js = (
+            f"updatePreviewBase({_js_string(base_url.toString())});"
+            f"replaceMarkdownBody({_js_string(body_html)}, false);"
+        )
+        slot.view.page().runJavaScript(js, lambda result, slot=slot: self._wait_settled(slot))
+
+    def _on_load_finished(self, slot, ok):
+        if slot not in self._views:
+            return
+        slot.loading = False
+        pending, slot.pending_body = slot.pending_body, None
+        if not ok:
+            if slot.job is not None:
+                self._finish(slot, "页面加载失败")
+            return
+        slot.shell_key = slot.loading_key
+        if slot.job is None:
+            # 预热完成
+            self._dispatch()
+        elif pending is not None:
+            self._replace_body(slot, *pending)
+        else:
+            self._wait_settled(slot)
+
+    def _wait_settled(self, slot):
+        slot.settle_deadline = self.SETTLE_TIMEOUT // self.SETTLE_POLL
+        if not self._settle_timer.isActive():
+            self._settle_timer.start()
+
+    def _poll_settled(self):
+        waiting = [slot for slot in self._views if slot.job is not None and slot.settle_deadline > 0]
+        if not waiting:
+            self._settle_timer.stop()
+            return
+        for slot in waiting:
+            slot.settle_deadline -= 1
+            slot.view.page().runJavaScript(
+                "typeof previewSettled === 'function' && previewSettled()",
+                lambda settled, slot=slot: self._on_settled_checked(slot, settled)
+            )
+
+    def _on_settled_checked(self, slot, settled):
+        if slot not in self._views or slot.job is None or slot.settle_deadline < 0:
+            return
+        if not settled and slot.settle_deadline > 0:
+            return
+        # 已就绪，或等待超时仍照常打印
+        slot.settle_deadline = -1
+        if slot.job[2] == "html":
+            slot.view.page().runJavaScript(
+                "getPreviewHtml()", lambda body, slot=slot: self._on_captured(slot, body)
+            )
+            return
+        page_layout = QPageLayout(QPageSize(QPageSize.A4), QPageLayout.Portrait, QMarginsF(15, 15, 15, 15))
+        slot.view.page().printToPdf(lambda data, slot=slot: self._on_printed(slot, data), page_layout)
+
+    def _on_printed(self, slot, data):
+        file_path = slot.job[0]
+        if not data:
+            self._finish(slot, "打印页面失败")
+            return
+        try:
+            with open(file_path, 'wb') as f:
+                f.write(bytes(data))
+        except OSError as e:
+            self._finish(slot, f"写入 PDF 文件时出错:\n{e}")
+            return
+        self._finish(slot, "")
+
+    def _on_captured(self, slot, body):
+        if slot not in self._views or slot.job is None:
+            return
+        if not isinstance(body, str):
+            self._finish(slot, "读取页面内容失败")
+            return
+        self._finish(slot, "", body)
+
+    def _finish(self, slot, error, body=""):
+        file_path, _, kind = slot.job
+        slot.job = None
+        slot.settle_deadline = 0
+        if kind == "html":
+            self.body_captured.emit(file_path, body, error)
+        else:
+            self.export_finished.emit(file_path, error)
+        self._dispatch()
+        if not self.is_busy():
+            self._idle_timer.start(self.IDLE_RELEASE)
+
+
+def _js_string(text):
+    return json.dumps(text, ensure_ascii=False).replace("</", "<\\/")
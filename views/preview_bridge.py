@@ -0,0 +1,59 @@
+"""预览页与编辑器之间的 QWebChannel 通道"""
+
+import json
+
+from PyQt5.QtCore import QObject, pyqtSignal, pyqtSlot
+from PyQt5.QtWebChannel import QWebChannel
+
+BRIDGE_NAME = "previewBridge"
+
+
+class PreviewBridge(QObject):
+    """以 previewBridge 注册到预览页，页面通过 qwebchannel.js 直接调用槽函数。
+
+    页面 -> Python：任务切换、预览滚动位置、大纲点击、整页装饰完成，
+    以及虚拟化预览按块 id 取回块内容（requestBlocks，由 block_provider 提供）；
+    Python -> 页面：scrollRequested，页面将其连接到 syncScrollToLine。
+
+    滚动位置两个方向都用源码行号（可带小数）表示，-1 表示滚到底部。
+    """
+
+    scrollRequested = pyqtSignal(float)
+
+    task_toggled = pyqtSignal(int, bool)
+    outline_clicked = pyqtSignal(int, str)
+    page_ready = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        # 页面最近一次上报的顶部源码行，整页重载后据此恢复位置
+        self.scroll_line = 0.0
+        # block_provider(块 id 列表) -> {块 id: 包装好的 html}，由编辑器设置
+        self.block_provider = None
+
+    def attach(self, page):
+        channel = QWebChannel(page)
+        channel.registerObject(BRIDGE_NAME, self)
+        page.setWebChannel(channel)
+
+    @pyqtSlot(int, bool)
+    def toggleTask(self, index, checked):
+        self.task_toggled.emit(index, checked)
+
+    @pyqtSlot(float)
+    def previewScrolled(self, line):
+        self.scroll_line = line
+
+    @pyqtSlot(int, str)
+    def outlineClicked(self, index, text):
+        self.outline_clicked.emit(index, text)
+
+    @pyqtSlot()
+    def pageReady(self):
+        self.page_ready.emit()
+
+    @pyqtSlot("QVariantList", result=str)
+    def requestBlocks(self, block_ids):
+        if self.block_provider is None:
+            return "{}"
+        return json.dumps(self.block_provider([str(block_id) for block_id in block_ids]), ensure_ascii=False)
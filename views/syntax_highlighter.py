@@ -1,9 +1,173 @@
-"""Markdown 语法高亮器"""
+"""Markdown 语法高亮器
+
+每行只扫描一遍：先按块状态（围栏代码、HTML 块、front matter、公式块）和行首结构
+分类，再用一个合并的行内正则切出 token。token 缓存在 QTextBlockUserData 中，
+切换主题只替换格式表，不重新切分；整篇重新着色按块分批进行，可见区域优先。
+"""
 
 import re
+from PyQt5.QtCore import QTimer
 from PyQt5.QtGui import (
-    QSyntaxHighlighter, QTextCharFormat, QColor, QFont
+    QSyntaxHighlighter, QTextBlockUserData, QTextCharFormat, QColor, QFont
+)
+
+
+# token 类型，作为格式表的下标
+(TOKEN_HEADING, TOKEN_BOLD, TOKEN_ITALIC, TOKEN_CODE, TOKEN_LINK, TOKEN_IMAGE,
+ TOKEN_QUOTE, TOKEN_LIST, TOKEN_HR, TOKEN_STRIKE, TOKEN_FENCE, TOKEN_HTML,
+ TOKEN_MATH, TOKEN_FRONT_MATTER) = range(14)
+
+# 块状态，低 4 位为类型；围栏代码另在高位记录围栏字符和长度
+STATE_NORMAL = 0
+STATE_FRONT_MATTER = 1
+STATE_HTML_BLOCK = 2
+STATE_HTML_COMMENT = 3
+STATE_MATH = 4
+STATE_FENCE = 5
+_STATE_MASK = 0xF
+_FENCE_TILDE = 0x10
+_FENCE_LEN_SHIFT = 8
+
+_FENCE_RE = re.compile(r' {0,3}(`{3,}|~{3,})')
+_HTML_BLOCK_RE = re.compile(
+    r' {0,3}</?(?:address|article|aside|blockquote|details|dialog|div|dl|fieldset|'
+    r'figcaption|figure|footer|form|h[1-6]|header|hr|main|nav|ol|p|pre|section|'
+    r'table|ul|script|style|iframe|canvas|video)(?=[\s>/]|$)',
+    re.IGNORECASE,
 )
+_LINE_RE = re.compile(
+    r'(?P<heading>#{1,6}\s+.+)'
+    r'|(?P<hr>(?:-{3,}|\*{3,}|_{3,})\s*$)'
+    r'|(?P<quote>>\s+.+)'
+    r'|(?P<list>\s*(?:[-*+]|\d+\.)\s)'
+)
+_INLINE_RE = re.compile(
+    r'(?P<code>`[^`\n]+`)'
+    r'|(?P<image>!\[[^\]]*\]\([^)]+\))'
+    r'|(?P<link>\[[^\]]+\]\([^)]+\))'
+    r'|(?P<bold>\*\*[^*]+\*\*|__[^_]+__)'
+    r'|(?P<strike>~~[^~]+~~)'
+    r'|(?P<italic>(?<!\*)\*(?!\*)[^*]+\*(?!\*)|(?<!_)_(?!_)[^_]+_(?!_))'
+    r'|(?P<math>\$\$[^$\n]+\$\$|\$[^$\n]+\$)'
+)
+
+# 强调类 token 两侧标记的长度，其内部再切分链接、代码等 token
+_EMPHASIS_MARKS = {"bold": 2, "strike": 2, "italic": 1}
+# 嵌套 token 的标志位：格式叠加到外层格式上，而不是替换
+_NESTED = 0x100
+
+# 首行 "---" 之后在这么多行内找到结束行才作为 front matter
+FRONT_MATTER_MAX_LINES = 200
+
+_GROUP_TOKENS = {
+    "heading": TOKEN_HEADING, "hr": TOKEN_HR, "quote": TOKEN_QUOTE, "list": TOKEN_LIST,
+    "code": TOKEN_CODE, "image": TOKEN_IMAGE, "link": TOKEN_LINK, "bold": TOKEN_BOLD,
+    "strike": TOKEN_STRIKE, "italic": TOKEN_ITALIC, "math": TOKEN_MATH,
+}
+
+RECOLOR_CHUNK = 500
+
+
+def tokenize_line(text, previous_state, first_line=False):
+    """切分一行，返回 (本行结束时的块状态, [(start, length, token), ...])。
+
+    first_line 为真表示这是首行且其后有 front matter 的结束行，首行 "---" 才开启 front matter。
+    token 带 _NESTED 标志时表示嵌在强调内部。
+    """
+    if previous_state <= 0:
+        if not text:
+            return STATE_NORMAL, []
+        return _tokenize_normal(text, first_line)
+
+    kind = previous_state & _STATE_MASK
+    if kind == STATE_HTML_BLOCK and not text.strip():
+        return STATE_NORMAL, []
+
+    if kind == STATE_FENCE:
+        token = TOKEN_FENCE
+        fence = _FENCE_RE.match(text)
+        char = "~" if previous_state & _FENCE_TILDE else "`"
+        length = previous_state >> _FENCE_LEN_SHIFT
+        done = bool(fence) and fence.group(1)[0] == char and len(fence.group(1)) >= length \
+            and not text[fence.end():].strip()
+    elif kind == STATE_FRONT_MATTER:
+        token = TOKEN_FRONT_MATTER
+        done = text.rstrip() in ("---", "...")
+    elif kind == STATE_HTML_COMMENT:
+        token = TOKEN_HTML
+        done = "-->" in text
+    elif kind == STATE_HTML_BLOCK:
+        token = TOKEN_HTML
+        done = False
+    else:
+        token = TOKEN_MATH
+        done = "$$" in text
+
+    state = STATE_NORMAL if done else previous_state
+    return state, ([(0, len(text), token)] if text else [])
+
+
+def _tokenize_normal(text, first_line):
+    if first_line and text.rstrip() == "---":
+        return STATE_FRONT_MATTER, [(0, len(text), TOKEN_FRONT_MATTER)]
+
+    head = text.lstrip()[:1]
+    if head in "`~<$":
+        state, token = _block_opener(text)
+        if token is not None:
+            return state, [(0, len(text), token)]
+
+    tokens = []
+    line = _LINE_RE.match(text)
+    if line:
+        tokens.append((0, line.end(), _GROUP_TOKENS[line.lastgroup]))
+        if line.lastgroup == "hr":
+            return STATE_NORMAL, tokens
+    _inline_tokens(text, tokens, 0, len(text), 0)
+    return STATE_NORMAL, tokens
+
+
+def _inline_tokens(text, tokens, pos, endpos, flag):
+    """切出 text[pos:endpos] 中的行内 token；粗体、斜体、删除线内部继续切分"""
+    for match in _INLINE_RE.finditer(text, pos, endpos):
+        start, group = match.start(), match.lastgroup
+        tokens.append((start, match.end() - start, _GROUP_TOKENS[group] | flag))
+        mark = _EMPHASIS_MARKS.get(group)
+        if mark:
+            _inline_tokens(text, tokens, start + mark, match.end() - mark, _NESTED)
+
+
+def _block_opener(text):
+    """行首是否开启围栏代码 / HTML 块 / 公式块，返回 (状态, token)；不是时 token 为 None"""
+    fence = _FENCE_RE.match(text)
+    if fence:
+        marker = fence.group(1)
+        # 反引号围栏的信息串里不能再出现反引号
+        if marker[0] == "~" or "`" not in text[fence.end():]:
+            state = STATE_FENCE | (len(marker) << _FENCE_LEN_SHIFT)
+            if marker[0] == "~":
+                state |= _FENCE_TILDE
+            return state, TOKEN_FENCE
+
+    stripped = text.lstrip()
+    if stripped.startswith("<!--"):
+        return (STATE_NORMAL if "-->" in stripped else STATE_HTML_COMMENT), TOKEN_HTML
+    if _HTML_BLOCK_RE.match(text):
+        return STATE_HTML_BLOCK, TOKEN_HTML
+    if stripped.startswith("$$") and stripped.count("$$") == 1:
+        return STATE_MATH, TOKEN_MATH
+    return STATE_NORMAL, None
+
+
+class _LineTokens(QTextBlockUserData):
+    """某一行的切分结果，行文本和上一行状态不变时直接复用"""
+
+    def __init__(self, text, previous_state, state, tokens):
+        super().__init__()
+        self.text = text
+        self.previous_state = previous_state
+        self.state = state
+        self.tokens = tokens
 
 
 class MarkdownHighlighter(QSyntaxHighlighter):
@@ -12,116 +176,177 @@ class MarkdownHighlighter(QSyntaxHighlighter):
     def __init__(self, document, is_dark=False):
         super().__init__(document)
         self._is_dark = is_dark
-        self._build_rules()
+        self._build_formats()
+        self._recolor_block = None
+        self._recolor_remaining = 0
+        self._recolor_timer = QTimer(self)
+        self._recolor_timer.setSingleShot(True)
+        self._recolor_timer.timeout.connect(self._recolor_step)
+        document.contentsChange.connect(self._on_contents_change)
 
-    def set_dark_mode(self, is_dark):
+    def set_dark_mode(self, is_dark, first_block=0):
+        """切换主题：只换格式表，从 first_block（通常是首个可见块）开始分批重新着色"""
+        if is_dark == self._is_dark:
+            return
         self._is_dark = is_dark
-        self._build_rules()
-        self.rehighlight()
+        self._build_formats()
+
+        document = self.document()
+        if document is None:
+            return
+        block = document.findBlockByNumber(first_block)
+        self._recolor_block = block if block.isValid() else document.begin()
+        self._recolor_remaining = document.blockCount()
+        self._recolor_step()
+
+    def _recolor_step(self):
+        document = self.document()
+        if document is None:
+            return
+        block = self._recolor_block
+        for _ in range(RECOLOR_CHUNK):
+            if self._recolor_remaining <= 0:
+                break
+            if not block.isValid():
+                block = document.begin()
+            self.rehighlightBlock(block)
+            block = block.next()
+            self._recolor_remaining -= 1
+        self._recolor_block = block
+        if self._recolor_remaining > 0:
+            self._recolor_timer.start(0)
+
+    def _front_matter_closed(self):
+        """首行为 "---" 且其后 FRONT_MATTER_MAX_LINES 行内有 "---" 或 "..." 结束行"""
+        first = self.document().begin()
+        if first.text().rstrip() != "---":
+            return False
+        block = first.next()
+        for _ in range(FRONT_MATTER_MAX_LINES):
+            if not block.isValid():
+                return False
+            if block.text().rstrip() in ("---", "..."):
+                return True
+            block = block.next()
+        return False
+
+    def _on_contents_change(self, position, chars_removed, chars_added):
+        """front matter 的结束行增删时首行的状态随之改变，但 QSyntaxHighlighter 只向后重排"""
+        document = self.document()
+        if document.findBlock(position).blockNumber() > FRONT_MATTER_MAX_LINES:
+            return
+        first = document.begin()
+        was_open = first.userState() >= 0 and first.userState() & _STATE_MASK == STATE_FRONT_MATTER
+        if was_open != self._front_matter_closed():
+            QTimer.singleShot(0, lambda: self.rehighlightBlock(self.document().begin()))
 
     def _color(self, light_hex, dark_hex):
         return QColor(dark_hex if self._is_dark else light_hex)
 
-    def _build_rules(self):
-        self._rules = []
+    def _build_formats(self):
+        formats = [None] * 14
+        mono = "Consolas, 'SF Mono', Menlo, monospace"
 
         # --- 标题 ---
-        heading_format = QTextCharFormat()
-        heading_format.setForeground(self._color("#0550ae", "#79c0ff"))
-        heading_format.setFontWeight(QFont.Bold)
-        self._rules.append((re.compile(r'^#{1,6}\s+.+', re.MULTILINE), heading_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#0550ae", "#79c0ff"))
+        fmt.setFontWeight(QFont.Bold)
+        formats[TOKEN_HEADING] = fmt
 
         # --- 粗体 ---
-        bold_format = QTextCharFormat()
-        bold_format.setFontWeight(QFont.Bold)
-        bold_format.setForeground(self._color("#24292f", "#e6edf3"))
-        self._rules.append((re.compile(r'\*\*[^*]+\*\*'), bold_format))
-        self._rules.append((re.compile(r'__[^_]+__'), bold_format))
+        fmt = QTextCharFormat()
+        fmt.setFontWeight(QFont.Bold)
+        fmt.setForeground(self._color("#24292f", "#e6edf3"))
+        formats[TOKEN_BOLD] = fmt
 
         # --- 斜体 ---
-        italic_format = QTextCharFormat()
-        italic_format.setFontItalic(True)
-        italic_format.setForeground(self._color("#24292f", "#e6edf3"))
-        self._rules.append((re.compile(r'(?<!\*)\*(?!\*)[^*]+\*(?!\*)'), italic_format))
-        self._rules.append((re.compile(r'(?<!_)_(?!_)[^_]+_(?!_)'), italic_format))
+        fmt = QTextCharFormat()
+        fmt.setFontItalic(True)
+        fmt.setForeground(self._color("#24292f", "#e6edf3"))
+        formats[TOKEN_ITALIC] = fmt
 
         # --- 行内代码 ---
-        code_format = QTextCharFormat()
-        code_format.setForeground(self._color("#cf222e", "#ff7b72"))
-        code_format.setFontFamily("Consolas, 'SF Mono', Menlo, monospace")
-        self._rules.append((re.compile(r'`[^`\n]+`'), code_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#cf222e", "#ff7b72"))
+        fmt.setFontFamily(mono)
+        formats[TOKEN_CODE] = fmt
 
         # --- 链接 ---
-        link_format = QTextCharFormat()
-        link_format.setForeground(self._color("#0969da", "#58a6ff"))
-        self._rules.append((re.compile(r'\[([^\]]+)\]\([^)]+\)'), link_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#0969da", "#58a6ff"))
+        formats[TOKEN_LINK] = fmt
 
         # --- 图片 ---
-        image_format = QTextCharFormat()
-        image_format.setForeground(self._color("#8250df", "#d2a8ff"))
-        self._rules.append((re.compile(r'!\[([^\]]*)\]\([^)]+\)'), image_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#8250df", "#d2a8ff"))
+        formats[TOKEN_IMAGE] = fmt
 
         # --- 引用 ---
-        quote_format = QTextCharFormat()
-        quote_format.setForeground(self._color("#57606a", "#8b949e"))
-        quote_format.setFontItalic(True)
-        self._rules.append((re.compile(r'^>\s+.+', re.MULTILINE), quote_format))
-
-        # --- 无序列表标记 ---
-        list_format = QTextCharFormat()
-        list_format.setForeground(self._color("#cf222e", "#ff7b72"))
-        list_format.setFontWeight(QFont.Bold)
-        self._rules.append((re.compile(r'^\s*[-*+]\s', re.MULTILINE), list_format))
-
-        # --- 有序列表标记 ---
-        ordered_format = QTextCharFormat()
-        ordered_format.setForeground(self._color("#cf222e", "#ff7b72"))
-        ordered_format.setFontWeight(QFont.Bold)
-        self._rules.append((re.compile(r'^\s*\d+\.\s', re.MULTILINE), ordered_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#57606a", "#8b949e"))
+        fmt.setFontItalic(True)
+        formats[TOKEN_QUOTE] = fmt
+
+        # --- 列表标记 ---
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#cf222e", "#ff7b72"))
+        fmt.setFontWeight(QFont.Bold)
+        formats[TOKEN_LIST] = fmt
 
         # --- 分割线 ---
-        hr_format = QTextCharFormat()
-        hr_format.setForeground(self._color("#d0d7de", "#484f58"))
-        self._rules.append((re.compile(r'^(-{3,}|\*{3,}|_{3,})\s*$', re.MULTILINE), hr_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#d0d7de", "#484f58"))
+        formats[TOKEN_HR] = fmt
 
         # --- 删除线 ---
-        strike_format = QTextCharFormat()
-        strike_format.setForeground(self._color("#57606a", "#8b949e"))
-        strike_format.setFontStrikeOut(True)
-        self._rules.append((re.compile(r'~~[^~]+~~'), strike_format))
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#57606a", "#8b949e"))
+        fmt.setFontStrikeOut(True)
+        formats[TOKEN_STRIKE] = fmt
 
         # --- 代码块围栏 ---
-        fence_format = QTextCharFormat()
-        fence_format.setForeground(self._color("#6e7781", "#7d8590"))
-        fence_format.setFontFamily("Consolas, 'SF Mono', Menlo, monospace")
-        self._code_fence_format = fence_format
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#6e7781", "#7d8590"))
+        fmt.setFontFamily(mono)
+        formats[TOKEN_FENCE] = fmt
 
-    def highlightBlock(self, text):
-        # 处理代码块状态
-        previous_state = self.previousBlockState()
-        current_state = 0
+        # --- HTML 块 / 注释 ---
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#116329", "#7ee787"))
+        fmt.setFontFamily(mono)
+        formats[TOKEN_HTML] = fmt
 
-        if previous_state == 1:
-            # 在代码块内部
-            if re.match(r'^```', text):
-                self.setFormat(0, len(text), self._code_fence_format)
-                current_state = 0
-            else:
-                self.setFormat(0, len(text), self._code_fence_format)
-                current_state = 1
-            self.setCurrentBlockState(current_state)
-            return
+        # --- 公式 ---
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#953800", "#ffa657"))
+        fmt.setFontFamily(mono)
+        formats[TOKEN_MATH] = fmt
 
-        if re.match(r'^```', text):
-            self.setFormat(0, len(text), self._code_fence_format)
-            self.setCurrentBlockState(1)
-            return
+        # --- front matter ---
+        fmt = QTextCharFormat()
+        fmt.setForeground(self._color("#6e7781", "#7d8590"))
+        formats[TOKEN_FRONT_MATTER] = fmt
+
+        self._formats = formats
 
-        self.setCurrentBlockState(0)
+    def highlightBlock(self, text):
+        previous_state = self.previousBlockState()
+        data = self.currentBlockUserData()
+        # 只有首行的上一行状态为 -1；首行是否开启 front matter 取决于后面的行，不用缓存
+        first_line = previous_state == -1 and not self.currentBlock().previous().isValid()
+        if not first_line and isinstance(data, _LineTokens) \
+                and data.previous_state == previous_state and data.text == text:
+            state, tokens = data.state, data.tokens
+        else:
+            state, tokens = tokenize_line(text, previous_state, first_line and self._front_matter_closed())
+            self.setCurrentBlockUserData(_LineTokens(text, previous_state, state, tokens))
 
-        # 应用单行规则
-        for pattern, fmt in self._rules:
-            for match in pattern.finditer(text):
-                start = match.start()
-                length = match.end() - start
+        self.setCurrentBlockState(state)
+        formats = self._formats
+        for start, length, token in tokens:
+            if token & _NESTED:
+                fmt = QTextCharFormat(self.format(start))
+                fmt.merge(formats[token & ~_NESTED])
                 self.setFormat(start, length, fmt)
+            else:
+                self.setFormat(start, length, formats[token])